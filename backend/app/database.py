@@ -1,5 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, BigInteger, Integer
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 import os
 from dotenv import load_dotenv
@@ -26,6 +27,10 @@ if DEMO_MODE:
         connect_args={"check_same_thread": False},
         echo=False
     )
+    async_engine = create_async_engine(
+        "sqlite+aiosqlite:///./wms_demo.db",
+        echo=False
+    )
 elif not all([SAP_DB_NAME, SAP_DB_USER, SAP_DB_PASSWORD]):
     logger.critical("CRITICAL ERROR: SQL Server database configuration is incomplete. Please check environment variables.")
     raise ValueError("SQL Server database configuration is incomplete. Please check environment variables.")
@@ -60,8 +65,21 @@ else:
         pool_recycle=300,
         echo=False
     )
+    async_engine = create_async_engine(
+        connection_string.replace("mssql+pyodbc", "mssql+aioodbc", 1),
+        fast_executemany=True,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        echo=False
+    )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
 
 def get_db():
     """Dependency to get database session"""
@@ -71,8 +89,17 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Dependency to get async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 Base = declarative_base()
 
+# SQLite only autoincrements INTEGER PRIMARY KEY columns, so BIGINT ids
+# are declared as INTEGER there (DEMO_MODE) and BIGINT everywhere else.
+BigIntegerPK = BigInteger().with_variant(Integer, "sqlite")
+
 def test_connection():
     """Test database connection"""
     try:
@@ -83,3 +110,14 @@ def test_connection():
     except Exception as e:
         logger.error(f"Database connection failed: {e}")
         return False
+
+async def test_async_connection():
+    """Test database connection without blocking the event loop"""
+    try:
+        from sqlalchemy import text
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+            return True
+    except Exception as e:
+        logger.error(f"Database connection failed: {e}")
+        return False
@@ -1,9 +1,20 @@
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.wms.routers import (
-    locations, bins, stock, movements, counts, labels, packing_bridge
+    locations, bins, stock, movements, counts, labels, packing_bridge, sap, audit
 )
-from app.database import engine, Base, test_connection
+from app.database import engine, async_engine, Base, test_connection, test_async_connection
+from app.wms.services.sap_outbox import sap_outbox_dispatcher, SAP_OUTBOX_ENABLED
+from app.wms.services.sap_client import sap_http_pool, sap_circuit_breaker, sap_bulkhead
+from app.wms.services.audit import audit_sink, AUDIT_WRITE_MODE, WRITE_MODE_ASYNC
+from app.wms.services.audit_chain import AUDIT_CHAIN_ENABLED
+from app.wms.services.audit_archive import audit_retention_job, AUDIT_RETENTION_DAYS
+from app.wms.services.idempotency import idempotency_purge_job
+from app.wms.services.label_render import label_render_pool
+from app.wms.services.label_cache import label_cache
+from app.wms.services.printing import printer_backend
+from app.wms.services.print_queue import print_job_dispatcher
+from app.wms.services.label_templates import label_templates
 import logging
 import time
 import os
@@ -69,6 +80,8 @@ app.include_router(movements.router, prefix="/api/v1/wms", tags=["movements"])
 app.include_router(counts.router, prefix="/api/v1/wms", tags=["counts"])
 app.include_router(labels.router, prefix="/api/v1/wms", tags=["labels"])
 app.include_router(packing_bridge.router, prefix="/api/v1/wms", tags=["packing-bridge"])
+app.include_router(sap.router, prefix="/api/v1/wms", tags=["sap"])
+app.include_router(audit.router, prefix="/api/v1/wms", tags=["audit"])
 
 @app.on_event("startup")
 async def startup():
@@ -84,6 +97,37 @@ async def startup():
     
     sap_di_url = os.getenv("SAP_DI_BASE_URL", "http://localhost:8001")
     logger.info(f"SAP DI Service URL: {sap_di_url}")
+    await sap_http_pool.get_session()
+    
+    if SAP_OUTBOX_ENABLED:
+        await sap_outbox_dispatcher.start()
+    
+    await idempotency_purge_job.start()
+    
+    # The sink also seals the audit hash chain, in either write mode.
+    if AUDIT_WRITE_MODE == WRITE_MODE_ASYNC or AUDIT_CHAIN_ENABLED:
+        await audit_sink.start()
+    
+    if AUDIT_RETENTION_DAYS > 0:
+        await audit_retention_job.start()
+    
+    await label_render_pool.start()
+    
+    if printer_backend.queue_jobs:
+        await print_job_dispatcher.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop the SAP outbox and print job dispatchers, drain the audit sink and release pooled connections"""
+    await sap_outbox_dispatcher.stop()
+    await print_job_dispatcher.stop()
+    await idempotency_purge_job.stop()
+    await label_render_pool.stop()
+    await printer_backend.close()
+    await audit_retention_job.stop()
+    await audit_sink.stop()
+    await sap_http_pool.close()
+    await async_engine.dispose()
 
 @app.get("/")
 async def root():
@@ -97,10 +141,26 @@ async def root():
 async def health_check():
     """Health check endpoint"""
     try:
-        db_status = test_connection()
+        db_status = await test_async_connection()
+        sap_circuit = sap_circuit_breaker.snapshot()
         return {
-            "status": "healthy",
+            "status": "healthy" if sap_circuit["state"] == "CLOSED" else "degraded",
             "database": "connected" if db_status else "disconnected",
+            "sap": {
+                "circuit": sap_circuit,
+                "bulkhead": sap_bulkhead.snapshot(),
+                "outbox": {"running": sap_outbox_dispatcher.running, **sap_outbox_dispatcher.stats}
+            },
+            "idempotency": {"purge": {"running": idempotency_purge_job.running, **idempotency_purge_job.stats}},
+            "audit": {
+                "mode": AUDIT_WRITE_MODE,
+                "running": audit_sink.running,
+                "pending": audit_sink.pending,
+                **audit_sink.stats,
+                "chain": audit_sink.sealer.stats if audit_sink.sealer else None,
+                "retention": {"running": audit_retention_job.running, **audit_retention_job.stats}
+            },
+            "labels": {"render": label_render_pool.snapshot(), "cache": label_cache.snapshot(), "printer": printer_backend.snapshot(), "queue": print_job_dispatcher.snapshot(), "templates": label_templates.snapshot()},
             "service": "wms-api"
         }
     except Exception as e:
@@ -110,3 +170,8 @@ async def health_check():
             "error": str(e),
             "service": "wms-api"
         }
+
+@app.get("/metrics/sap")
+async def sap_metrics():
+    """SAP DI connection pool settings and per-endpoint latency histograms"""
+    return sap_http_pool.metrics()
@@ -0,0 +1,36 @@
+"""Create idempotency key table
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('idempotency_key',
+        sa.Column('id', sa.BigInteger(), nullable=False, autoincrement=True),
+        sa.Column('endpoint', sa.String(length=64), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=64), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False, default='IN_PROGRESS'),
+        sa.Column('response', sa.Text(), nullable=True),
+        sa.Column('created_by', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('SYSUTCDATETIME()')),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('endpoint', 'idempotency_key', name='uq_idempotency_endpoint_key'),
+        schema='wms'
+    )
+    
+    op.create_index('ix_idempotency_key_created_at', 'idempotency_key', ['created_at'], schema='wms')
+
+def downgrade() -> None:
+    op.drop_index('ix_idempotency_key_created_at', table_name='idempotency_key', schema='wms')
+    op.drop_table('idempotency_key', schema='wms')
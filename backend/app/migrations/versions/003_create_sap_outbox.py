@@ -0,0 +1,48 @@
+"""Create SAP outbox table
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('sap_outbox',
+        sa.Column('id', sa.BigInteger(), nullable=False, autoincrement=True),
+        sa.Column('doc_type', sa.String(length=24), nullable=False),
+        sa.Column('whs_code', sa.String(length=8), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=64), nullable=False),
+        sa.Column('movement_key', sa.String(length=64), nullable=True),
+        sa.Column('movement_type', sa.String(length=24), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False, default='PENDING'),
+        sa.Column('attempts', sa.Integer(), nullable=False, default=0),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False, server_default=sa.text('SYSUTCDATETIME()')),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('sap_doc_entry', sa.Integer(), nullable=True),
+        sa.Column('sap_doc_num', sa.Integer(), nullable=True),
+        sa.Column('created_by', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('SYSUTCDATETIME()')),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key'),
+        schema='wms'
+    )
+    
+    op.create_index('ix_sap_outbox_status_next_attempt', 'sap_outbox', ['status', 'next_attempt_at'], schema='wms')
+    op.create_index('ix_sap_outbox_movement_key', 'sap_outbox', ['movement_key'], schema='wms')
+    op.create_index('ix_movement_idempotency_key_type', 'movement', ['idempotency_key', 'type'], schema='wms')
+
+def downgrade() -> None:
+    op.drop_index('ix_movement_idempotency_key_type', table_name='movement', schema='wms')
+    op.drop_index('ix_sap_outbox_movement_key', table_name='sap_outbox', schema='wms')
+    op.drop_index('ix_sap_outbox_status_next_attempt', table_name='sap_outbox', schema='wms')
+    op.drop_table('sap_outbox', schema='wms')
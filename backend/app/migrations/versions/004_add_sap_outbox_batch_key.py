@@ -0,0 +1,22 @@
+"""Add batch key to SAP outbox for coalesced documents
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('sap_outbox', sa.Column('batch_key', sa.String(length=64), nullable=True), schema='wms')
+    op.create_index('ix_sap_outbox_batch_key', 'sap_outbox', ['batch_key'], schema='wms')
+
+def downgrade() -> None:
+    op.drop_index('ix_sap_outbox_batch_key', table_name='sap_outbox', schema='wms')
+    op.drop_column('sap_outbox', 'batch_key', schema='wms')
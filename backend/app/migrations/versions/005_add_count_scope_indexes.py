@@ -0,0 +1,22 @@
+"""Add indexes for set-based count session creation
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_index('ix_location_whs_code', 'location', ['whs_code', 'code'], schema='wms')
+    op.create_index('ix_count_detail_session_location', 'count_detail', ['session_id', 'location_id'], schema='wms')
+
+def downgrade() -> None:
+    op.drop_index('ix_count_detail_session_location', table_name='count_detail', schema='wms')
+    op.drop_index('ix_location_whs_code', table_name='location', schema='wms')
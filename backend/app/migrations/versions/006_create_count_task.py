@@ -0,0 +1,46 @@
+"""Create count tasks for partitioned multi-operator counting
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('count_task',
+        sa.Column('id', sa.BigInteger(), nullable=False, autoincrement=True),
+        sa.Column('session_id', sa.BigInteger(), nullable=False),
+        sa.Column('section', sa.String(length=32), nullable=True),
+        sa.Column('aisle', sa.String(length=32), nullable=True),
+        sa.Column('rack', sa.String(length=32), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False, default='OPEN'),
+        sa.Column('assigned_to', sa.String(length=64), nullable=True),
+        sa.Column('total_lines', sa.Integer(), nullable=False, default=0),
+        sa.Column('counted_lines', sa.Integer(), nullable=False, default=0),
+        sa.Column('variance_lines', sa.Integer(), nullable=False, default=0),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['session_id'], ['wms.count_session.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        schema='wms'
+    )
+    op.create_index('ix_count_task_session', 'count_task', ['session_id'], schema='wms')
+    
+    op.add_column('count_detail', sa.Column('task_id', sa.BigInteger(), nullable=True), schema='wms')
+    op.create_foreign_key('fk_count_detail_task', 'count_detail', 'count_task', ['task_id'], ['id'],
+                          source_schema='wms', referent_schema='wms')
+    op.create_index('ix_count_detail_task', 'count_detail', ['task_id'], schema='wms')
+
+def downgrade() -> None:
+    op.drop_index('ix_count_detail_task', table_name='count_detail', schema='wms')
+    op.drop_constraint('fk_count_detail_task', 'count_detail', schema='wms', type_='foreignkey')
+    op.drop_column('count_detail', 'task_id', schema='wms')
+    op.drop_index('ix_count_task_session', table_name='count_task', schema='wms')
+    op.drop_table('count_task', schema='wms')
@@ -0,0 +1,22 @@
+"""Add movement high-water marks to count sessions and details
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('count_session', sa.Column('movement_hwm', sa.BigInteger(), nullable=True), schema='wms')
+    op.add_column('count_detail', sa.Column('movement_hwm', sa.BigInteger(), nullable=True), schema='wms')
+
+def downgrade() -> None:
+    op.drop_column('count_detail', 'movement_hwm', schema='wms')
+    op.drop_column('count_session', 'movement_hwm', schema='wms')
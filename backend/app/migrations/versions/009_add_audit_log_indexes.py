@@ -0,0 +1,23 @@
+"""Add keyset indexes to the audit log
+
+Revision ID: 009
+Revises: 007
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+
+revision = '009'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_index('ix_audit_log_ts', 'audit_log', ['ts', 'id'], schema='wms')
+    op.create_index('ix_audit_log_user_ts', 'audit_log', ['user_name', 'ts', 'id'], schema='wms')
+    op.create_index('ix_audit_log_action_ts', 'audit_log', ['action', 'ts', 'id'], schema='wms')
+
+def downgrade() -> None:
+    op.drop_index('ix_audit_log_action_ts', table_name='audit_log', schema='wms')
+    op.drop_index('ix_audit_log_user_ts', table_name='audit_log', schema='wms')
+    op.drop_index('ix_audit_log_ts', table_name='audit_log', schema='wms')
@@ -0,0 +1,35 @@
+"""Add payload and chain hashes to the audit log
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('audit_log', sa.Column('payload_hash', sa.String(length=64), nullable=True), schema='wms')
+    op.add_column('audit_log', sa.Column('chain_hash', sa.String(length=64), nullable=True), schema='wms')
+    
+    op.create_table('audit_checkpoint',
+        sa.Column('id', sa.BigInteger(), nullable=False, autoincrement=True),
+        sa.Column('last_id', sa.BigInteger(), nullable=False),
+        sa.Column('chain_hash', sa.String(length=64), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('SYSUTCDATETIME()')),
+        sa.Column('verified_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('last_id'),
+        schema='wms'
+    )
+
+def downgrade() -> None:
+    op.drop_table('audit_checkpoint', schema='wms')
+    op.drop_column('audit_log', 'chain_hash', schema='wms')
+    op.drop_column('audit_log', 'payload_hash', schema='wms')
@@ -0,0 +1,20 @@
+"""Mark audit checkpoints moved to the archive
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.add_column('audit_checkpoint', sa.Column('archived_at', sa.DateTime(), nullable=True), schema='wms')
+
+def downgrade() -> None:
+    op.drop_column('audit_checkpoint', 'archived_at', schema='wms')
@@ -0,0 +1,42 @@
+"""Create print job queue table
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('print_job',
+        sa.Column('id', sa.BigInteger(), nullable=False, autoincrement=True),
+        sa.Column('printer', sa.String(length=100), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('format', sa.String(length=8), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('labels', sa.Integer(), nullable=False, default=1),
+        sa.Column('location_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False, default='PENDING'),
+        sa.Column('attempts', sa.Integer(), nullable=False, default=0),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False, server_default=sa.text('SYSUTCDATETIME()')),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('printer_job_id', sa.String(length=64), nullable=True),
+        sa.Column('created_by', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('SYSUTCDATETIME()')),
+        sa.Column('printed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        schema='wms'
+    )
+    
+    op.create_index('ix_print_job_status_next_attempt', 'print_job', ['status', 'next_attempt_at'], schema='wms')
+
+def downgrade() -> None:
+    op.drop_index('ix_print_job_status_next_attempt', table_name='print_job', schema='wms')
+    op.drop_table('print_job', schema='wms')
@@ -0,0 +1,36 @@
+"""Create label template table
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-21 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table('label_template',
+        sa.Column('id', sa.Integer(), nullable=False, autoincrement=True),
+        sa.Column('whs_code', sa.String(length=8), nullable=True),
+        sa.Column('label_type', sa.String(length=32), nullable=False, default='bin'),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('format', sa.String(length=8), nullable=False, default='zpl'),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False, default=1),
+        sa.Column('is_active', sa.Boolean(), nullable=False, default=True),
+        sa.Column('created_by', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text('SYSUTCDATETIME()')),
+        sa.PrimaryKeyConstraint('id'),
+        schema='wms'
+    )
+    
+    op.create_index('ix_label_template_lookup', 'label_template', ['label_type', 'whs_code', 'is_active'], schema='wms')
+
+def downgrade() -> None:
+    op.drop_index('ix_label_template_lookup', table_name='label_template', schema='wms')
+    op.drop_table('label_template', schema='wms')
@@ -2,8 +2,12 @@ from .warehouse import Warehouse
 from .location import Location
 from .stock_location import StockLocation
 from .movement import Movement
-from .count import CountSession, CountDetail
-from .audit import AuditLog
+from .count import CountSession, CountTask, CountDetail
+from .audit import AuditLog, AuditCheckpoint
+from .idempotency import IdempotencyRecord
+from .sap_outbox import SapOutbox
+from .print_job import PrintJob
+from .label_template import LabelTemplate
 
 __all__ = [
     "Warehouse",
@@ -11,6 +15,12 @@ __all__ = [
     "StockLocation",
     "Movement",
     "CountSession",
+    "CountTask",
     "CountDetail",
-    "AuditLog"
+    "AuditLog",
+    "AuditCheckpoint",
+    "IdempotencyRecord",
+    "SapOutbox",
+    "PrintJob",
+    "LabelTemplate"
 ]
@@ -1,12 +1,40 @@
-from sqlalchemy import Column, BigInteger, String, Integer, DateTime, Text
+from sqlalchemy import Column, BigInteger, String, Integer, DateTime, Text, Index
 from sqlalchemy.sql import func
-from app.database import Base
+from app.database import Base, BigIntegerPK
 
 class AuditLog(Base):
     __tablename__ = "wms_audit_log"
+    __table_args__ = (
+        # (ts, id) is the keyset the audit trail pages on, newest first.
+        Index("ix_audit_log_ts", "ts", "id"),
+        Index("ix_audit_log_user_ts", "user_name", "ts", "id"),
+        Index("ix_audit_log_action_ts", "action", "ts", "id"),
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     ts = Column(DateTime, nullable=False, default=func.now())
     user_name = Column(String(64), nullable=False)
     action = Column(String(64), nullable=False)
     payload = Column(Text, nullable=True)
+    # SHA-256 of the payload text, set by the writer.
+    payload_hash = Column(String(64), nullable=True)
+    # SHA-256 over the previous row's chain_hash and this row, set when the
+    # audit sink seals the row into the chain (NULL until then).
+    chain_hash = Column(String(64), nullable=True)
+
+class AuditCheckpoint(Base):
+    """Chain hash at a sealed row, every AUDIT_CHAIN_CHECKPOINT_ROWS rows.
+
+    The rows between two checkpoints form a segment that can be verified
+    on its own; verified_at marks segments already checked and
+    archived_at segments moved to the audit archive.
+    """
+    __tablename__ = "wms_audit_checkpoint"
+
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    last_id = Column(BigInteger, nullable=False, unique=True)
+    chain_hash = Column(String(64), nullable=False)
+    row_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    verified_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=True)
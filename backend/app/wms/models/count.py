@@ -1,31 +1,69 @@
-from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey, Numeric, DateTime, Boolean
+from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey, Numeric, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from app.database import Base
+from app.database import Base, BigIntegerPK
 
 class CountSession(Base):
     __tablename__ = "wms_count_session"
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     whs_code = Column(String(8), nullable=False)
     status = Column(String(16), nullable=False, default='OPEN')
     created_by = Column(String(64), nullable=False)
     created_at = Column(DateTime, nullable=False, default=func.now())
     closed_at = Column(DateTime, nullable=True)
+    # Highest wms_movement id reflected in the expected-quantity snapshot.
+    movement_hwm = Column(BigInteger, nullable=True)
 
     details = relationship("CountDetail", back_populates="session")
+    tasks = relationship("CountTask", back_populates="session")
+
+class CountTask(Base):
+    """One assignable slice of a count session (an aisle or a rack).
+
+    total/counted/variance counters are kept up to date as counts are
+    entered, so progress is read from these rows rather than by scanning
+    the session's details.
+    """
+    __tablename__ = "wms_count_task"
+    __table_args__ = (
+        Index("ix_count_task_session", "session_id"),
+    )
+
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    session_id = Column(BigInteger, ForeignKey("wms_count_session.id"), nullable=False)
+    section = Column(String(32), nullable=True)
+    aisle = Column(String(32), nullable=True)
+    rack = Column(String(32), nullable=True)
+    status = Column(String(16), nullable=False, default='OPEN')
+    assigned_to = Column(String(64), nullable=True)
+    total_lines = Column(Integer, nullable=False, default=0)
+    counted_lines = Column(Integer, nullable=False, default=0)
+    variance_lines = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    session = relationship("CountSession", back_populates="tasks")
 
 class CountDetail(Base):
     __tablename__ = "wms_count_detail"
+    __table_args__ = (
+        Index("ix_count_detail_session_location", "session_id", "location_id"),
+        Index("ix_count_detail_task", "task_id"),
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     session_id = Column(BigInteger, ForeignKey("wms_count_session.id"), nullable=False)
+    task_id = Column(BigInteger, ForeignKey("wms_count_task.id"), nullable=True)
     location_id = Column(Integer, ForeignKey("wms_location.id"), nullable=False)
     item_code = Column(String(50), nullable=False)
     lot_no = Column(String(100), nullable=True)
     expected_qty = Column(Numeric(18, 3), nullable=False)
     counted_qty = Column(Numeric(18, 3), nullable=True)
+    # Highest wms_movement id included in expected_qty; rolled forward when counted.
+    movement_hwm = Column(BigInteger, nullable=True)
     adjusted = Column(Boolean, nullable=False, default=False)
 
     session = relationship("CountSession", back_populates="details")
+    task = relationship("CountTask")
     location = relationship("Location")
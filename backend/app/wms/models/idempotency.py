@@ -0,0 +1,19 @@
+from sqlalchemy import Column, String, DateTime, Text, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base, BigIntegerPK
+
+class IdempotencyRecord(Base):
+    __tablename__ = "wms_idempotency_key"
+    __table_args__ = (
+        UniqueConstraint("endpoint", "idempotency_key", name="uq_idempotency_endpoint_key"),
+    )
+
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    endpoint = Column(String(64), nullable=False)
+    idempotency_key = Column(String(64), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False, default='IN_PROGRESS')
+    response = Column(Text, nullable=True)
+    created_by = Column(String(64), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    completed_at = Column(DateTime, nullable=True)
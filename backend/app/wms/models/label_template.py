@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, Text, Index
+from sqlalchemy.sql import func
+from app.database import Base
+
+class LabelTemplate(Base):
+    __tablename__ = "wms_label_template"
+    __table_args__ = (
+        Index("ix_label_template_lookup", "label_type", "whs_code", "is_active"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    whs_code = Column(String(8), nullable=True)
+    label_type = Column(String(32), nullable=False, default='bin')
+    name = Column(String(100), nullable=False)
+    format = Column(String(8), nullable=False, default='zpl')
+    body = Column(Text, nullable=False)
+    version = Column(Integer, nullable=False, default=1)
+    is_active = Column(Boolean, nullable=False, default=True)
+    created_by = Column(String(64), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now())
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, Numeric
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, Numeric, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
 class Location(Base):
     __tablename__ = "wms_location"
+    __table_args__ = (
+        Index("ix_location_hierarchy", "whs_code", "section", "aisle", "rack", "level", "bin"),
+        Index("ix_location_whs_code", "whs_code", "code"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     whs_code = Column(String(8), ForeignKey("wms_warehouse.whs_code"), nullable=False)
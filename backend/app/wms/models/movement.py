@@ -1,12 +1,16 @@
-from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey, Numeric, DateTime
+from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey, Numeric, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from app.database import Base
+from app.database import Base, BigIntegerPK
 
 class Movement(Base):
     __tablename__ = "wms_movement"
+    __table_args__ = (
+        Index("ix_movement_idempotency_key_type", "idempotency_key", "type"),
+        Index("ix_movement_created_at", "created_at"),
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     type = Column(String(24), nullable=False)
     whs_code_from = Column(String(8), nullable=True)
     location_id_from = Column(Integer, ForeignKey("wms_location.id"), nullable=True)
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index
+from sqlalchemy.sql import func
+from app.database import Base, BigIntegerPK
+
+class PrintJob(Base):
+    __tablename__ = "wms_print_job"
+    __table_args__ = (
+        Index("ix_print_job_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    printer = Column(String(100), nullable=False)
+    title = Column(String(200), nullable=False)
+    format = Column(String(8), nullable=False)
+    content = Column(Text, nullable=False)
+    labels = Column(Integer, nullable=False, default=1)
+    location_id = Column(Integer, nullable=True)
+    status = Column(String(16), nullable=False, default='PENDING')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=func.now())
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    printer_job_id = Column(String(64), nullable=True)
+    created_by = Column(String(64), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    printed_at = Column(DateTime, nullable=True)
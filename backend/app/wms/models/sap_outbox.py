@@ -0,0 +1,30 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index
+from sqlalchemy.sql import func
+from app.database import Base, BigIntegerPK
+
+class SapOutbox(Base):
+    __tablename__ = "wms_sap_outbox"
+    __table_args__ = (
+        Index("ix_sap_outbox_status_next_attempt", "status", "next_attempt_at"),
+        Index("ix_sap_outbox_movement_key", "movement_key"),
+        Index("ix_sap_outbox_batch_key", "batch_key"),
+    )
+
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
+    doc_type = Column(String(24), nullable=False)
+    whs_code = Column(String(8), nullable=False)
+    payload = Column(Text, nullable=False)
+    idempotency_key = Column(String(64), nullable=False, unique=True)
+    movement_key = Column(String(64), nullable=True)
+    movement_type = Column(String(24), nullable=True)
+    batch_key = Column(String(64), nullable=True)
+    status = Column(String(16), nullable=False, default='PENDING')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=func.now())
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    sap_doc_entry = Column(Integer, nullable=True)
+    sap_doc_num = Column(Integer, nullable=True)
+    created_by = Column(String(64), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=func.now())
+    sent_at = Column(DateTime, nullable=True)
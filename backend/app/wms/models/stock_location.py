@@ -1,12 +1,16 @@
-from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey, Numeric, DateTime
+from sqlalchemy import Column, BigInteger, String, Integer, ForeignKey, Numeric, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from app.database import Base
+from app.database import Base, BigIntegerPK
 
 class StockLocation(Base):
     __tablename__ = "wms_stock_location"
+    __table_args__ = (
+        Index("ix_stock_location_item_whs", "item_code", "whs_code"),
+        Index("ix_stock_location_location", "location_id"),
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, autoincrement=True)
     whs_code = Column(String(8), nullable=False)
     location_id = Column(Integer, ForeignKey("wms_location.id"), nullable=False)
     item_code = Column(String(50), nullable=False)
@@ -17,3 +21,14 @@ class StockLocation(Base):
     last_updated = Column(DateTime, nullable=False, default=func.now())
 
     location = relationship("Location", back_populates="stock_locations")
+
+# Conflict target for the ledger's INSERT ... ON CONFLICT upserts. SQL Server
+# cannot index an expression, so there the ledger uses MERGE instead.
+Index(
+    "uq_stock_location_key",
+    StockLocation.whs_code,
+    StockLocation.location_id,
+    StockLocation.item_code,
+    func.coalesce(StockLocation.lot_no, ""),
+    unique=True
+).ddl_if(dialect="sqlite")
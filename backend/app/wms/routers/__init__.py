@@ -5,6 +5,8 @@ from .movements import router as movements_router
 from .counts import router as counts_router
 from .labels import router as labels_router
 from .packing_bridge import router as packing_bridge_router
+from .sap import router as sap_router
+from .audit import router as audit_router
 
 __all__ = [
     "locations_router",
@@ -13,5 +15,7 @@ __all__ = [
     "movements_router",
     "counts_router",
     "labels_router",
-    "packing_bridge_router"
+    "packing_bridge_router",
+    "sap_router",
+    "audit_router"
 ]
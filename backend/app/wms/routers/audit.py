@@ -0,0 +1,64 @@
+from typing import Optional
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app.wms.deps import require_role, UserRole
+from app.wms.services.audit import WMSAuditService, PAYLOAD_NONE
+from app.wms.services.audit_chain import verify_chain, AUDIT_VERIFY_WORKERS
+
+router = APIRouter()
+
+@router.get("/audit")
+async def get_audit_trail(
+    user: Optional[str] = None,
+    action: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    payload: str = PAYLOAD_NONE,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.AUDITOR))
+):
+    """Page through the audit trail, newest first; pass next_cursor to continue"""
+    service = WMSAuditService(db)
+    try:
+        page = await service.get_audit_trail(
+            user_name=user,
+            action=action,
+            since=since,
+            until=until,
+            cursor=cursor,
+            limit=limit,
+            payload=payload
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"ok": True, "data": page["records"], "next_cursor": page["next_cursor"]}
+
+@router.post("/audit/verify")
+async def verify_audit_chain(
+    full: bool = False,
+    workers: int = AUDIT_VERIFY_WORKERS,
+    current_user: dict = Depends(require_role(UserRole.AUDITOR))
+):
+    """Verify the audit hash chain; resumes after already verified checkpoints unless full.
+    workers is capped at AUDIT_VERIFY_WORKERS"""
+    result = await verify_chain(workers=min(max(1, workers), AUDIT_VERIFY_WORKERS), full=full)
+    return {"ok": True, "data": result}
+
+@router.get("/audit/{audit_id}")
+async def get_audit_entry(
+    audit_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.AUDITOR))
+):
+    """Get one audit record with its decoded payload"""
+    service = WMSAuditService(db)
+    record = await service.get_audit_entry(audit_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Audit record not found")
+    
+    return {"ok": True, "data": record}
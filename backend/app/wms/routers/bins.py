@@ -1,9 +1,10 @@
 from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.wms.deps import require_role, UserRole
-from app.wms.models import Location
+from app.wms.models import Location, StockLocation
 from app.wms.schemas.locations import LocationResponse
 
 router = APIRouter()
@@ -14,47 +15,45 @@ async def search_bins(
     whs: Optional[str] = None,
     type: Optional[str] = None,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Search bins by code or name"""
-    query = db.query(Location).filter(Location.is_active == True)
+    query = select(Location).where(Location.is_active == True)
     
     if whs:
-        query = query.filter(Location.whs_code == whs)
+        query = query.where(Location.whs_code == whs)
     
     if type:
-        query = query.filter(Location.type == type)
+        query = query.where(Location.type == type)
     
-    query = query.filter(
+    query = query.where(
         (Location.code.like(f"%{q}%")) | 
         (Location.name.like(f"%{q}%"))
     ).limit(limit)
     
-    return query.all()
+    return (await db.scalars(query)).all()
 
 @router.get("/bins/{bin_id}/capacity")
 async def get_bin_capacity(
     bin_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Get bin capacity information"""
-    location = db.query(Location).filter(Location.id == bin_id).first()
+    location = await db.scalar(select(Location).where(Location.id == bin_id))
     if not location:
         raise HTTPException(status_code=404, detail="Bin not found")
     
-    from sqlalchemy import text, func
+    current_stock_query = (
+        select(
+            func.coalesce(func.sum(StockLocation.qty), 0).label("total_qty"),
+            func.count().label("item_count")
+        )
+        .where(StockLocation.location_id == bin_id, StockLocation.qty > 0)
+    )
     
-    current_stock_query = text("""
-        SELECT 
-            COALESCE(SUM(qty), 0) as total_qty,
-            COUNT(*) as item_count
-        FROM wms.stock_location 
-        WHERE location_id = :location_id AND qty > 0
-    """)
-    
-    result = db.execute(current_stock_query, {"location_id": bin_id}).fetchone()
+    result = (await db.execute(current_stock_query)).fetchone()
     
     return {
         "ok": True,
@@ -1,21 +1,24 @@
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.wms.deps import require_role, UserRole
 from app.wms.models import CountSession, CountDetail
 from app.wms.schemas.counts import (
     CountSessionCreate, CountSessionResponse, CountDetailUpdate,
-    CountApplyRequest, CountResponse
+    CountApplyRequest, CountResponse, CountScheduleRequest
 )
 from app.wms.services.counting import CountingService
+from app.wms.services.count_scheduler import CycleCountScheduler
+from app.wms.services.count_upload import upload_format, iter_upload_counts
 
 router = APIRouter()
 
 @router.post("/counts", response_model=CountResponse)
 async def create_count_session(
     request: CountSessionCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
 ):
     """Create new cycle count session"""
@@ -24,7 +27,28 @@ async def create_count_session(
     result = await service.create_count_session(
         whs=request.whs,
         scope=request.scope,
-        user=current_user["username"]
+        user=current_user["username"],
+        partition_by=request.partitionBy
+    )
+    
+    return CountResponse(**result)
+
+@router.post("/counts/schedule", response_model=CountResponse)
+async def schedule_counts(
+    request: CountScheduleRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
+):
+    """Open the day's ABC/velocity-driven count sessions (or just plan them with dryRun)"""
+    scheduler = CycleCountScheduler(db)
+    
+    result = await scheduler.schedule(
+        whs=request.whs,
+        user=current_user["username"],
+        day=request.countDate,
+        max_locations=request.maxLocations,
+        partition_by=request.partitionBy,
+        dry_run=request.dryRun
     )
     
     return CountResponse(**result)
@@ -32,11 +56,11 @@ async def create_count_session(
 @router.get("/counts/{count_id}", response_model=CountSessionResponse)
 async def get_count_session(
     count_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Get count session details"""
-    session = db.query(CountSession).filter(CountSession.id == count_id).first()
+    session = await db.scalar(select(CountSession).where(CountSession.id == count_id))
     if not session:
         raise HTTPException(status_code=404, detail="Count session not found")
     
@@ -45,15 +69,20 @@ async def get_count_session(
 @router.get("/counts/{count_id}/details")
 async def get_count_details(
     count_id: int,
-    db: Session = Depends(get_db),
+    task_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
-    """Get count session details with items"""
-    session = db.query(CountSession).filter(CountSession.id == count_id).first()
+    """Get count session details with items, optionally for one task"""
+    session = await db.scalar(select(CountSession).where(CountSession.id == count_id))
     if not session:
         raise HTTPException(status_code=404, detail="Count session not found")
     
-    details = db.query(CountDetail).filter(CountDetail.session_id == count_id).all()
+    query = select(CountDetail).where(CountDetail.session_id == count_id)
+    if task_id is not None:
+        query = query.where(CountDetail.task_id == task_id)
+    
+    details = (await db.scalars(query.order_by(CountDetail.id))).all()
     
     return {
         "ok": True,
@@ -64,11 +93,13 @@ async def get_count_details(
                 "status": session.status,
                 "created_by": session.created_by,
                 "created_at": session.created_at.isoformat(),
-                "closed_at": session.closed_at.isoformat() if session.closed_at else None
+                "closed_at": session.closed_at.isoformat() if session.closed_at else None,
+                "movement_hwm": session.movement_hwm
             },
             "details": [
                 {
                     "id": detail.id,
+                    "task_id": detail.task_id,
                     "location_id": detail.location_id,
                     "item_code": detail.item_code,
                     "lot_no": detail.lot_no,
@@ -81,11 +112,69 @@ async def get_count_details(
         }
     }
 
+@router.get("/counts/{count_id}/progress", response_model=CountResponse)
+async def get_count_progress(
+    count_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR))
+):
+    """Counted/total/variance totals from the task counters, cheap enough to poll"""
+    service = CountingService(db)
+    
+    result = await service.get_progress(count_id)
+    if not result["ok"]:
+        raise HTTPException(status_code=404, detail=result["error"]["message"])
+    
+    return CountResponse(**result)
+
+@router.get("/counts/{count_id}/tasks")
+async def list_count_tasks(
+    count_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR))
+):
+    """List the session's count tasks with their counters"""
+    session = await db.scalar(select(CountSession).where(CountSession.id == count_id))
+    if not session:
+        raise HTTPException(status_code=404, detail="Count session not found")
+    
+    service = CountingService(db)
+    
+    return {"ok": True, "data": await service.list_tasks(count_id)}
+
+@router.post("/counts/{count_id}/tasks/{task_id}/claim", response_model=CountResponse)
+async def claim_count_task(
+    count_id: int,
+    task_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR))
+):
+    """Assign a count task to the current operator"""
+    service = CountingService(db)
+    
+    result = await service.claim_task(count_id, task_id, current_user["username"])
+    
+    return CountResponse(**result)
+
+@router.post("/counts/{count_id}/tasks/{task_id}/complete", response_model=CountResponse)
+async def complete_count_task(
+    count_id: int,
+    task_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR))
+):
+    """Mark a count task as finished"""
+    service = CountingService(db)
+    
+    result = await service.complete_task(count_id, task_id, current_user["username"])
+    
+    return CountResponse(**result)
+
 @router.put("/counts/{count_id}/enter", response_model=CountResponse)
 async def enter_counts(
     count_id: int,
     counts: List[CountDetailUpdate],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Enter counted quantities"""
@@ -107,11 +196,38 @@ async def enter_counts(
     
     return CountResponse(**result)
 
+@router.post("/counts/{count_id}/upload", response_model=CountResponse)
+async def upload_counts(
+    count_id: int,
+    request: Request,
+    upload_fmt: Optional[str] = Query(None, alias="format"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR))
+):
+    """Enter counts from a streamed CSV (detailId,countedQty) or NDJSON scanner file"""
+    fmt = upload_format(request.headers.get("content-type"), upload_fmt)
+    if fmt is None:
+        raise HTTPException(
+            status_code=415,
+            detail="Upload must be text/csv or application/x-ndjson (or pass ?format=csv|ndjson)"
+        )
+    
+    service = CountingService(db)
+    
+    result = await service.upload_counts(
+        session_id=count_id,
+        rows=iter_upload_counts(request.stream(), fmt),
+        user=current_user["username"],
+        source=fmt
+    )
+    
+    return CountResponse(**result)
+
 @router.post("/counts/{count_id}/apply", response_model=CountResponse)
 async def apply_count_adjustments(
     count_id: int,
     request: CountApplyRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
 ):
     """Apply count adjustments and create SAP documents"""
@@ -131,19 +247,19 @@ async def list_count_sessions(
     whs: Optional[str] = None,
     status: Optional[str] = None,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """List count sessions with filters"""
-    query = db.query(CountSession)
+    query = select(CountSession)
     
     if whs:
-        query = query.filter(CountSession.whs_code == whs)
+        query = query.where(CountSession.whs_code == whs)
     
     if status:
-        query = query.filter(CountSession.status == status)
+        query = query.where(CountSession.status == status)
     
-    sessions = query.order_by(CountSession.created_at.desc()).limit(limit).all()
+    sessions = (await db.scalars(query.order_by(CountSession.created_at.desc()).limit(limit))).all()
     
     return {
         "ok": True,
@@ -1,9 +1,14 @@
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.wms.deps import require_role, UserRole
-from app.wms.schemas.labels import LabelRequest, LabelResponse
-from app.wms.services.printing import PrintingService
+from app.wms.schemas.labels import LabelRequest, LabelResponse, LabelBatchRequest, LabelTemplateRequest
+from app.wms.services.printing import PrintingService, printer_backend
+from app.wms.services.print_queue import PrintQueueService, print_job_dispatcher, print_job_dict
+from app.wms.services.label_templates import LabelTemplateService, label_template_dict
+from app.wms.services.sap_client import BulkheadFullError
 
 router = APIRouter()
 
@@ -11,7 +16,7 @@ router = APIRouter()
 async def generate_location_label(
     location_id: int,
     request: LabelRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Generate and optionally print location label"""
@@ -29,50 +34,179 @@ async def generate_location_label(
 async def preview_location_label(
     location_id: int,
     format: str = "pdf",
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Preview location label without printing"""
-    from app.wms.models import Location
+    service = PrintingService(db)
     
-    location = db.query(Location).filter(Location.id == location_id).first()
+    location = await service.get_location(location_id)
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
     
-    service = PrintingService(db)
-    
     if format.lower() == "zpl":
-        content = service.generate_bin_label_zpl(location)
+        content = (await service.render_label(location, "zpl")).decode()
         return {"ok": True, "data": {"content": content, "format": "zpl"}}
     elif format.lower() == "pdf":
         import base64
-        content = service.generate_bin_label_pdf(location)
+        try:
+            content = await service.render_label(location, "pdf")
+        except BulkheadFullError as e:
+            raise HTTPException(status_code=503, detail=str(e))
         content_b64 = base64.b64encode(content).decode()
         return {"ok": True, "data": {"content": content_b64, "format": "pdf"}}
     else:
         raise HTTPException(status_code=400, detail="Format must be 'zpl' or 'pdf'")
 
+@router.post("/labels/batch")
+async def generate_label_batch(
+    request: LabelBatchRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR))
+):
+    """Render the labels of every location in a filter as one job.
+    
+    ZPL is streamed as one concatenated job and PDF as one multi-page
+    document; with sendToPrinter the job goes to the printer instead.
+    """
+    service = PrintingService(db)
+    format = request.format.lower()
+    if format not in ("zpl", "pdf"):
+        raise HTTPException(status_code=400, detail="Format must be 'zpl' or 'pdf'")
+    
+    if request.sendToPrinter:
+        return await service.print_label_batch(
+            whs=request.whs,
+            scope=request.scope,
+            format=format,
+            user=current_user["username"]
+        )
+    
+    loaded = await service.get_batch_locations(request.whs, request.scope)
+    if not loaded["ok"]:
+        status_code = 404 if loaded["error"]["code"] == "LOCATION_NOT_FOUND" else 400
+        raise HTTPException(status_code=status_code, detail=loaded["error"]["message"])
+    locations = loaded["data"]
+    
+    await service.audit_service.log_action(
+        user_name=current_user["username"],
+        action="generate_label_batch",
+        payload={"whs": request.whs, "scope": request.scope, "format": format, "labels": len(locations)}
+    )
+    
+    headers = {
+        "Content-Disposition": f'attachment; filename="labels-{request.whs}.{format}"',
+        "X-Label-Count": str(len(locations))
+    }
+    if format == "zpl":
+        template = await service.get_template(request.whs)
+        return StreamingResponse(service.iter_batch_zpl(locations, template), media_type="application/zpl", headers=headers)
+    
+    try:
+        content = await service.render_labels_pdf(locations)
+    except BulkheadFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return StreamingResponse(iter([content]), media_type="application/pdf", headers=headers)
+
 @router.get("/labels/printers")
 async def list_printers(
+    refresh: bool = False,
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
-    """List available printers"""
-    import os
-    import aiohttp
+    """List available printers, from the printer registry unless refresh is set"""
+    if not printer_backend.configured:
+        return {"ok": False, "error": printer_backend.not_configured}
     
-    api_key = os.getenv("PRINTNODE_API_KEY")
-    if not api_key:
-        return {"ok": False, "error": {"code": "PRINTNODE_NOT_CONFIGURED", "message": "PrintNode API key not configured"}}
+    return await printer_backend.list_printers(refresh=refresh)
+
+@router.get("/labels/jobs")
+async def list_print_jobs(
+    status: Optional[str] = None,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR))
+):
+    """List queued print jobs, newest first"""
+    service = PrintQueueService(db)
+    jobs = await service.list_jobs(status=status, limit=limit)
     
-    try:
-        async with aiohttp.ClientSession() as session:
-            auth = aiohttp.BasicAuth(api_key, "")
-            async with session.get("https://api.printnode.com/printers", auth=auth) as response:
-                if response.status == 200:
-                    printers = await response.json()
-                    return {"ok": True, "data": {"printers": printers}}
-                else:
-                    error_text = await response.text()
-                    return {"ok": False, "error": {"code": "PRINTNODE_ERROR", "message": error_text}}
-    except Exception as e:
-        return {"ok": False, "error": {"code": "PRINTNODE_CONNECTION_ERROR", "message": str(e)}}
+    return {
+        "ok": True,
+        "data": [print_job_dict(job) for job in jobs],
+        "dispatcher": print_job_dispatcher.snapshot()
+    }
+
+@router.get("/labels/jobs/{job_id}")
+async def get_print_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR))
+):
+    """Status of one queued print job"""
+    service = PrintQueueService(db)
+    job = await service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Print job not found")
+    
+    return {"ok": True, "data": print_job_dict(job)}
+
+@router.post("/labels/jobs/{job_id}/retry")
+async def retry_print_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
+):
+    """Re-queue a print job that exhausted its retries"""
+    service = PrintQueueService(db)
+    result = await service.retry(job_id)
+    if result.get("ok"):
+        print_job_dispatcher.wake()
+    return result
+
+@router.get("/labels/templates")
+async def list_label_templates(
+    whs: Optional[str] = None,
+    labelType: Optional[str] = None,
+    includeInactive: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR))
+):
+    """List label templates; with whs, that warehouse's and the global ones"""
+    service = LabelTemplateService(db)
+    templates = await service.list_templates(whs=whs, label_type=labelType, include_inactive=includeInactive)
+    
+    return {"ok": True, "data": [label_template_dict(template) for template in templates]}
+
+@router.post("/labels/templates")
+async def create_label_template(
+    request: LabelTemplateRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
+):
+    """Add a ZPL template, replacing the active one for its warehouse and label type"""
+    service = LabelTemplateService(db)
+    result = await service.create_template(
+        name=request.name,
+        body=request.body,
+        user=current_user["username"],
+        whs=request.whs,
+        label_type=request.labelType
+    )
+    if not result["ok"] and result["error"]["code"] in ("INVALID_TEMPLATE", "INVALID_LABEL_TYPE"):
+        raise HTTPException(status_code=400, detail=result["error"]["message"])
+    
+    return result
+
+@router.delete("/labels/templates/{template_id}")
+async def deactivate_label_template(
+    template_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
+):
+    """Retire a template; its labels fall back to the global or built-in layout"""
+    service = LabelTemplateService(db)
+    result = await service.deactivate_template(template_id, current_user["username"])
+    if not result["ok"]:
+        raise HTTPException(status_code=404, detail=result["error"]["message"])
+    
+    return result
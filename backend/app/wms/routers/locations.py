@@ -1,7 +1,8 @@
 from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.wms.deps import require_role, UserRole
 from app.wms.models import Warehouse, Location
 from app.wms.schemas.locations import (
@@ -10,6 +11,8 @@ from app.wms.schemas.locations import (
 )
 from app.wms.utils import generate_bin_codes, validate_warehouse_code
 from app.wms.services.audit import WMSAuditService
+from app.wms.services.idempotency import idempotency_store
+from app.wms.services.label_cache import label_cache
 
 router = APIRouter()
 
@@ -17,62 +20,74 @@ router = APIRouter()
 async def bulk_generate_locations(
     whs: str,
     request: BulkGenerateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER)),
     idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Bulk generate locations from pattern"""
-    try:
-        if not validate_warehouse_code(whs):
-            raise HTTPException(status_code=400, detail="Invalid warehouse code")
-        
-        warehouse = db.query(Warehouse).filter(Warehouse.whs_code == whs).first()
-        if not warehouse:
-            raise HTTPException(status_code=404, detail="Warehouse not found")
-        
-        bin_codes = generate_bin_codes(request.pattern)
-        created_count = 0
-        
-        for code in bin_codes:
-            existing = db.query(Location).filter(
-                Location.whs_code == whs,
-                Location.code == code
-            ).first()
+    async def generate():
+        try:
+            if not validate_warehouse_code(whs):
+                raise HTTPException(status_code=400, detail="Invalid warehouse code")
             
-            if not existing:
-                parts = code.split('-')
-                location = Location(
-                    whs_code=whs,
-                    code=code,
-                    section=parts[0] if len(parts) > 0 else None,
-                    aisle=parts[1] if len(parts) > 1 else None,
-                    rack=parts[2] if len(parts) > 2 else None,
-                    level=parts[3] if len(parts) > 3 else None,
-                    bin=parts[4] if len(parts) > 4 else None,
-                    type=request.type,
-                    attributes=request.attributes
-                )
-                db.add(location)
-                created_count += 1
-        
-        db.commit()
-        
-        audit_service = WMSAuditService(db)
-        await audit_service.log_action(
-            user_name=current_user["username"],
-            action="bulk_generate_locations",
-            payload={
-                "warehouse": whs,
-                "pattern": request.pattern,
-                "created_count": created_count,
-                "idempotency_key": idempotency_key
-            }
-        )
-        
-        return BulkGenerateResponse(ok=True, data={"created": created_count})
-        
-    except Exception as e:
-        return BulkGenerateResponse(ok=False, error={"code": "BULK_GENERATE_FAILED", "message": str(e)})
+            warehouse = await db.scalar(select(Warehouse).where(Warehouse.whs_code == whs))
+            if not warehouse:
+                raise HTTPException(status_code=404, detail="Warehouse not found")
+            
+            bin_codes = generate_bin_codes(request.pattern)
+            created_count = 0
+            
+            for code in bin_codes:
+                existing = await db.scalar(select(Location).where(
+                    Location.whs_code == whs,
+                    Location.code == code
+                ))
+                
+                if not existing:
+                    parts = code.split('-')
+                    location = Location(
+                        whs_code=whs,
+                        code=code,
+                        section=parts[0] if len(parts) > 0 else None,
+                        aisle=parts[1] if len(parts) > 1 else None,
+                        rack=parts[2] if len(parts) > 2 else None,
+                        level=parts[3] if len(parts) > 3 else None,
+                        bin=parts[4] if len(parts) > 4 else None,
+                        type=request.type,
+                        attributes=request.attributes
+                    )
+                    db.add(location)
+                    created_count += 1
+            
+            await db.commit()
+            
+            audit_service = WMSAuditService(db)
+            await audit_service.log_action(
+                user_name=current_user["username"],
+                action="bulk_generate_locations",
+                payload={
+                    "warehouse": whs,
+                    "pattern": request.pattern,
+                    "created_count": created_count,
+                    "idempotency_key": idempotency_key
+                }
+            )
+            
+            return {"ok": True, "data": {"created": created_count}}
+            
+        except Exception as e:
+            return {"ok": False, "error": {"code": "BULK_GENERATE_FAILED", "message": str(e)}}
+    
+    result = await idempotency_store.run(
+        db,
+        endpoint=f"warehouses/{whs}/locations/bulk-generate",
+        key=idempotency_key,
+        payload=request.dict(),
+        user=current_user["username"],
+        operation=generate
+    )
+    
+    return BulkGenerateResponse(**result)
 
 @router.get("/warehouses/{whs}/locations", response_model=List[LocationResponse])
 async def get_locations(
@@ -80,31 +95,31 @@ async def get_locations(
     code_like: Optional[str] = None,
     type: Optional[str] = None,
     active_only: bool = True,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Get locations with optional filters"""
-    query = db.query(Location).filter(Location.whs_code == whs)
+    query = select(Location).where(Location.whs_code == whs)
     
     if code_like:
-        query = query.filter(Location.code.like(f"%{code_like}%"))
+        query = query.where(Location.code.like(f"%{code_like}%"))
     
     if type:
-        query = query.filter(Location.type == type)
+        query = query.where(Location.type == type)
     
     if active_only:
-        query = query.filter(Location.is_active == True)
+        query = query.where(Location.is_active == True)
     
-    return query.all()
+    return (await db.scalars(query)).all()
 
 @router.get("/locations/{location_id}", response_model=LocationResponse)
 async def get_location(
     location_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Get specific location"""
-    location = db.query(Location).filter(Location.id == location_id).first()
+    location = await db.scalar(select(Location).where(Location.id == location_id))
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
     return location
@@ -113,11 +128,11 @@ async def get_location(
 async def update_location(
     location_id: int,
     request: LocationUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
 ):
     """Update location"""
-    location = db.query(Location).filter(Location.id == location_id).first()
+    location = await db.scalar(select(Location).where(Location.id == location_id))
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
     
@@ -125,8 +140,9 @@ async def update_location(
     for field, value in update_data.items():
         setattr(location, field, value)
     
-    db.commit()
-    db.refresh(location)
+    await db.commit()
+    await db.refresh(location)
+    await label_cache.invalidate_location(location_id)
     
     audit_service = WMSAuditService(db)
     await audit_service.log_action(
@@ -1,7 +1,7 @@
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.wms.deps import require_role, UserRole
 from app.wms.schemas.movements import (
     PutawayRequest, IssueRequest, MoveInternalRequest, 
@@ -9,13 +9,14 @@ from app.wms.schemas.movements import (
 )
 from app.wms.services.putaway import PutawayService
 from app.wms.services.transfers import TransferService
+from app.wms.services.idempotency import idempotency_store
 
 router = APIRouter()
 
 @router.post("/operations/putaway", response_model=MovementResponse)
 async def putaway_operation(
     request: PutawayRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR)),
     idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
@@ -32,11 +33,56 @@ async def putaway_operation(
         for line in request.lines
     ]
     
-    result = await service.execute_putaway(
-        whs=request.whs,
-        lines=lines,
+    result = await idempotency_store.run(
+        db,
+        endpoint="operations/putaway",
+        key=idempotency_key,
+        payload=request.dict(),
         user=current_user["username"],
-        create_good_receipt=False
+        operation=lambda: service.execute_putaway(
+            whs=request.whs,
+            lines=lines,
+            user=current_user["username"],
+            create_good_receipt=bool(request.sap and request.sap.get("createGoodReceipt")),
+            idempotency_key=idempotency_key
+        )
+    )
+    
+    return MovementResponse(**result)
+
+@router.post("/operations/putaway/bulk", response_model=MovementResponse)
+async def bulk_putaway_operation(
+    request: PutawayRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.OPERATOR)),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Execute set-based put-away for large receipts with per-line results"""
+    service = PutawayService(db)
+    
+    lines = [
+        {
+            "item": line.item,
+            "lot": line.lot,
+            "qty": line.qty,
+            "toLocationId": line.toLocationId
+        }
+        for line in request.lines
+    ]
+    
+    result = await idempotency_store.run(
+        db,
+        endpoint="operations/putaway/bulk",
+        key=idempotency_key,
+        payload=request.dict(),
+        user=current_user["username"],
+        operation=lambda: service.execute_bulk_putaway(
+            whs=request.whs,
+            lines=lines,
+            user=current_user["username"],
+            create_good_receipt=bool(request.sap and request.sap.get("createGoodReceipt")),
+            idempotency_key=idempotency_key
+        )
     )
     
     return MovementResponse(**result)
@@ -44,101 +90,107 @@ async def putaway_operation(
 @router.post("/operations/issue", response_model=MovementResponse)
 async def issue_operation(
     request: IssueRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR)),
     idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     """Execute issue operation"""
-    try:
-        from app.wms.services.sap_client import SAPClient
-        from app.wms.services.audit import WMSAuditService
-        from app.wms.utils import generate_idempotency_key
-        from sqlalchemy import text
-        
-        if not idempotency_key:
-            idempotency_key = generate_idempotency_key()
-        
-        with db.begin():
-            movements = []
+    async def issue():
+        try:
+            from app.wms.services.sap_outbox import SapOutboxService
+            from app.wms.services.audit import WMSAuditService
+            from app.wms.services.stock_ledger import StockLedger
+            from app.wms.utils import generate_idempotency_key
             
-            for line in request.lines:
-                dec_query = text("""
-                    UPDATE wms.stock_location
-                       SET qty = qty - :q, last_updated = SYSUTCDATETIME()
-                     WHERE whs_code=:w AND location_id=:loc AND item_code=:it
-                       AND (lot_no IS NULL OR lot_no=:lot) AND qty >= :q
-                """)
-                
-                result = db.execute(dec_query, {
-                    "q": float(line.qty), "w": request.whs, "loc": line.fromLocationId,
-                    "it": line.item, "lot": line.lot
-                })
-                
-                if result.rowcount == 0:
-                    raise Exception(f"Insufficient stock for {line.item}")
-                
-                from app.wms.models import Movement
-                movement = Movement(
-                    type="ISSUE",
-                    whs_code_from=request.whs,
-                    location_id_from=line.fromLocationId,
-                    item_code=line.item,
-                    lot_no=line.lot,
-                    qty=line.qty,
-                    reference=f"ISSUE-{request.reason}-{idempotency_key}",
-                    idempotency_key=idempotency_key,
-                    created_by=current_user["username"]
-                )
-                db.add(movement)
-                movements.append(movement)
+            issue_key = idempotency_key or generate_idempotency_key()
             
-            if request.sap and request.sap.get("createGoodIssue"):
-                sap_client = SAPClient()
-                sap_lines = [
+            async with db.begin():
+                movements = []
+                
+                ledger = StockLedger(db)
+                await ledger.decrement([
                     {
+                        "whs": request.whs,
+                        "location_id": line.fromLocationId,
                         "item": line.item,
-                        "qty": float(line.qty),
-                        "lot": line.lot
+                        "lot": line.lot,
+                        "qty": line.qty
                     }
                     for line in request.lines
-                ]
+                ])
+                
+                for line in request.lines:
+                    from app.wms.models import Movement
+                    movement = Movement(
+                        type="ISSUE",
+                        whs_code_from=request.whs,
+                        location_id_from=line.fromLocationId,
+                        item_code=line.item,
+                        lot_no=line.lot,
+                        qty=line.qty,
+                        reference=f"ISSUE-{request.reason}-{issue_key}",
+                        idempotency_key=issue_key,
+                        created_by=current_user["username"]
+                    )
+                    db.add(movement)
+                    movements.append(movement)
                 
-                sap_result = await sap_client.good_issue(
-                    whs=request.whs,
-                    reference=request.sap.get("reference", f"ISSUE-{idempotency_key}"),
-                    lines=sap_lines,
-                    idempotency_key=idempotency_key
+                if request.sap and request.sap.get("createGoodIssue"):
+                    sap_lines = [
+                        {
+                            "item": line.item,
+                            "qty": float(line.qty),
+                            "lot": line.lot
+                        }
+                        for line in request.lines
+                    ]
+                    
+                    SapOutboxService(db).enqueue(
+                        doc_type="GoodIssue",
+                        whs=request.whs,
+                        payload={
+                            "whs": request.whs,
+                            "reference": request.sap.get("reference", f"ISSUE-{issue_key}"),
+                            "lines": sap_lines
+                        },
+                        idempotency_key=issue_key,
+                        user=current_user["username"],
+                        movement_key=issue_key
+                    )
+                
+                audit_service = WMSAuditService(db)
+                await audit_service.log_action(
+                    user_name=current_user["username"],
+                    action="issue",
+                    payload={
+                        "whs": request.whs,
+                        "reason": request.reason,
+                        "lines": [line.dict() for line in request.lines],
+                        "sap": request.sap,
+                        "idempotency_key": issue_key
+                    }
                 )
                 
-                if not sap_result.get("ok"):
-                    raise Exception(f"SAP Good Issue failed: {sap_result.get('error')}")
+                return {"ok": True, "data": {"movements_created": len(movements)}}
                 
-                for movement in movements:
-                    movement.sap_doc_type = "GoodIssue"
-                    movement.sap_doc_entry = sap_result.get("data", {}).get("docEntry")
-            
-            audit_service = WMSAuditService(db)
-            await audit_service.log_action(
-                user_name=current_user["username"],
-                action="issue",
-                payload={
-                    "whs": request.whs,
-                    "reason": request.reason,
-                    "lines": [line.dict() for line in request.lines],
-                    "sap": request.sap,
-                    "idempotency_key": idempotency_key
-                }
-            )
-            
-            return MovementResponse(ok=True, data={"movements_created": len(movements)})
-            
-    except Exception as e:
-        return MovementResponse(ok=False, error={"code": "ISSUE_FAILED", "message": str(e)})
+        except Exception as e:
+            return {"ok": False, "error": {"code": "ISSUE_FAILED", "message": str(e)}}
+    
+    result = await idempotency_store.run(
+        db,
+        endpoint="operations/issue",
+        key=idempotency_key,
+        payload=request.dict(),
+        user=current_user["username"],
+        operation=issue
+    )
+    
+    return MovementResponse(**result)
 
 @router.post("/operations/move-internal", response_model=MovementResponse)
 async def move_internal_operation(
     request: MoveInternalRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR)),
     idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
@@ -156,10 +208,18 @@ async def move_internal_operation(
         for move in request.moves
     ]
     
-    result = await service.execute_internal_move(
-        whs=request.whs,
-        moves=moves,
-        user=current_user["username"]
+    result = await idempotency_store.run(
+        db,
+        endpoint="operations/move-internal",
+        key=idempotency_key,
+        payload=request.dict(),
+        user=current_user["username"],
+        operation=lambda: service.execute_internal_move(
+            whs=request.whs,
+            moves=moves,
+            user=current_user["username"],
+            idempotency_key=idempotency_key
+        )
     )
     
     return MovementResponse(**result)
@@ -167,7 +227,7 @@ async def move_internal_operation(
 @router.post("/operations/transfer-warehouse", response_model=MovementResponse)
 async def transfer_warehouse_operation(
     request: TransferWarehouseRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER)),
     idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
@@ -187,12 +247,20 @@ async def transfer_warehouse_operation(
     
     create_sap_transfer = request.sap.get("createTransfer", True) if request.sap else True
     
-    result = await service.execute_warehouse_transfer(
-        from_whs=request.fromWhs,
-        to_whs=request.toWhs,
-        moves=moves,
+    result = await idempotency_store.run(
+        db,
+        endpoint="operations/transfer-warehouse",
+        key=idempotency_key,
+        payload=request.dict(),
         user=current_user["username"],
-        create_sap_transfer=create_sap_transfer
+        operation=lambda: service.execute_warehouse_transfer(
+            from_whs=request.fromWhs,
+            to_whs=request.toWhs,
+            moves=moves,
+            user=current_user["username"],
+            create_sap_transfer=create_sap_transfer,
+            idempotency_key=idempotency_key
+        )
     )
     
     return MovementResponse(**result)
@@ -1,9 +1,10 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.database import get_async_db
 from app.wms.deps import require_role, UserRole
+from app.wms.models import StockLocation, Location
 from app.wms.services.audit import WMSAuditService
 
 router = APIRouter()
@@ -14,36 +15,38 @@ async def get_picking_suggestions(
     item: str,
     qty: float,
     policy: str = "FIFO",
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Get picking suggestions for packing operations"""
     try:
         if policy.upper() == "FIFO":
-            order_clause = "sl.last_updated ASC"
+            order_clause = StockLocation.last_updated.asc()
         elif policy.upper() == "FEFO":
-            order_clause = "sl.lot_no ASC"
+            order_clause = StockLocation.lot_no.asc()
         else:
-            order_clause = "sl.last_updated ASC"
+            order_clause = StockLocation.last_updated.asc()
         
-        suggestions_query = text(f"""
-            SELECT 
-                sl.location_id,
-                l.code as location_code,
-                sl.item_code,
-                sl.lot_no,
-                sl.qty as available_qty,
-                sl.uom
-            FROM wms.stock_location sl
-            JOIN wms.location l ON sl.location_id = l.id
-            WHERE sl.whs_code = :whs 
-              AND sl.item_code = :item 
-              AND sl.qty > 0
-              AND l.is_active = 1
-            ORDER BY {order_clause}
-        """)
+        suggestions_query = (
+            select(
+                StockLocation.location_id,
+                Location.code.label("location_code"),
+                StockLocation.item_code,
+                StockLocation.lot_no,
+                StockLocation.qty.label("available_qty"),
+                StockLocation.uom
+            )
+            .join(Location, StockLocation.location_id == Location.id)
+            .where(
+                StockLocation.whs_code == whs,
+                StockLocation.item_code == item,
+                StockLocation.qty > 0,
+                Location.is_active == True
+            )
+            .order_by(order_clause)
+        )
         
-        results = db.execute(suggestions_query, {"whs": whs, "item": item}).fetchall()
+        results = (await db.execute(suggestions_query)).fetchall()
         
         suggestions = []
         remaining_qty = qty
@@ -81,13 +84,14 @@ async def get_picking_suggestions(
 @router.post("/picking/confirm")
 async def confirm_picking(
     request: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Confirm picking allocations for packing"""
     try:
         from app.wms.utils import generate_idempotency_key
         from app.wms.models import Movement
+        from app.wms.services.stock_ledger import StockLedger
         
         reference = request.get("reference", "")
         whs = request["whs"]
@@ -96,30 +100,27 @@ async def confirm_picking(
         
         idempotency_key = generate_idempotency_key()
         
-        with db.begin():
+        async with db.begin():
             movements = []
             
+            ledger = StockLedger(db)
+            await ledger.decrement([
+                {
+                    "whs": whs,
+                    "location_id": allocation["fromLocationId"],
+                    "item": allocation["item"],
+                    "lot": allocation.get("lot"),
+                    "qty": allocation["qty"]
+                }
+                for allocation in allocations
+            ])
+            
             for allocation in allocations:
                 item_code = allocation["item"]
                 lot_no = allocation.get("lot")
                 qty = float(allocation["qty"])
                 from_location_id = allocation["fromLocationId"]
                 
-                dec_query = text("""
-                    UPDATE wms.stock_location
-                       SET qty = qty - :q, last_updated = SYSUTCDATETIME()
-                     WHERE whs_code=:w AND location_id=:loc AND item_code=:it
-                       AND (lot_no IS NULL OR lot_no=:lot) AND qty >= :q
-                """)
-                
-                result = db.execute(dec_query, {
-                    "q": qty, "w": whs, "loc": from_location_id,
-                    "it": item_code, "lot": lot_no
-                })
-                
-                if result.rowcount == 0:
-                    raise Exception(f"Insufficient stock for {item_code} at location {from_location_id}")
-                
                 movement = Movement(
                     type="ISSUE",
                     whs_code_from=whs,
@@ -135,8 +136,7 @@ async def confirm_picking(
                 movements.append(movement)
             
             if not sap_config.get("packingCreatesDelivery", False):
-                from app.wms.services.sap_client import SAPClient
-                sap_client = SAPClient()
+                from app.wms.services.sap_outbox import SapOutboxService
                 
                 sap_lines = [
                     {
@@ -147,19 +147,18 @@ async def confirm_picking(
                     for allocation in allocations
                 ]
                 
-                sap_result = await sap_client.good_issue(
+                SapOutboxService(db).enqueue(
+                    doc_type="GoodIssue",
                     whs=whs,
-                    reference=reference,
-                    lines=sap_lines,
-                    idempotency_key=idempotency_key
+                    payload={
+                        "whs": whs,
+                        "reference": reference,
+                        "lines": sap_lines
+                    },
+                    idempotency_key=idempotency_key,
+                    user=current_user["username"],
+                    movement_key=idempotency_key
                 )
-                
-                if not sap_result.get("ok"):
-                    raise Exception(f"SAP Good Issue failed: {sap_result.get('error')}")
-                
-                for movement in movements:
-                    movement.sap_doc_type = "GoodIssue"
-                    movement.sap_doc_entry = sap_result.get("data", {}).get("docEntry")
             
             audit_service = WMSAuditService(db)
             await audit_service.log_action(
@@ -0,0 +1,58 @@
+from typing import Optional
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app.wms.deps import require_role, UserRole
+from app.wms.services.sap_outbox import SapOutboxService, sap_outbox_dispatcher
+
+router = APIRouter()
+
+@router.get("/sap/outbox")
+async def get_sap_outbox(
+    status: Optional[str] = None,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
+):
+    """List queued SAP documents, newest first"""
+    service = SapOutboxService(db)
+    entries = await service.list_entries(status=status, limit=limit)
+    
+    return {
+        "ok": True,
+        "data": [
+            {
+                "id": entry.id,
+                "doc_type": entry.doc_type,
+                "whs_code": entry.whs_code,
+                "idempotency_key": entry.idempotency_key,
+                "status": entry.status,
+                "attempts": entry.attempts,
+                "next_attempt_at": entry.next_attempt_at,
+                "last_error": entry.last_error,
+                "sap_doc_entry": entry.sap_doc_entry,
+                "sap_doc_num": entry.sap_doc_num,
+                "created_by": entry.created_by,
+                "created_at": entry.created_at,
+                "sent_at": entry.sent_at
+            }
+            for entry in entries
+        ],
+        "dispatcher": {
+            "running": sap_outbox_dispatcher.running,
+            **sap_outbox_dispatcher.stats
+        }
+    }
+
+@router.post("/sap/outbox/{entry_id}/retry")
+async def retry_sap_outbox_entry(
+    entry_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
+):
+    """Re-queue a SAP document that exhausted its retries"""
+    service = SapOutboxService(db)
+    result = await service.retry(entry_id)
+    if result.get("ok"):
+        sap_outbox_dispatcher.wake()
+    return result
@@ -1,29 +1,58 @@
 from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app.database import get_db
+from sqlalchemy import select, func, and_, distinct
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.wms.deps import require_role, UserRole
 from app.wms.models import StockLocation, Location
 from app.wms.schemas.stock import StockByLocationResponse, StockByItemResponse, StockSummaryResponse
 
 router = APIRouter()
 
+def build_low_stock_query(whs: Optional[str], threshold_pct: float):
+    """Capacity utilization aggregate shared by the low-stock endpoint"""
+    current_qty = func.coalesce(func.sum(StockLocation.qty), 0)
+    utilization_pct = current_qty / Location.capacity_qty * 100
+    
+    query = (
+        select(
+            Location.id.label("location_id"),
+            Location.code.label("location_code"),
+            Location.capacity_qty,
+            Location.capacity_uom,
+            current_qty.label("current_qty"),
+            utilization_pct.label("utilization_pct")
+        )
+        .outerjoin(
+            StockLocation,
+            and_(StockLocation.location_id == Location.id, StockLocation.qty > 0)
+        )
+        .where(Location.capacity_qty.isnot(None), Location.is_active == True)
+        .group_by(Location.id, Location.code, Location.capacity_qty, Location.capacity_uom)
+        .having(utilization_pct < threshold_pct)
+        .order_by(utilization_pct.asc())
+    )
+    
+    if whs:
+        query = query.where(Location.whs_code == whs)
+    
+    return query
+
 @router.get("/stock/by-location/{location_id}", response_model=List[StockByLocationResponse])
 async def get_stock_by_location(
     location_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Get all stock in a specific location"""
-    location = db.query(Location).filter(Location.id == location_id).first()
+    location = await db.scalar(select(Location).where(Location.id == location_id))
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
     
-    stock = db.query(StockLocation).filter(
+    stock = (await db.scalars(select(StockLocation).where(
         StockLocation.location_id == location_id,
         StockLocation.qty > 0
-    ).all()
+    ))).all()
     
     return stock
 
@@ -31,15 +60,15 @@ async def get_stock_by_location(
 async def get_stock_by_item(
     whs: str,
     item: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Get stock locations for a specific item"""
-    stock_locations = db.query(StockLocation).filter(
+    stock_locations = (await db.scalars(select(StockLocation).where(
         StockLocation.whs_code == whs,
         StockLocation.item_code == item,
         StockLocation.qty > 0
-    ).all()
+    ))).all()
     
     if not stock_locations:
         raise HTTPException(status_code=404, detail="No stock found for item")
@@ -55,24 +84,33 @@ async def get_stock_by_item(
 async def get_stock_summary(
     whs: str,
     item: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.OPERATOR))
 ):
     """Get stock summary for SAP reconciliation"""
-    summary_query = text("""
-        SELECT 
-            whs_code,
-            item_code,
-            item_name,
-            SUM(qty) as total_qty,
-            uom,
-            COUNT(DISTINCT location_id) as location_count
-        FROM wms.stock_location
-        WHERE whs_code = :whs AND item_code = :item AND qty > 0
-        GROUP BY whs_code, item_code, item_name, uom
-    """)
+    summary_query = (
+        select(
+            StockLocation.whs_code,
+            StockLocation.item_code,
+            StockLocation.item_name,
+            func.sum(StockLocation.qty).label("total_qty"),
+            StockLocation.uom,
+            func.count(distinct(StockLocation.location_id)).label("location_count")
+        )
+        .where(
+            StockLocation.whs_code == whs,
+            StockLocation.item_code == item,
+            StockLocation.qty > 0
+        )
+        .group_by(
+            StockLocation.whs_code,
+            StockLocation.item_code,
+            StockLocation.item_name,
+            StockLocation.uom
+        )
+    )
     
-    result = db.execute(summary_query, {"whs": whs, "item": item}).fetchone()
+    result = (await db.execute(summary_query)).first()
     
     if not result:
         raise HTTPException(status_code=404, detail="No stock found for item")
@@ -90,32 +128,13 @@ async def get_stock_summary(
 async def get_low_stock_locations(
     whs: Optional[str] = None,
     threshold_pct: float = 10.0,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(require_role(UserRole.WAREHOUSE_MANAGER))
 ):
     """Get locations with low stock based on capacity"""
-    low_stock_query = text("""
-        SELECT 
-            l.id as location_id,
-            l.code as location_code,
-            l.capacity_qty,
-            l.capacity_uom,
-            COALESCE(SUM(sl.qty), 0) as current_qty,
-            (COALESCE(SUM(sl.qty), 0) / l.capacity_qty * 100) as utilization_pct
-        FROM wms.location l
-        LEFT JOIN wms.stock_location sl ON l.id = sl.location_id AND sl.qty > 0
-        WHERE l.capacity_qty IS NOT NULL 
-          AND l.is_active = 1
-          AND (:whs IS NULL OR l.whs_code = :whs)
-        GROUP BY l.id, l.code, l.capacity_qty, l.capacity_uom
-        HAVING (COALESCE(SUM(sl.qty), 0) / l.capacity_qty * 100) < :threshold
-        ORDER BY utilization_pct ASC
-    """)
+    low_stock_query = build_low_stock_query(whs, threshold_pct)
     
-    results = db.execute(low_stock_query, {
-        "whs": whs,
-        "threshold": threshold_pct
-    }).fetchall()
+    results = (await db.execute(low_stock_query)).fetchall()
     
     return {
         "ok": True,
@@ -1,11 +1,19 @@
 from typing import Optional, List
 from pydantic import BaseModel
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, date
 
 class CountSessionCreate(BaseModel):
     whs: str
     scope: dict
+    partitionBy: Optional[str] = None
+
+class CountScheduleRequest(BaseModel):
+    whs: str
+    countDate: Optional[date] = None
+    maxLocations: Optional[int] = None
+    partitionBy: Optional[str] = None
+    dryRun: bool = False
 
 class CountSessionResponse(BaseModel):
     id: int
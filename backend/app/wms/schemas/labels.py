@@ -9,3 +9,15 @@ class LabelResponse(BaseModel):
     ok: bool
     data: Optional[dict] = None
     error: Optional[dict] = None
+
+class LabelBatchRequest(BaseModel):
+    whs: str
+    scope: dict
+    format: str = "zpl"
+    sendToPrinter: bool = False
+
+class LabelTemplateRequest(BaseModel):
+    name: str
+    body: str
+    whs: Optional[str] = None
+    labelType: str = "bin"
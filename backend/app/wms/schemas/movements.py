@@ -18,6 +18,7 @@ class PutawayLine(BaseModel):
 class PutawayRequest(BaseModel):
     whs: str
     lines: List[PutawayLine]
+    sap: Optional[dict] = None
 
 class IssueLine(BaseModel):
     item: str
@@ -4,6 +4,9 @@ from .transfers import TransferService
 from .counting import CountingService
 from .printing import PrintingService
 from .audit import WMSAuditService
+from .stock_ledger import StockLedger, InsufficientStockError
+from .idempotency import IdempotencyStore, idempotency_store
+from .sap_outbox import SapOutboxService, SapOutboxDispatcher, sap_outbox_dispatcher
 
 __all__ = [
     "SAPClient",
@@ -11,5 +14,12 @@ __all__ = [
     "TransferService",
     "CountingService",
     "PrintingService",
-    "WMSAuditService"
+    "WMSAuditService",
+    "StockLedger",
+    "InsufficientStockError",
+    "IdempotencyStore",
+    "idempotency_store",
+    "SapOutboxService",
+    "SapOutboxDispatcher",
+    "sap_outbox_dispatcher"
 ]
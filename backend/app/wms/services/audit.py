@@ -1,17 +1,220 @@
+import os
+import base64
+import asyncio
 import logging
 import json
-from typing import Dict, Any, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import SessionTransactionOrigin
+from sqlalchemy import select, insert, or_, event
+from app.database import AsyncSessionLocal
 from app.wms.models import AuditLog
-from app.wms.utils import hash_payload
+from app.wms.services.audit_chain import AuditChainSealer, AUDIT_CHAIN_ENABLED, payload_digest
+from app.wms.services.audit_archive import AuditArchive, audit_archive
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+WRITE_MODE_TRANSACTION = "transaction"
+WRITE_MODE_ASYNC = "async"
+
+# transaction: the audit row is written in the caller's transaction (durable
+# with the operation). async: rows are queued in memory and bulk inserted by
+# audit_sink; rows still queued when the process dies are lost.
+AUDIT_WRITE_MODE = os.getenv("AUDIT_WRITE_MODE", WRITE_MODE_TRANSACTION).lower()
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+# Queued records beyond this are written synchronously instead.
+AUDIT_QUEUE_MAX = int(os.getenv("AUDIT_QUEUE_MAX", "100000"))
+# Largest audit trail page.
+AUDIT_PAGE_MAX = 1000
+
+PAYLOAD_NONE = "none"
+PAYLOAD_RAW = "raw"
+PAYLOAD_JSON = "json"
+PAYLOAD_MODES = (PAYLOAD_NONE, PAYLOAD_RAW, PAYLOAD_JSON)
+
+def encode_cursor(ts: datetime, audit_id: int) -> str:
+    """Opaque page cursor for the (ts, id) keyset"""
+    return base64.urlsafe_b64encode(f"{ts.isoformat()}|{audit_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        ts, audit_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+        return datetime.fromisoformat(ts), int(audit_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid audit cursor")
+
+def audit_row_to_dict(row, payload: str = PAYLOAD_JSON) -> Dict[str, Any]:
+    record = {
+        "id": row.id,
+        "timestamp": row.ts.isoformat(),
+        "user_name": row.user_name,
+        "action": row.action
+    }
+    if payload == PAYLOAD_RAW:
+        record["payload"] = row.payload
+    elif payload == PAYLOAD_JSON:
+        record["payload"] = json.loads(row.payload) if row.payload else None
+    return record
+
+def audit_record(user_name: str, action: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Column values for one wms_audit_log row, timestamped now.
+
+    The payload is stored with sorted keys, so its payload_hash is the
+    same digest hash_payload() gives for the payload itself.
+    """
+    payload_text = json.dumps(payload, sort_keys=True, default=str) if payload else None
+    return {
+        "ts": datetime.utcnow(),
+        "user_name": user_name,
+        "action": action,
+        "payload": payload_text,
+        "payload_hash": payload_digest(payload_text) if payload_text else None
+    }
+
+class AuditSink:
+    """Background writer that batches audit records into bulk INSERTs.
+
+    Records are buffered in memory and flushed when AUDIT_BATCH_SIZE are
+    waiting or every AUDIT_FLUSH_SECONDS, whichever comes first. stop()
+    drains the buffer. A failed flush keeps its records for the next one.
+    After each flush the sealer extends the audit hash chain over the new
+    rows, including those written inside callers' transactions.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        batch_size: int = AUDIT_BATCH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_SECONDS,
+        max_queue: int = AUDIT_QUEUE_MAX,
+        sealer: Optional[AuditChainSealer] = None
+    ):
+        self.session_factory = session_factory or AsyncSessionLocal
+        if sealer is None and AUDIT_CHAIN_ENABLED:
+            sealer = AuditChainSealer(self.session_factory)
+        self.sealer = sealer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "failed": 0, "rejected": 0}
+        self._buffer: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def accepting(self) -> bool:
+        return self.running and not self._stopping and len(self._buffer) < self.max_queue
+
+    async def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Audit sink started")
+
+    async def stop(self, timeout: float = 10.0):
+        """Flush everything queued and stop the writer"""
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+            logger.error(f"Audit sink stopped with {len(self._buffer)} record(s) unwritten")
+        self._task = None
+        logger.info("Audit sink stopped")
+
+    def submit(self, record: Dict[str, Any], force: bool = False) -> bool:
+        """Queue one record; False when the sink is not running or is full.
+        force queues past max_queue, for records whose transaction has
+        already committed and can no longer take the row."""
+        if not (self.accepting or (force and self.running and not self._stopping)):
+            self.stats["rejected"] += 1
+            return False
+        self._buffer.append(record)
+        self.stats["queued"] += 1
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> int:
+        """Write everything queued so far, returns the number of rows written"""
+        async with self._flush_lock:
+            written = 0
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                try:
+                    async with self.session_factory() as db:
+                        await db.execute(insert(AuditLog.__table__), batch)
+                        await db.commit()
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    logger.error(f"Audit sink flush failed ({len(batch)} records kept): {str(e)}")
+                    break
+                del self._buffer[:len(batch)]
+                written += len(batch)
+                self.stats["written"] += len(batch)
+                self.stats["batches"] += 1
+            return written
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self.sealer:
+                await self.sealer.seal()
+        await self.flush()
+
+audit_sink = AuditSink()
+
+# Session.info key for async-mode records waiting on the caller's transaction.
+PENDING_AUDIT_KEY = "wms_pending_audit"
+
+def _submit_pending_audit(session):
+    """after_commit: the operation is durable, so its records can go to the sink"""
+    pending = session.info.get(PENDING_AUDIT_KEY)
+    if not pending:
+        return
+    session.info[PENDING_AUDIT_KEY] = []
+    for sink, record in pending:
+        if not sink.submit(record, force=True):
+            logger.error(f"Audit record '{record['action']}' by {record['user_name']} lost: audit sink stopped before its transaction committed")
+
+def _drop_pending_audit(session):
+    """after_rollback: the operation never happened, neither did its records"""
+    if session.info.get(PENDING_AUDIT_KEY):
+        session.info[PENDING_AUDIT_KEY] = []
+
 class WMSAuditService:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: AsyncSession,
+        write_mode: str = AUDIT_WRITE_MODE,
+        sink: Optional[AuditSink] = None,
+        archive: Optional[AuditArchive] = None
+    ):
         self.db = db
+        self.write_mode = write_mode
+        self.sink = sink or audit_sink
+        self.archive = archive or audit_archive
 
     async def log_action(
         self,
@@ -19,16 +222,33 @@ class WMSAuditService:
         action: str,
         payload: Optional[Dict[str, Any]] = None
     ) -> bool:
-        """Log WMS action to audit trail"""
+        """Log WMS action to audit trail.
+
+        In async mode the record is handed to the audit sink and the
+        session is not touched; inside a ``begin()`` block it is held
+        until that transaction commits and dropped if it rolls back.
+        Otherwise (or when the sink is not running or full, or inside a
+        savepoint) the row is added to the caller's transaction: inside a
+        ``begin()`` block it commits with the operation, with no commit of
+        its own; outside one it is committed here, as before.
+        """
         try:
-            audit_log = AuditLog(
-                user_name=user_name,
-                action=action,
-                payload=json.dumps(payload) if payload else None
-            )
+            record = audit_record(user_name, action, payload)
+            session = self.db.sync_session
+            transaction = session.get_transaction()
+            in_block = transaction is not None and transaction.origin != SessionTransactionOrigin.AUTOBEGIN
+            
+            if self.write_mode == WRITE_MODE_ASYNC and self.sink.accepting:
+                if not in_block:
+                    if self.sink.submit(record):
+                        return True
+                elif not session.in_nested_transaction():
+                    self._defer_until_commit(record)
+                    return True
             
-            self.db.add(audit_log)
-            self.db.commit()
+            self.db.add(AuditLog(**record))
+            if not in_block:
+                await self.db.commit()
             
             return True
             
@@ -36,37 +256,105 @@ class WMSAuditService:
             logger.error(f"Error logging audit action: {str(e)}")
             return False
 
-    def get_audit_trail(
+    def _defer_until_commit(self, record: Dict[str, Any]):
+        session = self.db.sync_session
+        pending = session.info.get(PENDING_AUDIT_KEY)
+        if pending is None:
+            pending = session.info[PENDING_AUDIT_KEY] = []
+            event.listen(session, "after_commit", _submit_pending_audit)
+            event.listen(session, "after_rollback", _drop_pending_audit)
+        pending.append((self.sink, record))
+
+    async def get_audit_trail(
         self, 
         user_name: Optional[str] = None,
         action: Optional[str] = None,
-        limit: int = 100
-    ) -> list:
-        """Get audit trail with optional filters"""
-        try:
-            query = self.db.query(AuditLog)
-            
-            if user_name:
-                query = query.filter(AuditLog.user_name == user_name)
-            
-            if action:
-                query = query.filter(AuditLog.action == action)
-            
-            query = query.order_by(AuditLog.ts.desc()).limit(limit)
-            
-            records = []
-            for log in query.all():
-                record = {
-                    'id': log.id,
-                    'timestamp': log.ts.isoformat(),
-                    'user_name': log.user_name,
-                    'action': log.action,
-                    'payload': json.loads(log.payload) if log.payload else None
-                }
-                records.append(record)
-            
-            return records
-            
-        except Exception as e:
-            logger.error(f"Error getting audit trail: {str(e)}")
-            return []
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        payload: str = PAYLOAD_NONE
+    ) -> Dict[str, Any]:
+        """Get one page of the audit trail, newest first.
+
+        Pages are keyed on (ts, id): pass the previous page's next_cursor
+        to continue. Each filter combination is served by one of the
+        (user_name|action, ts, id) indexes, so a page costs an index seek
+        however deep it is. payload is "none" (column not read), "raw"
+        (stored JSON text) or "json" (decoded). Raises ValueError for a
+        malformed cursor or payload mode.
+        
+        Rows moved out by audit retention are read through from the
+        archive and merged in the same order, so pages cross from the table
+        into the archive seamlessly. The archive is only opened once the
+        page reaches back to the newest archived row.
+        """
+        if payload not in PAYLOAD_MODES:
+            raise ValueError(f"payload must be one of {', '.join(PAYLOAD_MODES)}")
+        position = decode_cursor(cursor) if cursor else None
+        limit = max(1, min(limit, AUDIT_PAGE_MAX))
+        
+        columns = [AuditLog.id, AuditLog.ts, AuditLog.user_name, AuditLog.action]
+        if payload != PAYLOAD_NONE:
+            columns.append(AuditLog.payload)
+        query = select(*columns)
+        
+        if user_name:
+            query = query.where(AuditLog.user_name == user_name)
+        
+        if action:
+            query = query.where(AuditLog.action == action)
+        
+        if since:
+            query = query.where(AuditLog.ts >= since)
+        
+        if until:
+            query = query.where(AuditLog.ts < until)
+        
+        if position:
+            ts, audit_id = position
+            # ts <= :ts keeps the index range seek; the OR only trims ties.
+            query = query.where(AuditLog.ts <= ts, or_(AuditLog.ts < ts, AuditLog.id < audit_id))
+        
+        query = query.order_by(AuditLog.ts.desc(), AuditLog.id.desc()).limit(limit + 1)
+        
+        rows = (await self.db.execute(query)).all()
+        
+        newest_archived = self.archive.newest_key
+        if newest_archived and (len(rows) <= limit or (rows[-1].ts, rows[-1].id) < newest_archived):
+            archived = await asyncio.to_thread(
+                self.archive.read_page, user_name, action, since, until, position, limit + 1
+            )
+            # A row can be in both while retention is between writing a day and deleting it.
+            seen = {row.id for row in rows}
+            rows = sorted(
+                rows + [row for row in archived if row.id not in seen],
+                key=lambda row: (row.ts, row.id),
+                reverse=True
+            )[:limit + 1]
+        
+        more = len(rows) > limit
+        rows = rows[:limit]
+        
+        return {
+            "records": [audit_row_to_dict(row, payload) for row in rows],
+            "next_cursor": encode_cursor(rows[-1].ts, rows[-1].id) if more else None
+        }
+
+    async def get_audit_entry(self, audit_id: int) -> Optional[Dict[str, Any]]:
+        """One audit record with its payload decoded"""
+        row = (await self.db.execute(
+            select(
+                AuditLog.id, AuditLog.ts, AuditLog.user_name, AuditLog.action,
+                AuditLog.payload, AuditLog.payload_hash, AuditLog.chain_hash
+            )
+            .where(AuditLog.id == audit_id)
+        )).first()
+        if not row:
+            row = await asyncio.to_thread(self.archive.find, audit_id)
+        if not row:
+            return None
+        record = audit_row_to_dict(row, PAYLOAD_JSON)
+        record["payload_hash"] = row.payload_hash
+        record["chain_hash"] = row.chain_hash
+        return record
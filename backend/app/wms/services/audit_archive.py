@@ -0,0 +1,395 @@
+import os
+import gzip
+import json
+import asyncio
+import hashlib
+import logging
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+from sqlalchemy import select, update, delete, func
+from app.database import AsyncSessionLocal, engine
+from app.wms.models import AuditLog, AuditCheckpoint
+from app.wms.services.audit_chain import AUDIT_CHAIN_ENABLED, GENESIS_HASH, verify_segment, payload_digest
+
+logger = logging.getLogger(__name__)
+
+# Rows older than this many days move to the archive; 0 disables retention.
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "0"))
+AUDIT_RETENTION_INTERVAL_SECONDS = float(os.getenv("AUDIT_RETENTION_INTERVAL_SECONDS", "3600"))
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "./audit_archive")
+# Lines per gzip member; the sidecar index records where each one starts.
+ARCHIVE_BLOCK_ROWS = 1000
+ARCHIVE_FETCH_SIZE = 10000
+
+ArchivedRow = namedtuple("ArchivedRow", "id ts user_name action payload payload_hash chain_hash")
+
+def _row_key(row) -> Tuple[datetime, int]:
+    return row.ts, row.id
+
+class AuditArchive:
+    """Date-partitioned, compressed audit archive.
+
+    Each day is ``YYYY/MM/audit-YYYY-MM-DD.jsonl.gz``, one JSON line per
+    row, newest first (the audit trail's (ts, id) order), written as a
+    series of gzip members of ARCHIVE_BLOCK_ROWS lines each. The file is
+    still a plain .jsonl.gz. Its sidecar ``.idx.json`` holds the day's
+    id/ts range, per-user and per-action counts and the offset and first
+    key of every member, so a page seeks straight to the member holding
+    its cursor and days without a match are never opened.
+
+    Payloads are kept as the exact stored text so archived rows still
+    verify against their chain hashes; payload_hash is not stored, it is
+    recomputed from the payload on read.
+    """
+
+    def __init__(self, root: str = AUDIT_ARCHIVE_DIR):
+        self.root = root
+        # Month folder -> (folder mtime, its day indexes); a folder's mtime
+        # changes whenever a day file is added or replaced in it.
+        self._months: Dict[str, Tuple[int, List[Dict[str, Any]]]] = {}
+
+    def _paths(self, day: date) -> Tuple[str, str]:
+        folder = os.path.join(self.root, f"{day.year:04d}", f"{day.month:02d}")
+        name = f"audit-{day.isoformat()}"
+        return os.path.join(folder, f"{name}.jsonl.gz"), os.path.join(folder, f"{name}.idx.json")
+
+    def days(self) -> List[Dict[str, Any]]:
+        """Sidecar indexes of every archived day, newest first"""
+        indexes = []
+        if not os.path.isdir(self.root):
+            return indexes
+        for year in os.scandir(self.root):
+            if not year.is_dir():
+                continue
+            for month in os.scandir(year.path):
+                if not month.is_dir():
+                    continue
+                mtime = month.stat().st_mtime_ns
+                cached = self._months.get(month.path)
+                if cached is None or cached[0] != mtime:
+                    cached = self._months[month.path] = (mtime, self._load_month(month.path))
+                indexes.extend(cached[1])
+        indexes.sort(key=lambda index: index["date"], reverse=True)
+        return indexes
+
+    def _load_month(self, folder: str) -> List[Dict[str, Any]]:
+        indexes = []
+        for entry in os.scandir(folder):
+            if not entry.name.endswith(".idx.json"):
+                continue
+            with open(entry.path, encoding="utf-8") as f:
+                index = json.load(f)
+            index["path"] = os.path.join(folder, index["file"])
+            index["newest"] = (datetime.fromisoformat(index["max_ts"]), index["newest_id"])
+            index["oldest"] = datetime.fromisoformat(index["min_ts"])
+            indexes.append(index)
+        return indexes
+
+    @property
+    def newest_key(self) -> Optional[Tuple[datetime, int]]:
+        """(ts, id) of the newest archived row"""
+        days = self.days()
+        return max(index["newest"] for index in days) if days else None
+
+    def _read_day(self, index: Dict[str, Any], offset: int = 0, needles: Tuple[bytes, ...] = ()) -> Iterator[ArchivedRow]:
+        """Rows of one day from the member at offset on. Lines not holding
+        every needle (an encoded ``"field":value`` pair) are skipped
+        without being parsed."""
+        with open(index["path"], "rb") as raw:
+            raw.seek(offset)
+            with gzip.GzipFile(fileobj=raw, mode="rb") as lines:
+                for line in lines:
+                    if needles and not all(needle in line for needle in needles):
+                        continue
+                    record = json.loads(line)
+                    payload = record["payload"]
+                    yield ArchivedRow(
+                        record["id"], datetime.fromisoformat(record["ts"]), record["user_name"], record["action"],
+                        payload, payload_digest(payload) if payload is not None else None, record["chain_hash"]
+                    )
+
+    def write_day(self, day: date, rows: List[ArchivedRow]) -> Dict[str, Any]:
+        """Write (or merge into) a day's file, rows already in any order.
+
+        A day archived again (rows that arrived late, or a run that died
+        before deleting what it wrote) is merged by id, so no row is
+        duplicated. Files are written next to the target and renamed into
+        place, the data file before its index.
+        """
+        data_path, index_path = self._paths(day)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        merged = {row.id: row for row in rows}
+        if os.path.exists(data_path):
+            for row in self._read_day({"path": data_path}):
+                merged.setdefault(row.id, row)
+        ordered = sorted(merged.values(), key=_row_key, reverse=True)
+
+        users: Dict[str, int] = {}
+        actions: Dict[str, int] = {}
+        blocks = []
+        digest = hashlib.sha256()
+        with open(data_path + ".tmp", "wb") as f:
+            for start in range(0, len(ordered), ARCHIVE_BLOCK_ROWS):
+                block = ordered[start:start + ARCHIVE_BLOCK_ROWS]
+                blocks.append([f.tell(), block[0].ts.isoformat(), block[0].id])
+                lines = []
+                for row in block:
+                    users[row.user_name] = users.get(row.user_name, 0) + 1
+                    actions[row.action] = actions.get(row.action, 0) + 1
+                    lines.append(json.dumps({
+                        "id": row.id,
+                        "ts": row.ts.isoformat(),
+                        "user_name": row.user_name,
+                        "action": row.action,
+                        "payload": row.payload,
+                        "chain_hash": row.chain_hash
+                    }, separators=(",", ":")))
+                member = gzip.compress(("\n".join(lines) + "\n").encode(), mtime=0)
+                digest.update(member)
+                f.write(member)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(data_path + ".tmp", data_path)
+
+        index = {
+            "date": day.isoformat(),
+            "file": os.path.basename(data_path),
+            "sha256": digest.hexdigest(),
+            "rows": len(ordered),
+            "min_id": min(merged),
+            "max_id": max(merged),
+            "min_ts": ordered[-1].ts.isoformat(),
+            "max_ts": ordered[0].ts.isoformat(),
+            "newest_id": ordered[0].id,
+            "users": users,
+            "actions": actions,
+            "blocks": blocks
+        }
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(index_path + ".tmp", index_path)
+        return index
+
+    def read_page(
+        self,
+        user_name: Optional[str] = None,
+        action: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        position: Optional[Tuple[datetime, int]] = None,
+        limit: int = 100
+    ) -> List[ArchivedRow]:
+        """Up to limit archived rows after position, newest first, with the
+        same filters as the audit trail query"""
+        # Rows must sort below both the cursor and until; until as (ts, 0)
+        # means ts < until, ids being positive.
+        upper = position
+        if until and (upper is None or (until, 0) < upper):
+            upper = (until, 0)
+
+        page: List[ArchivedRow] = []
+        for index in self.days():
+            if since and index["newest"][0] < since:
+                break
+            if upper and index["oldest"] > upper[0]:
+                continue
+            if user_name and user_name not in index["users"]:
+                continue
+            if action and action not in index["actions"]:
+                continue
+
+            # Inside a string value a quote is always escaped, so an encoded
+            # "user_name":"x" can only match the field itself.
+            needles = tuple(
+                f'"{field}":{json.dumps(value)}'.encode()
+                for field, value in (("user_name", user_name), ("action", action)) if value
+            )
+            # Start from the last member whose first row is not below the cursor.
+            offset = 0
+            if upper:
+                for block_offset, block_ts, block_id in index["blocks"]:
+                    if (datetime.fromisoformat(block_ts), block_id) < upper:
+                        break
+                    offset = block_offset
+
+            for row in self._read_day(index, offset, needles):
+                if upper and _row_key(row) >= upper:
+                    continue
+                if since and row.ts < since:
+                    return page
+                if user_name and row.user_name != user_name:
+                    continue
+                if action and row.action != action:
+                    continue
+                page.append(row)
+                if len(page) >= limit:
+                    return page
+        return page
+
+    def find(self, audit_id: int) -> Optional[ArchivedRow]:
+        for index in self.days():
+            if index["min_id"] <= audit_id <= index["max_id"]:
+                for row in self._read_day(index):
+                    if row.id == audit_id:
+                        return row
+        return None
+
+audit_archive = AuditArchive()
+
+class AuditRetentionJob:
+    """Moves audit rows older than the retention period into the archive.
+
+    With the hash chain enabled, rows move a whole checkpoint segment at a
+    time and only after the segment verifies (a tampered segment stays in
+    the table and blocks retention). Archived checkpoints are marked so
+    the verifier skips them, and archived rows keep their hashes. Rows are
+    written to the day's file before they are deleted; a run that dies in
+    between is completed by the next one.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        archive: Optional[AuditArchive] = None,
+        retention_days: int = AUDIT_RETENTION_DAYS,
+        interval: float = AUDIT_RETENTION_INTERVAL_SECONDS,
+        chain_enabled: bool = AUDIT_CHAIN_ENABLED,
+        database_url: Optional[str] = None
+    ):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.archive = archive or audit_archive
+        self.retention_days = retention_days
+        self.interval = interval
+        self.chain_enabled = chain_enabled
+        self.database_url = database_url
+        self.stats = {"runs": 0, "archived": 0, "days_written": 0, "failed": 0, "blocked": 0, "last_run": None}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Audit retention job started")
+
+    async def stop(self, timeout: float = 30.0):
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+        logger.info("Audit retention job stopped")
+
+    async def _run(self):
+        while not self._stopping:
+            await self.run_once()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _chain_boundary(self, db, cutoff: datetime) -> int:
+        """Verify and mark archived every whole segment older than cutoff;
+        returns the last id of the archived chain"""
+        archived_through = await db.scalar(
+            select(func.max(AuditCheckpoint.last_id)).where(AuditCheckpoint.archived_at.is_not(None))
+        ) or 0
+        start_hash = await db.scalar(
+            select(AuditCheckpoint.chain_hash).where(AuditCheckpoint.last_id == archived_through)
+        ) if archived_through else None
+        candidates = (await db.execute(
+            select(AuditCheckpoint.id, AuditCheckpoint.last_id, AuditCheckpoint.chain_hash, AuditCheckpoint.verified_at)
+            .join(AuditLog, AuditLog.id == AuditCheckpoint.last_id)
+            .where(AuditCheckpoint.last_id > archived_through, AuditLog.ts < cutoff)
+            .order_by(AuditCheckpoint.last_id)
+        )).all()
+
+        after_id, start_hash = archived_through, start_hash or GENESIS_HASH
+        database_url = self.database_url or engine.url.render_as_string(hide_password=False)
+        for checkpoint in candidates:
+            if checkpoint.verified_at is None:
+                result = await asyncio.to_thread(
+                    verify_segment, database_url, after_id, checkpoint.last_id, start_hash, checkpoint.chain_hash
+                )
+                if result["failure_count"]:
+                    self.stats["blocked"] += 1
+                    logger.error(
+                        f"Audit retention stopped at rows {after_id + 1}-{checkpoint.last_id}: "
+                        f"{result['failure_count']} chain failure(s), first at id {result['failures'][0]['id']}"
+                    )
+                    break
+            await db.execute(
+                update(AuditCheckpoint)
+                .where(AuditCheckpoint.id == checkpoint.id)
+                .values(archived_at=datetime.utcnow(), verified_at=func.coalesce(AuditCheckpoint.verified_at, datetime.utcnow()))
+            )
+            after_id, start_hash = checkpoint.last_id, checkpoint.chain_hash
+        await db.commit()
+        return after_id
+
+    async def run_once(self) -> int:
+        """Archive everything due, returns the number of rows moved"""
+        if self.retention_days <= 0:
+            return 0
+        moved = 0
+        cutoff = datetime.combine(date.today() - timedelta(days=self.retention_days), datetime.min.time())
+        try:
+            async with self.session_factory() as db:
+                if self.chain_enabled:
+                    boundary = await self._chain_boundary(db, cutoff)
+                else:
+                    boundary = await db.scalar(select(func.max(AuditLog.id)).where(AuditLog.ts < cutoff)) or 0
+                if not boundary:
+                    return 0
+
+                oldest = await db.scalar(select(func.min(AuditLog.ts)).where(AuditLog.id <= boundary))
+                if oldest is None:
+                    return 0
+                day = oldest.date()
+                # Rows up to the boundary but not yet past the cutoff (ts a
+                # little ahead of id order) move on a later run.
+                while datetime.combine(day, datetime.min.time()) < cutoff:
+                    start = datetime.combine(day, datetime.min.time())
+                    end = min(start + timedelta(days=1), cutoff)
+                    in_day = (AuditLog.ts >= start, AuditLog.ts < end, AuditLog.id <= boundary)
+                    rows = []
+                    result = await db.stream(
+                        select(
+                            AuditLog.id, AuditLog.ts, AuditLog.user_name, AuditLog.action,
+                            AuditLog.payload, AuditLog.payload_hash, AuditLog.chain_hash
+                        )
+                        .where(*in_day)
+                        .execution_options(yield_per=ARCHIVE_FETCH_SIZE)
+                    )
+                    async for partition in result.partitions(ARCHIVE_FETCH_SIZE):
+                        rows.extend(ArchivedRow(*row) for row in partition)
+                    if rows:
+                        await asyncio.to_thread(self.archive.write_day, day, rows)
+                        await db.execute(delete(AuditLog).where(*in_day))
+                        await db.commit()
+                        moved += len(rows)
+                        self.stats["days_written"] += 1
+                    day += timedelta(days=1)
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Audit retention failed: {str(e)}")
+        self.stats["runs"] += 1
+        self.stats["archived"] += moved
+        self.stats["last_run"] = datetime.utcnow().isoformat()
+        if moved:
+            logger.info(f"Audit retention archived {moved} row(s) older than {cutoff.date()}")
+        return moved
+
+audit_retention_job = AuditRetentionJob()
@@ -0,0 +1,322 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import create_engine, select, update, insert, case, func, bindparam
+from app.database import AsyncSessionLocal, engine
+from app.wms.models import AuditLog, AuditCheckpoint
+
+logger = logging.getLogger(__name__)
+
+AUDIT_CHAIN_ENABLED = os.getenv("AUDIT_CHAIN_ENABLED", "true").lower() == "true"
+# Rows younger than this are left for the next pass, so a transaction that
+# took an id but has not committed yet is not skipped over.
+AUDIT_CHAIN_SETTLE_SECONDS = float(os.getenv("AUDIT_CHAIN_SETTLE_SECONDS", "5"))
+AUDIT_CHAIN_CHECKPOINT_ROWS = int(os.getenv("AUDIT_CHAIN_CHECKPOINT_ROWS", "100000"))
+AUDIT_CHAIN_SEAL_BATCH = 5000
+AUDIT_VERIFY_WORKERS = int(os.getenv("AUDIT_VERIFY_WORKERS", str(os.cpu_count() or 1)))
+# Rows fetched per round trip by a verifier worker.
+VERIFY_FETCH_SIZE = 10000
+# Failures reported per segment; the rest are only counted.
+MAX_SEGMENT_FAILURES = 100
+
+GENESIS_HASH = "0" * 64
+
+def payload_digest(payload_text: str) -> str:
+    """SHA-256 of a stored payload; equals hash_payload() of the payload
+    because audit_record serializes it with sorted keys"""
+    return hashlib.sha256(payload_text.encode()).hexdigest()
+
+def chain_digest(
+    prev_hash: str,
+    audit_id: int,
+    ts: datetime,
+    user_name: str,
+    action: str,
+    payload_hash: Optional[str]
+) -> str:
+    """Chain hash of one row: the previous row's chain hash plus this row's
+    id, timestamp, user, action and payload hash.
+
+    The free-text fields are length-prefixed so no two rows share an
+    encoding; an f-string is several times cheaper than json.dumps here.
+    """
+    fields = (
+        f"{prev_hash}|{audit_id}|{ts.isoformat()}|{len(user_name)}:{user_name}"
+        f"|{len(action)}:{action}|{payload_hash or ''}"
+    )
+    return hashlib.sha256(fields.encode()).hexdigest()
+
+class AuditChainSealer:
+    """Extends the audit hash chain over new rows, oldest id first.
+
+    Rows are written with chain_hash NULL (by the audit sink or inside the
+    caller's transaction) and sealed here from the chain tip kept in
+    memory, so each pass only reads the rows added since the last one.
+    Every AUDIT_CHAIN_CHECKPOINT_ROWS sealed rows a checkpoint records the
+    chain hash, closing a segment the verifier can check on its own.
+
+    Chain hashes only depend on the rows before them, so two sealers
+    racing over the same rows write the same values; the unique
+    checkpoint last_id makes the loser roll back and reload its tip.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        batch_size: int = AUDIT_CHAIN_SEAL_BATCH,
+        checkpoint_rows: int = AUDIT_CHAIN_CHECKPOINT_ROWS,
+        settle_seconds: float = AUDIT_CHAIN_SETTLE_SECONDS
+    ):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.batch_size = batch_size
+        self.checkpoint_rows = checkpoint_rows
+        self.settle_seconds = settle_seconds
+        self.stats = {"sealed": 0, "checkpoints": 0, "failed": 0, "sealed_through": None}
+        # (last sealed id, its chain hash, rows sealed since the last checkpoint)
+        self._tip: Optional[Tuple[int, str, int]] = None
+        self._lock = asyncio.Lock()
+
+    async def _load_tip(self, db) -> Tuple[int, str, int]:
+        tip = (await db.execute(
+            select(AuditLog.id, AuditLog.chain_hash)
+            .where(AuditLog.chain_hash.is_not(None))
+            .order_by(AuditLog.id.desc())
+            .limit(1)
+        )).first()
+        if not tip:
+            return 0, GENESIS_HASH, 0
+        checkpoint_id = await db.scalar(select(func.max(AuditCheckpoint.last_id))) or 0
+        since_checkpoint = await db.scalar(
+            select(func.count()).where(AuditLog.id > checkpoint_id, AuditLog.id <= tip.id)
+        )
+        return tip.id, tip.chain_hash, since_checkpoint
+
+    async def seal(self) -> int:
+        """Seal every settled row after the chain tip, returns rows sealed"""
+        async with self._lock:
+            sealed = 0
+            table = AuditLog.__table__
+            try:
+                async with self.session_factory() as db:
+                    if self._tip is None:
+                        self._tip = await self._load_tip(db)
+                    cutoff = datetime.utcnow() - timedelta(seconds=self.settle_seconds)
+
+                    while True:
+                        last_id, last_hash, since_checkpoint = self._tip
+                        # Rows from before the hash columns existed get their payload hash here.
+                        rows = (await db.execute(
+                            select(
+                                AuditLog.id, AuditLog.ts, AuditLog.user_name, AuditLog.action, AuditLog.payload_hash,
+                                case((AuditLog.payload_hash.is_(None), AuditLog.payload), else_=None).label("payload")
+                            )
+                            .where(AuditLog.id > last_id)
+                            .order_by(AuditLog.id)
+                            .limit(self.batch_size)
+                        )).all()
+
+                        updates = []
+                        checkpoints = []
+                        for audit_id, ts, user_name, action, payload_hash, payload in rows:
+                            if ts >= cutoff:
+                                break
+                            if payload_hash is None and payload is not None:
+                                payload_hash = payload_digest(payload)
+                            last_hash = chain_digest(last_hash, audit_id, ts, user_name, action, payload_hash)
+                            last_id = audit_id
+                            since_checkpoint += 1
+                            updates.append({"row_id": audit_id, "row_payload_hash": payload_hash, "row_chain_hash": last_hash})
+                            if since_checkpoint >= self.checkpoint_rows:
+                                checkpoints.append({"last_id": last_id, "chain_hash": last_hash, "row_count": since_checkpoint})
+                                since_checkpoint = 0
+
+                        if not updates:
+                            break
+
+                        await db.execute(
+                            update(table)
+                            .where(table.c.id == bindparam("row_id"))
+                            .values(payload_hash=bindparam("row_payload_hash"), chain_hash=bindparam("row_chain_hash")),
+                            updates
+                        )
+                        if checkpoints:
+                            await db.execute(insert(AuditCheckpoint.__table__), checkpoints)
+                        await db.commit()
+
+                        self._tip = (last_id, last_hash, since_checkpoint)
+                        sealed += len(updates)
+                        self.stats["sealed"] += len(updates)
+                        self.stats["checkpoints"] += len(checkpoints)
+                        self.stats["sealed_through"] = last_id
+                        if len(updates) < self.batch_size:
+                            break
+            except Exception as e:
+                self._tip = None
+                self.stats["failed"] += 1
+                logger.error(f"Audit chain sealing failed: {str(e)}")
+            return sealed
+
+_segment_engines: Dict[str, Any] = {}
+
+def verify_segment(
+    database_url: str,
+    after_id: int,
+    last_id: int,
+    start_hash: str,
+    end_hash: Optional[str] = None
+) -> Dict[str, Any]:
+    """Recompute the chain over the rows after_id < id <= last_id.
+
+    Runs in a verifier worker process with its own connection. Each row's
+    payload must match its payload_hash and its chain_hash must follow
+    from the row before; after a mismatch the walk continues from the
+    stored hash so every altered row is reported. With end_hash (the
+    closing checkpoint) the segment must end on it.
+    """
+    segment_engine = _segment_engines.get(database_url)
+    if segment_engine is None:
+        segment_engine = _segment_engines[database_url] = create_engine(database_url)
+
+    failures: List[Dict[str, Any]] = []
+    failure_count = 0
+    rows_checked = 0
+    prev_hash = start_hash
+
+    def fail(audit_id: int, reason: str):
+        nonlocal failure_count
+        failure_count += 1
+        if len(failures) < MAX_SEGMENT_FAILURES:
+            failures.append({"id": audit_id, "reason": reason})
+
+    query = (
+        select(
+            AuditLog.id, AuditLog.ts, AuditLog.user_name, AuditLog.action,
+            AuditLog.payload, AuditLog.payload_hash, AuditLog.chain_hash
+        )
+        .where(AuditLog.id > after_id, AuditLog.id <= last_id)
+        .order_by(AuditLog.id)
+    )
+    with segment_engine.connect() as connection:
+        result = connection.execution_options(yield_per=VERIFY_FETCH_SIZE).execute(query)
+        for rows in result.partitions():
+            rows_checked += len(rows)
+            for audit_id, ts, user_name, action, payload, payload_hash, chain_hash in rows:
+                if chain_hash is None:
+                    fail(audit_id, "Row is not sealed but rows after it are")
+                    continue
+                if payload is not None and payload_digest(payload) != payload_hash:
+                    fail(audit_id, "Payload does not match payload_hash")
+                elif payload is None and payload_hash is not None:
+                    fail(audit_id, "Payload is missing")
+                if chain_digest(prev_hash, audit_id, ts, user_name, action, payload_hash) != chain_hash:
+                    fail(audit_id, "Chain hash mismatch: this row was altered, or a row before it was removed or inserted")
+                prev_hash = chain_hash
+
+    if end_hash is not None and prev_hash != end_hash:
+        fail(last_id, "Segment does not end on its checkpoint hash")
+
+    return {
+        "after_id": after_id,
+        "last_id": last_id,
+        "rows": rows_checked,
+        "failure_count": failure_count,
+        "failures": failures
+    }
+
+async def verify_chain(
+    session_factory=None,
+    database_url: Optional[str] = None,
+    workers: int = AUDIT_VERIFY_WORKERS,
+    full: bool = False
+) -> Dict[str, Any]:
+    """Verify the sealed audit chain, one process-pool task per segment.
+
+    Segments run from one checkpoint to the next, plus the sealed rows
+    after the last checkpoint. A segment that verifies marks its closing
+    checkpoint verified as soon as it finishes, so later (or interrupted)
+    runs resume after it; full=True re-checks everything except segments
+    already moved to the archive (verified on the way out). Checkpoint
+    hashes can also be copied off the database to anchor the chain.
+    """
+    started = time.perf_counter()
+    session_factory = session_factory or AsyncSessionLocal
+    database_url = database_url or engine.url.render_as_string(hide_password=False)
+
+    async with session_factory() as db:
+        checkpoints = (await db.execute(
+            select(AuditCheckpoint.id, AuditCheckpoint.last_id, AuditCheckpoint.chain_hash,
+                   AuditCheckpoint.row_count, AuditCheckpoint.verified_at, AuditCheckpoint.archived_at)
+            .order_by(AuditCheckpoint.last_id)
+        )).all()
+        sealed_through = await db.scalar(
+            select(AuditLog.id).where(AuditLog.chain_hash.is_not(None)).order_by(AuditLog.id.desc()).limit(1)
+        ) or 0
+        unsealed_rows = await db.scalar(select(func.count()).where(AuditLog.id > sealed_through))
+
+    segments = []
+    skipped_segments = 0
+    skipped_rows = 0
+    archived_segments = 0
+    after_id, start_hash = 0, GENESIS_HASH
+    for checkpoint in checkpoints:
+        if checkpoint.archived_at is not None:
+            # Verified before retention moved it; the rows are no longer in the table.
+            archived_segments += 1
+        elif full or checkpoint.verified_at is None:
+            segments.append((checkpoint.id, after_id, checkpoint.last_id, start_hash, checkpoint.chain_hash))
+        else:
+            skipped_segments += 1
+            skipped_rows += checkpoint.row_count
+        after_id, start_hash = checkpoint.last_id, checkpoint.chain_hash
+    if sealed_through > after_id:
+        segments.append((None, after_id, sealed_through, start_hash, None))
+
+    rows_verified = 0
+    failure_count = 0
+    failures: List[Dict[str, Any]] = []
+    if segments:
+        loop = asyncio.get_running_loop()
+        checkpoint_ids = {segment[2]: segment[0] for segment in segments}
+        # spawn: a forked child would inherit the event loop's threads and pooled connections.
+        with ProcessPoolExecutor(
+            max_workers=max(1, min(workers, len(segments))),
+            mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            tasks = [
+                loop.run_in_executor(pool, verify_segment, database_url, *segment[1:])
+                for segment in segments
+            ]
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                rows_verified += result["rows"]
+                failure_count += result["failure_count"]
+                failures.extend(result["failures"])
+                checkpoint_id = checkpoint_ids[result["last_id"]]
+                if result["failure_count"] == 0 and checkpoint_id is not None:
+                    async with session_factory() as db:
+                        await db.execute(
+                            update(AuditCheckpoint)
+                            .where(AuditCheckpoint.id == checkpoint_id)
+                            .values(verified_at=datetime.utcnow())
+                        )
+                        await db.commit()
+
+    return {
+        "valid": failure_count == 0,
+        "rows_verified": rows_verified,
+        "segments_verified": len(segments),
+        "segments_skipped": skipped_segments,
+        "rows_skipped": skipped_rows,
+        "segments_archived": archived_segments,
+        "sealed_through": sealed_through,
+        "unsealed_rows": unsealed_rows,
+        "failure_count": failure_count,
+        "failures": sorted(failures, key=lambda failure: failure["id"]),
+        "seconds": round(time.perf_counter() - started, 3)
+    }
@@ -0,0 +1,341 @@
+import os
+import math
+import logging
+from operator import itemgetter
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, or_, cast, Float
+from app.wms.models import CountSession, CountDetail, StockLocation, Movement, Location
+from app.wms.services.counting import CountingService, scope_location_filter, PARTITION_LEVELS
+
+logger = logging.getLogger(__name__)
+
+# Movement history read to rank items and locations.
+COUNT_SCHEDULE_LOOKBACK_DAYS = int(os.getenv("COUNT_SCHEDULE_LOOKBACK_DAYS", "90"))
+# Days between counts of an A, B and C location.
+COUNT_FREQUENCY_DAYS = tuple(
+    int(days) for days in os.getenv("COUNT_FREQUENCY_DAYS", "30,90,180").split(",")
+)
+# Cumulative share of value/velocity that closes the A and the B class.
+ABC_CUTOFFS = (0.80, 0.95)
+# Locations per scheduled session; also keeps the scope's IN list under
+# SQL Server's 2100-parameter limit.
+COUNT_SCHEDULE_SESSION_MAX_LOCATIONS = int(os.getenv("COUNT_SCHEDULE_SESSION_MAX_LOCATIONS", "1000"))
+# Movement rows fetched per round trip while loading the history.
+HISTORY_FETCH_SIZE = 50000
+
+CLASS_NAMES = ("A", "B", "C")
+
+class MovementHistory:
+    """Columnar movement history: one NumPy array per column.
+
+    Items are factorized to integer codes (``items[code]`` is the item
+    code); a movement without a from/to location has location 0 there.
+    """
+
+    def __init__(self, items: List[str], item: np.ndarray, location_from: np.ndarray, location_to: np.ndarray, qty: np.ndarray):
+        self.items = items
+        self.item = item
+        self.location_from = location_from
+        self.location_to = location_to
+        self.qty = qty
+
+    def __len__(self) -> int:
+        return len(self.item)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[tuple]) -> "MovementHistory":
+        """Build from (item_code, location_id_from, location_id_to, qty)
+        tuples, with 0 for a missing location"""
+        builder = _HistoryBuilder()
+        builder.add(rows)
+        return builder.build()
+
+class _HistoryBuilder:
+    """Accumulates fetched row batches into NumPy column chunks"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.chunks: List[tuple] = []
+
+    def add(self, rows: Sequence[tuple]):
+        if not rows:
+            return
+        count = len(rows)
+        # One itemgetter pass per column; zip(*rows) is several times slower
+        # on chunks this size.
+        self.chunks.append((
+            np.fromiter(map(self._code, map(itemgetter(0), rows)), dtype=np.int32, count=count),
+            np.fromiter(map(itemgetter(1), rows), dtype=np.int64, count=count),
+            np.fromiter(map(itemgetter(2), rows), dtype=np.int64, count=count),
+            np.fromiter(map(itemgetter(3), rows), dtype=np.float64, count=count)
+        ))
+
+    def _code(self, item_code: str) -> int:
+        code = self.index.get(item_code)
+        if code is None:
+            code = self.index[item_code] = len(self.index)
+        return code
+
+    def build(self) -> MovementHistory:
+        if not self.chunks:
+            empty = np.zeros(0, dtype=np.int64)
+            return MovementHistory([], empty.astype(np.int32), empty, empty, empty.astype(np.float64))
+        columns = [np.concatenate(column) for column in zip(*self.chunks)]
+        return MovementHistory(list(self.index), *columns)
+
+def abc_classes(values: np.ndarray, cutoffs=ABC_CUTOFFS) -> np.ndarray:
+    """Pareto classes for values: 0 (A) up to the first cutoff of the
+    cumulative total, 1 (B) up to the second, 2 (C) for the rest and for
+    anything with no value."""
+    classes = np.full(len(values), 2, dtype=np.int8)
+    total = values.sum()
+    if not len(values) or total <= 0:
+        return classes
+    order = np.argsort(-values, kind="stable")
+    # Share of the total reached *before* each entry, so the entry that
+    # crosses a cutoff still belongs to the higher class.
+    share_before = (np.cumsum(values[order]) - values[order]) / total
+    ranked = np.searchsorted(np.asarray(cutoffs), share_before, side="right").astype(np.int8)
+    ranked[values[order] <= 0] = 2
+    classes[order] = ranked
+    return classes
+
+def classify(
+    history: MovementHistory,
+    location_ids: np.ndarray,
+    stock_location_ids: np.ndarray,
+    stock_items: Sequence[str]
+) -> Dict[str, np.ndarray]:
+    """Velocity and value classes per item and per candidate location.
+
+    * item value    - units moved (the ledger carries no item cost)
+    * item velocity - movement lines
+    * location velocity - movement lines touching the location
+    * location class - the best of the location's velocity class and the
+      classes of the items it currently holds
+
+    Returns arrays aligned with ``location_ids``: ``location_class``,
+    ``touches`` and ``item_class`` (best item class held, 2 when none).
+    """
+    n_items = len(history.items)
+    item_value = np.bincount(history.item, weights=history.qty, minlength=n_items)
+    item_lines = np.bincount(history.item, minlength=n_items).astype(np.float64)
+    item_class = np.minimum(abc_classes(item_value), abc_classes(item_lines))
+
+    max_location = int(max(
+        location_ids.max(initial=0),
+        history.location_from.max(initial=0),
+        history.location_to.max(initial=0)
+    ))
+    touches_by_id = (
+        np.bincount(history.location_from, minlength=max_location + 1)
+        + np.bincount(history.location_to, minlength=max_location + 1)
+    )
+    touches_by_id[0] = 0
+    touches = touches_by_id[location_ids].astype(np.float64)
+    location_velocity_class = abc_classes(touches)
+
+    # Best class among the items each location holds; items without
+    # movements in the window are C.
+    position = np.full(max_location + 1, -1, dtype=np.int64)
+    position[location_ids] = np.arange(len(location_ids))
+    held_class = np.full(len(location_ids), 2, dtype=np.int8)
+    if len(stock_location_ids):
+        item_codes = {code: i for i, code in enumerate(history.items)}
+        stock_item_class = np.fromiter(
+            (item_class[item_codes[code]] if code in item_codes else 2 for code in stock_items),
+            dtype=np.int8,
+            count=len(stock_items)
+        )
+        rows = position[stock_location_ids]
+        held = rows >= 0
+        np.minimum.at(held_class, rows[held], stock_item_class[held])
+
+    return {
+        "location_class": np.minimum(location_velocity_class, held_class),
+        "touches": touches,
+        "item_class": held_class,
+    }
+
+def select_due(
+    location_class: np.ndarray,
+    touches: np.ndarray,
+    days_since_count: np.ndarray,
+    frequency_days: Sequence[int] = COUNT_FREQUENCY_DAYS,
+    max_locations: Optional[int] = None
+) -> np.ndarray:
+    """Indexes of the locations to count today, most overdue first.
+
+    A location is due once the days since its last count reach its
+    class's frequency (never counted is always due). Without
+    max_locations the day's load is the steady-state rate, sum of
+    1/frequency over the candidates, so every class is covered on
+    schedule without counting everything on the first day.
+    """
+    frequency = np.asarray(frequency_days, dtype=np.float64)[location_class]
+    overdue = days_since_count / frequency
+    due = np.flatnonzero(overdue >= 1)
+    if max_locations is None:
+        max_locations = math.ceil((1.0 / frequency).sum())
+    # Most overdue first, then A before C, then busiest first.
+    order = np.lexsort((-touches[due], location_class[due], -overdue[due]))
+    return due[order][:max_locations]
+
+class CycleCountScheduler:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.counting = CountingService(db)
+
+    async def load_history(self, whs: str, since: datetime) -> MovementHistory:
+        """Stream the warehouse's movements since a date into NumPy columns.
+
+        Ids grow with created_at, so the window is located once through
+        ix_movement_created_at and then read as a primary-key range instead
+        of an index lookup per row. qty is read as float to skip Decimal
+        conversion of every row. Rows are streamed through the Core
+        connection, skipping the ORM's per-row loading.
+        """
+        builder = _HistoryBuilder()
+        first_id = await self.db.scalar(
+            select(Movement.id).where(Movement.created_at >= since).order_by(Movement.created_at).limit(1)
+        )
+        if first_id is None:
+            return builder.build()
+        connection = await self.db.connection()
+        result = await connection.stream(
+            select(
+                Movement.item_code,
+                func.coalesce(Movement.location_id_from, 0),
+                func.coalesce(Movement.location_id_to, 0),
+                cast(Movement.qty, Float)
+            )
+            .where(
+                Movement.id >= first_id,
+                or_(Movement.whs_code_from == whs, Movement.whs_code_to == whs)
+            )
+            .execution_options(yield_per=HISTORY_FETCH_SIZE)
+        )
+        async for rows in result.partitions(HISTORY_FETCH_SIZE):
+            builder.add(rows)
+        return builder.build()
+
+    async def plan(
+        self,
+        whs: str,
+        day: Optional[date] = None,
+        max_locations: Optional[int] = None,
+        lookback_days: int = COUNT_SCHEDULE_LOOKBACK_DAYS
+    ) -> Dict[str, Any]:
+        """Pick the day's locations and group them into count scopes"""
+        day = day or date.today()
+        since = datetime.combine(day - timedelta(days=lookback_days), datetime.min.time())
+        history = await self.load_history(whs, since)
+
+        stock = (await self.db.execute(
+            select(StockLocation.location_id, StockLocation.item_code)
+            .join(Location, Location.id == StockLocation.location_id)
+            .where(StockLocation.whs_code == whs, StockLocation.qty > 0, Location.is_active == True)
+        )).all()
+        stock_location_ids = np.array([row.location_id for row in stock], dtype=np.int64)
+        location_ids = np.unique(stock_location_ids)
+
+        last_counted = dict((await self.db.execute(
+            select(CountDetail.location_id, func.max(CountSession.created_at))
+            .join(CountSession, CountSession.id == CountDetail.session_id)
+            .where(CountSession.whs_code == whs)
+            .group_by(CountDetail.location_id)
+        )).all())
+        today = datetime.combine(day, datetime.min.time())
+        days_since_count = np.array(
+            [
+                (today - last_counted[location_id]).days if location_id in last_counted else np.inf
+                for location_id in location_ids.tolist()
+            ],
+            dtype=np.float64
+        )
+
+        classes = classify(history, location_ids, stock_location_ids, [row.item_code for row in stock])
+        location_class = classes["location_class"]
+        chosen = select_due(location_class, classes["touches"], days_since_count, max_locations=max_locations)
+
+        scopes = []
+        for class_index, class_name in enumerate(CLASS_NAMES):
+            ids = location_ids[chosen[location_class[chosen] == class_index]].tolist()
+            for start in range(0, len(ids), COUNT_SCHEDULE_SESSION_MAX_LOCATIONS):
+                scopes.append({
+                    "class": class_name,
+                    "scope": {"locations": ids[start:start + COUNT_SCHEDULE_SESSION_MAX_LOCATIONS]}
+                })
+
+        return {
+            "whs": whs,
+            "date": day.isoformat(),
+            "movements_read": len(history),
+            "locations": len(location_ids),
+            "classes": {
+                class_name: int((location_class == class_index).sum())
+                for class_index, class_name in enumerate(CLASS_NAMES)
+            },
+            "due": int((days_since_count >= np.asarray(COUNT_FREQUENCY_DAYS, dtype=np.float64)[location_class]).sum()),
+            "scheduled": len(chosen),
+            "scopes": scopes
+        }
+
+    async def schedule(
+        self,
+        whs: str,
+        user: str,
+        day: Optional[date] = None,
+        max_locations: Optional[int] = None,
+        partition_by: Optional[str] = None,
+        dry_run: bool = False
+    ) -> Dict[str, Any]:
+        """Plan the day's counts and open one count session per scope.
+
+        Every session is created in one transaction: if any scope fails,
+        none is opened, so a retry does not leave duplicate open sessions
+        for the classes that went through the first time.
+        """
+        if max_locations is not None and max_locations <= 0:
+            return {"ok": False, "error": {"code": "INVALID_SCOPE", "message": "maxLocations must be greater than 0"}}
+        if partition_by and partition_by not in PARTITION_LEVELS:
+            return {
+                "ok": False,
+                "error": {"code": "INVALID_SCOPE", "message": f"partitionBy must be one of {', '.join(PARTITION_LEVELS)}"}
+            }
+
+        try:
+            plan = await self.plan(whs, day=day, max_locations=max_locations)
+        except Exception as e:
+            logger.error(f"Count schedule failed: {str(e)}")
+            return {"ok": False, "error": {"code": "SCHEDULE_FAILED", "message": str(e)}}
+
+        if dry_run:
+            return {"ok": True, "data": plan}
+
+        opened = []
+        try:
+            for entry in plan["scopes"]:
+                location_filter = scope_location_filter(whs, entry["scope"])
+                opened.append(await self.counting.open_session(whs, location_filter, user, partition_by))
+            await self.db.commit()
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Count schedule failed: {str(e)}")
+            return {"ok": False, "error": {"code": "CREATE_COUNT_FAILED", "message": str(e)}}
+
+        sessions = []
+        for entry, session in zip(plan["scopes"], opened):
+            await self.counting.log_session_created(session, whs, entry["scope"], user, partition_by)
+            sessions.append({
+                "class": entry["class"],
+                "session_id": session["session_id"],
+                "details_created": session["details_created"],
+                "tasks": session["tasks"]
+            })
+        plan["sessions"] = sessions
+        return {"ok": True, "data": plan}
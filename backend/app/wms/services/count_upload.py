@@ -0,0 +1,115 @@
+import csv
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+
+# Accepted column/field names, first match wins.
+DETAIL_ID_FIELDS = ("detailId", "detail_id", "id")
+COUNTED_QTY_FIELDS = ("countedQty", "counted_qty", "qty")
+
+# (row number, parsed entry or None, rejection reason or None)
+ParsedRow = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+def upload_format(content_type: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    """Pick the upload format from an explicit choice or the Content-Type"""
+    if requested:
+        requested = requested.lower()
+        return requested if requested in (FORMAT_CSV, FORMAT_NDJSON) else None
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        return FORMAT_CSV
+    if content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-seq"):
+        return FORMAT_NDJSON
+    return None
+
+def parse_count_entry(detail_id: Any, counted_qty: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Validate one uploaded count, returns (entry, None) or (None, reason)"""
+    try:
+        detail_id = int(str(detail_id).strip())
+    except (TypeError, ValueError):
+        return None, f"Invalid detail id: {detail_id!r}"
+    try:
+        qty = Decimal(str(counted_qty).strip())
+    except (InvalidOperation, TypeError, ValueError):
+        return None, f"Invalid counted quantity: {counted_qty!r}"
+    if not qty.is_finite() or qty < 0:
+        return None, f"Counted quantity must be zero or positive: {counted_qty}"
+    return {"detailId": detail_id, "countedQty": float(qty)}, None
+
+async def iter_lines(chunks: AsyncIterator[bytes], encoding: str = "utf-8") -> AsyncIterator[str]:
+    """Split a byte stream into text lines without buffering the whole body"""
+    buffer = b""
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            yield line.rstrip(b"\r").decode(encoding, errors="replace")
+    if buffer:
+        yield buffer.rstrip(b"\r").decode(encoding, errors="replace")
+
+def _field_index(header: List[str], names) -> Optional[int]:
+    normalized = [column.strip().lower() for column in header]
+    for name in names:
+        if name.lower() in normalized:
+            return normalized.index(name.lower())
+    return None
+
+async def iter_csv_counts(lines: AsyncIterator[str]) -> AsyncIterator[ParsedRow]:
+    """Parse detailId,countedQty rows; a header row is optional"""
+    id_index, qty_index = 0, 1
+    row_no = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_no += 1
+        fields = next(csv.reader([line]))
+        if row_no == 1:
+            header_id = _field_index(fields, DETAIL_ID_FIELDS)
+            header_qty = _field_index(fields, COUNTED_QTY_FIELDS)
+            if header_id is not None and header_qty is not None:
+                id_index, qty_index = header_id, header_qty
+                row_no = 0
+                continue
+        if len(fields) <= max(id_index, qty_index):
+            yield row_no, None, "Expected a detail id and a counted quantity"
+            continue
+        entry, reason = parse_count_entry(fields[id_index], fields[qty_index])
+        yield row_no, entry, reason
+
+async def iter_ndjson_counts(lines: AsyncIterator[str]) -> AsyncIterator[ParsedRow]:
+    """Parse one JSON object per line"""
+    row_no = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_no += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield row_no, None, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield row_no, None, "Expected a JSON object"
+            continue
+        detail_id = next((record[name] for name in DETAIL_ID_FIELDS if name in record), None)
+        counted_qty = next((record[name] for name in COUNTED_QTY_FIELDS if name in record), None)
+        if detail_id is None or counted_qty is None:
+            yield row_no, None, "Expected detailId and countedQty"
+            continue
+        entry, reason = parse_count_entry(detail_id, counted_qty)
+        yield row_no, entry, reason
+
+def iter_upload_counts(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[ParsedRow]:
+    """Incrementally parse a scanner upload in the given format"""
+    lines = iter_lines(chunks)
+    if fmt == FORMAT_CSV:
+        return iter_csv_counts(lines)
+    return iter_ndjson_counts(lines)
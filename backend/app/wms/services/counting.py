@@ -1,114 +1,695 @@
+import os
 import logging
-from typing import Dict, Any, List
-from sqlalchemy.orm import Session
-from sqlalchemy import text, func
-from app.wms.models import CountSession, CountDetail, StockLocation, Movement
-from app.wms.services.sap_client import SAPClient
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional, AsyncIterator
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, insert, update, literal, case, or_, and_, text, bindparam, String, Integer
+from app.wms.models import CountSession, CountTask, CountDetail, StockLocation, Movement, Location
 from app.wms.services.audit import WMSAuditService
+from app.wms.services.stock_ledger import StockLedger
+from app.wms.services.sap_outbox import SapOutboxService
+from app.wms.services.count_upload import ParsedRow, parse_count_entry
 from app.wms.utils import generate_idempotency_key
 
 logger = logging.getLogger(__name__)
 
+# Counts written per UPDATE; SQL Server caps a statement at 2100 parameters
+# and each count takes 2.
+COUNT_ENTRY_BATCH_SIZE = int(os.getenv("COUNT_ENTRY_BATCH_SIZE", "1000"))
+MSSQL_COUNT_BATCH_SIZE = 1000
+# Rejected rows listed in an entry/upload response; the total is always reported.
+COUNT_UPLOAD_MAX_REJECTED_ROWS = int(os.getenv("COUNT_UPLOAD_MAX_REJECTED_ROWS", "1000"))
+
+# Differences at or below this are rounding, not variances.
+VARIANCE_TOLERANCE = 0.001
+
+# Location levels a count task covers, and which of them each partitioning uses.
+TASK_LEVELS = ("section", "aisle", "rack")
+PARTITION_LEVELS = {
+    "aisle": ("section", "aisle"),
+    "rack": ("section", "aisle", "rack"),
+}
+
+# Location hierarchy levels a scope area can filter on, outermost first.
+SCOPE_LEVELS = ("section", "aisle", "rack", "level")
+
+def code_pattern(pattern: str) -> str:
+    """Translate a `*`/`?` wildcard location code pattern to LIKE syntax"""
+    escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%").replace("?", "_")
+
+def scope_location_filter(whs: str, scope: Dict[str, Any]):
+    """Build the WHERE clause on Location that selects a count scope.
+
+    A scope is the union of any of:
+
+    * ``locations`` - explicit location ids; with ``includeChildren`` the
+      locations below them in the parent_id tree are included as well
+    * ``areas`` - hierarchy paths such as ``{"section": "SEC01", "aisle":
+      "AIS02"}``; each path level may also be a list of values
+    * ``section``/``aisle``/``rack``/``level`` - shorthand for one area
+    * ``codes`` - location code patterns with ``*`` and ``?`` wildcards
+    * ``all`` - every location of the warehouse
+
+    Raises ValueError when the scope selects nothing.
+    """
+    if scope.get("all"):
+        return Location.whs_code == whs
+
+    conditions = []
+
+    location_ids = scope.get("locations") or []
+    if location_ids:
+        if scope.get("includeChildren"):
+            tree = (
+                select(Location.id)
+                .where(Location.id.in_(location_ids))
+                .cte("scope_tree", recursive=True)
+            )
+            tree = tree.union_all(select(Location.id).where(Location.parent_id == tree.c.id))
+            conditions.append(Location.id.in_(select(tree.c.id)))
+        else:
+            conditions.append(Location.id.in_(location_ids))
+
+    areas = list(scope.get("areas") or [])
+    shorthand = {level: scope[level] for level in SCOPE_LEVELS if scope.get(level)}
+    if shorthand:
+        areas.append(shorthand)
+    for area in areas:
+        unknown = set(area) - set(SCOPE_LEVELS)
+        if unknown:
+            raise ValueError(f"Unknown scope level(s): {', '.join(sorted(unknown))}")
+        path = []
+        for level in SCOPE_LEVELS:
+            value = area.get(level)
+            if not value:
+                continue
+            column = getattr(Location, level)
+            path.append(column.in_(value) if isinstance(value, list) else column == value)
+        if not path:
+            raise ValueError("Scope area must name at least one of section, aisle, rack or level")
+        conditions.append(and_(*path))
+
+    for pattern in scope.get("codes") or []:
+        conditions.append(Location.code.like(code_pattern(pattern), escape="\\"))
+
+    if not conditions:
+        raise ValueError("Scope must list locations, areas, code patterns or set all")
+
+    return and_(Location.whs_code == whs, or_(*conditions))
+
+def variance_filter(session_id: int):
+    """Counted details of a session whose quantity differs from the snapshot"""
+    return and_(
+        CountDetail.session_id == session_id,
+        CountDetail.counted_qty.isnot(None),
+        func.abs(CountDetail.counted_qty - CountDetail.expected_qty) > VARIANCE_TOLERANCE
+    )
+
+def movement_delta(location_id, item_code, lot_no, after_id, upto_id=None):
+    """Net quantity moved into a location/item/lot by movements after after_id.
+
+    Correlates with the columns passed in; a NULL after_id (a session
+    created before high-water marks were recorded) yields 0.
+    """
+    movement = Movement.__table__
+    conditions = [
+        movement.c.id > after_id,
+        movement.c.item_code == item_code,
+        or_(movement.c.lot_no == lot_no, and_(movement.c.lot_no.is_(None), lot_no.is_(None))),
+        or_(movement.c.location_id_to == location_id, movement.c.location_id_from == location_id)
+    ]
+    if upto_id is not None:
+        conditions.append(movement.c.id <= upto_id)
+    net = (
+        case((movement.c.location_id_to == location_id, movement.c.qty), else_=0)
+        - case((movement.c.location_id_from == location_id, movement.c.qty), else_=0)
+    )
+    return func.coalesce(select(func.sum(net)).where(*conditions).scalar_subquery(), 0)
+
+def is_variance(counted_qty, expected_qty) -> bool:
+    return abs(float(counted_qty) - float(expected_qty)) > VARIANCE_TOLERANCE
+
+def task_to_dict(task: CountTask) -> Dict[str, Any]:
+    return {
+        "id": task.id,
+        "name": "/".join(part for part in (task.section, task.aisle, task.rack) if part) or "ALL",
+        "section": task.section,
+        "aisle": task.aisle,
+        "rack": task.rack,
+        "status": task.status,
+        "assigned_to": task.assigned_to,
+        "total_lines": task.total_lines,
+        "counted_lines": task.counted_lines,
+        "variance_lines": task.variance_lines,
+        "started_at": task.started_at.isoformat() if task.started_at else None,
+        "completed_at": task.completed_at.isoformat() if task.completed_at else None
+    }
+
+class CountEntryReport:
+    """Accepted/rejected tallies for a count entry, with a capped rejection list"""
+
+    def __init__(self, max_rejected_rows: int = COUNT_UPLOAD_MAX_REJECTED_ROWS):
+        self.max_rejected_rows = max_rejected_rows
+        self.accepted = 0
+        self.rejected = 0
+        self.rejected_rows: List[Dict[str, Any]] = []
+
+    def reject(self, row_no: int, detail_id: Optional[int], reason: str):
+        self.rejected += 1
+        if len(self.rejected_rows) < self.max_rejected_rows:
+            self.rejected_rows.append({"row": row_no, "detailId": detail_id, "reason": reason})
+
+    def add_batch(self, batch: Dict[int, Dict[str, Any]], rows: Dict[int, List[int]], applied: set):
+        """Tally one written batch; rows repeating a detail id count once each"""
+        for detail_id in batch:
+            row_numbers = rows.get(detail_id, [])
+            if detail_id in applied:
+                self.accepted += len(row_numbers)
+            else:
+                for row_no in row_numbers:
+                    self.reject(row_no, detail_id, "Detail is not part of this open session")
+
+    def summary(self) -> Dict[str, Any]:
+        return {"accepted": self.accepted, "rejected": self.rejected}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "rejected_rows": sorted(self.rejected_rows, key=lambda row: row["row"]),
+            "rejected_rows_truncated": self.rejected > len(self.rejected_rows)
+        }
+
 class CountingService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        self.sap_client = SAPClient()
         self.audit_service = WMSAuditService(db)
+        self.ledger = StockLedger(db)
+        self.outbox = SapOutboxService(db)
 
     async def create_count_session(
         self, 
         whs: str, 
         scope: Dict[str, Any], 
-        user: str
+        user: str,
+        partition_by: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Create new cycle count session"""
+        """Create new cycle count session.
+
+        The expected-quantity snapshot for every stocked row in scope is
+        copied into wms_count_detail with one INSERT ... SELECT, so the cost
+        does not depend on how many bins the scope covers. The session
+        records the highest movement id at snapshot time (movement_hwm) so
+        stock moved while the count runs can be replayed instead of lost.
+        See scope_location_filter for the scope format. With partition_by
+        ("aisle" or "rack") the session is split into one task per aisle
+        or rack; otherwise it has a single task.
+        """
+        if partition_by and partition_by not in PARTITION_LEVELS:
+            return {
+                "ok": False,
+                "error": {"code": "INVALID_SCOPE", "message": f"partitionBy must be one of {', '.join(PARTITION_LEVELS)}"}
+            }
         try:
-            session = CountSession(
-                whs_code=whs,
-                status="OPEN",
-                created_by=user
-            )
-            self.db.add(session)
-            self.db.flush()
-            
-            location_ids = scope.get("locations", [])
-            
-            for location_id in location_ids:
-                stock_query = text("""
-                    SELECT item_code, lot_no, qty
-                    FROM wms.stock_location
-                    WHERE location_id = :loc_id AND qty > 0
-                """)
-                
-                stock_results = self.db.execute(stock_query, {"loc_id": location_id})
-                
-                for row in stock_results:
-                    detail = CountDetail(
-                        session_id=session.id,
-                        location_id=location_id,
-                        item_code=row.item_code,
-                        lot_no=row.lot_no,
-                        expected_qty=float(row.qty),
-                        counted_qty=None,
-                        adjusted=False
-                    )
-                    self.db.add(detail)
+            location_filter = scope_location_filter(whs, scope)
+        except ValueError as e:
+            return {"ok": False, "error": {"code": "INVALID_SCOPE", "message": str(e)}}
+        
+        try:
+            opened = await self.open_session(whs, location_filter, user, partition_by)
             
-            self.db.commit()
+            await self.db.commit()
             
-            await self.audit_service.log_action(
-                user_name=user,
-                action="create_count_session",
-                payload={
-                    "session_id": session.id,
-                    "whs": whs,
-                    "scope": scope
-                }
-            )
+            await self.log_session_created(opened, whs, scope, user, partition_by)
             
-            return {"ok": True, "data": {"session_id": session.id}}
+            return {"ok": True, "data": {"session_id": opened["session_id"], "details_created": opened["details_created"], "tasks": opened["tasks"]}}
             
         except Exception as e:
+            await self.db.rollback()
             logger.error(f"Create count session failed: {str(e)}")
             return {"ok": False, "error": {"code": "CREATE_COUNT_FAILED", "message": str(e)}}
 
+    async def open_session(
+        self,
+        whs: str,
+        location_filter,
+        user: str,
+        partition_by: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Add a count session with its tasks and expected-quantity snapshot
+        in the caller's transaction, without committing; see
+        create_count_session"""
+        session = CountSession(
+            whs_code=whs,
+            status="OPEN",
+            created_by=user
+        )
+        self.db.add(session)
+        await self.db.flush()
+        session_id = session.id
+        
+        levels = PARTITION_LEVELS.get(partition_by, ())
+        in_scope = and_(
+            StockLocation.whs_code == whs,
+            StockLocation.qty > 0,
+            location_filter
+        )
+        
+        task_columns = [
+            getattr(Location, level) if level in levels else literal(None, String(32))
+            for level in TASK_LEVELS
+        ]
+        await self.db.execute(
+            insert(CountTask.__table__).from_select(
+                ["session_id", *TASK_LEVELS, "status", "total_lines", "counted_lines", "variance_lines"],
+                select(
+                    literal(session_id, CountTask.session_id.type),
+                    *task_columns,
+                    literal("OPEN", CountTask.status.type),
+                    func.count(),
+                    literal(0, Integer),
+                    literal(0, Integer)
+                )
+                .select_from(StockLocation)
+                .join(Location, Location.id == StockLocation.location_id)
+                .where(in_scope)
+                .group_by(*[getattr(Location, level) for level in levels])
+            )
+        )
+        
+        snapshot = (
+            select(
+                literal(session_id, CountDetail.session_id.type),
+                CountTask.id,
+                StockLocation.location_id,
+                StockLocation.item_code,
+                StockLocation.lot_no,
+                StockLocation.qty,
+                # Same statement as the snapshot, so the mark and the
+                # expected quantities describe the same point in time.
+                select(func.coalesce(func.max(Movement.id), 0)).scalar_subquery(),
+                literal(False, CountDetail.adjusted.type)
+            )
+            .join(Location, Location.id == StockLocation.location_id)
+            .join(CountTask, and_(
+                CountTask.session_id == session_id,
+                *[
+                    func.coalesce(getattr(CountTask, level), "") == func.coalesce(getattr(Location, level), "")
+                    for level in levels
+                ]
+            ))
+            .where(in_scope)
+            .order_by(Location.code, StockLocation.item_code, StockLocation.lot_no)
+        )
+        await self.db.execute(
+            insert(CountDetail.__table__).from_select(
+                ["session_id", "task_id", "location_id", "item_code", "lot_no", "expected_qty", "movement_hwm", "adjusted"],
+                snapshot
+            )
+        )
+        tasks, details_created = (await self.db.execute(
+            select(func.count(), func.coalesce(func.sum(CountTask.total_lines), 0))
+            .where(CountTask.session_id == session_id)
+        )).one()
+        movement_hwm = await self.db.scalar(
+            select(func.min(CountDetail.movement_hwm)).where(CountDetail.session_id == session_id)
+        )
+        if movement_hwm is None:
+            movement_hwm = await self.db.scalar(select(func.coalesce(func.max(Movement.id), 0)))
+        session.movement_hwm = movement_hwm
+        
+        return {"session_id": session_id, "details_created": details_created, "tasks": tasks, "movement_hwm": movement_hwm}
+
+    async def log_session_created(self, opened: Dict[str, Any], whs: str, scope: Dict[str, Any], user: str, partition_by: Optional[str] = None):
+        await self.audit_service.log_action(
+            user_name=user,
+            action="create_count_session",
+            payload={
+                "session_id": opened["session_id"],
+                "whs": whs,
+                "scope": scope,
+                "partition_by": partition_by,
+                "tasks": opened["tasks"],
+                "details_created": opened["details_created"],
+                "movement_hwm": opened["movement_hwm"]
+            }
+        )
+
     async def enter_counts(
         self, 
         session_id: int, 
         counts: List[Dict[str, Any]], 
         user: str
     ) -> Dict[str, Any]:
-        """Enter counted quantities"""
+        """Enter counted quantities with one UPDATE per batch of details"""
         try:
-            session = self.db.query(CountSession).filter(CountSession.id == session_id).first()
+            session = await self.db.scalar(select(CountSession).where(CountSession.id == session_id))
             if not session or session.status != "OPEN":
                 return {"ok": False, "error": {"code": "INVALID_SESSION", "message": "Session not found or not open"}}
             
-            for count in counts:
-                detail_id = count["detailId"]
-                counted_qty = float(count["countedQty"])
-                
-                detail = self.db.query(CountDetail).filter(CountDetail.id == detail_id).first()
-                if detail:
-                    detail.counted_qty = counted_qty
+            report = CountEntryReport()
+            rows: Dict[int, List[int]] = {}
+            entries: Dict[int, Dict[str, Any]] = {}
+            for row_no, count in enumerate(counts, start=1):
+                entry, reason = parse_count_entry(count["detailId"], count["countedQty"])
+                if reason is not None:
+                    report.reject(row_no, count["detailId"], reason)
+                    continue
+                rows.setdefault(entry["detailId"], []).append(row_no)
+                entries[entry["detailId"]] = entry
+            
+            batch_size = self._count_batch_size
+            detail_ids = list(entries)
+            for start in range(0, len(detail_ids), batch_size):
+                batch = {detail_id: entries[detail_id] for detail_id in detail_ids[start:start + batch_size]}
+                applied = await self._write_counts(session_id, list(batch.values()))
+                report.add_batch(batch, rows, applied)
             
-            self.db.commit()
+            await self.db.commit()
             
             await self.audit_service.log_action(
                 user_name=user,
                 action="enter_counts",
                 payload={
                     "session_id": session_id,
-                    "counts": counts
+                    "source": "api",
+                    **report.summary()
                 }
             )
             
-            return {"ok": True, "data": {"counts_entered": len(counts)}}
+            return {"ok": True, "data": {"counts_entered": report.accepted, **report.as_dict()}}
             
         except Exception as e:
+            await self.db.rollback()
             logger.error(f"Enter counts failed: {str(e)}")
             return {"ok": False, "error": {"code": "ENTER_COUNTS_FAILED", "message": str(e)}}
 
+    async def upload_counts(
+        self, 
+        session_id: int, 
+        rows: AsyncIterator[ParsedRow], 
+        user: str,
+        source: str
+    ) -> Dict[str, Any]:
+        """Enter counts from a streamed scanner upload.
+
+        Rows are consumed as they are parsed and written one batch at a
+        time, each batch in its own short transaction, so neither memory
+        nor lock time grows with the size of the upload. Counts are plain
+        overwrites, so a failed upload can simply be sent again.
+        """
+        report = CountEntryReport()
+        try:
+            session = await self.db.scalar(select(CountSession).where(CountSession.id == session_id))
+            if not session or session.status != "OPEN":
+                return {"ok": False, "error": {"code": "INVALID_SESSION", "message": "Session not found or not open"}}
+            await self.db.commit()
+            
+            batch_size = self._count_batch_size
+            batch: Dict[int, Dict[str, Any]] = {}
+            batch_rows: Dict[int, List[int]] = {}
+            
+            async def flush():
+                applied = await self._write_counts(session_id, list(batch.values()))
+                await self.db.commit()
+                report.add_batch(batch, batch_rows, applied)
+                batch.clear()
+                batch_rows.clear()
+            
+            async for row_no, entry, reason in rows:
+                if reason is not None:
+                    report.reject(row_no, None, reason)
+                    continue
+                batch[entry["detailId"]] = entry
+                batch_rows.setdefault(entry["detailId"], []).append(row_no)
+                if len(batch) >= batch_size:
+                    await flush()
+            if batch:
+                await flush()
+            
+            await self.audit_service.log_action(
+                user_name=user,
+                action="upload_counts",
+                payload={
+                    "session_id": session_id,
+                    "source": source,
+                    **report.summary()
+                }
+            )
+            
+            return {"ok": True, "data": {"counts_entered": report.accepted, **report.as_dict()}}
+            
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Upload counts failed: {str(e)}")
+            return {
+                "ok": False,
+                "data": report.as_dict(),
+                "error": {"code": "UPLOAD_COUNTS_FAILED", "message": str(e)}
+            }
+
+    async def get_progress(self, session_id: int) -> Dict[str, Any]:
+        """Session progress summed from its task counters (no detail scan)"""
+        session = await self.db.scalar(select(CountSession).where(CountSession.id == session_id))
+        if not session:
+            return {"ok": False, "error": {"code": "INVALID_SESSION", "message": "Session not found"}}
+        
+        tasks, tasks_done, total, counted, variance = (await self.db.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(case((CountTask.status == "DONE", 1), else_=0)), 0),
+                func.coalesce(func.sum(CountTask.total_lines), 0),
+                func.coalesce(func.sum(CountTask.counted_lines), 0),
+                func.coalesce(func.sum(CountTask.variance_lines), 0)
+            ).where(CountTask.session_id == session_id)
+        )).one()
+        
+        return {
+            "ok": True,
+            "data": {
+                "session_id": session_id,
+                "status": session.status,
+                "tasks": tasks,
+                "tasks_done": tasks_done,
+                "total_lines": total,
+                "counted_lines": counted,
+                "variance_lines": variance,
+                "percent_counted": round(100.0 * counted / total, 1) if total else 100.0
+            }
+        }
+
+    async def list_tasks(self, session_id: int) -> List[Dict[str, Any]]:
+        tasks = (await self.db.scalars(
+            select(CountTask).where(CountTask.session_id == session_id).order_by(CountTask.id)
+        )).all()
+        return [task_to_dict(task) for task in tasks]
+
+    async def claim_task(self, session_id: int, task_id: int, user: str) -> Dict[str, Any]:
+        """Assign an unassigned task to the operator; claiming one's own task again is a no-op"""
+        try:
+            result = await self.db.execute(
+                update(CountTask)
+                .where(
+                    CountTask.id == task_id,
+                    CountTask.session_id == session_id,
+                    CountTask.status != "DONE",
+                    or_(CountTask.assigned_to.is_(None), CountTask.assigned_to == user)
+                )
+                .values(
+                    assigned_to=user,
+                    status=case((CountTask.status == "OPEN", "IN_PROGRESS"), else_=CountTask.status),
+                    started_at=func.coalesce(CountTask.started_at, func.now())
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+            
+            task = await self.db.scalar(
+                select(CountTask).where(CountTask.id == task_id, CountTask.session_id == session_id)
+                .execution_options(populate_existing=True)
+            )
+            if task is None:
+                return {"ok": False, "error": {"code": "TASK_NOT_FOUND", "message": "Count task not found"}}
+            if result.rowcount != 1:
+                if task.status == "DONE":
+                    return {"ok": False, "error": {"code": "TASK_DONE", "message": "Count task is already completed"}}
+                return {
+                    "ok": False,
+                    "error": {"code": "TASK_ASSIGNED", "message": f"Count task is assigned to {task.assigned_to}"}
+                }
+            
+            await self.audit_service.log_action(
+                user_name=user,
+                action="claim_count_task",
+                payload={"session_id": session_id, "task_id": task_id}
+            )
+            
+            return {"ok": True, "data": task_to_dict(task)}
+            
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Claim count task failed: {str(e)}")
+            return {"ok": False, "error": {"code": "CLAIM_TASK_FAILED", "message": str(e)}}
+
+    async def complete_task(self, session_id: int, task_id: int, user: str) -> Dict[str, Any]:
+        """Mark a task as counted"""
+        try:
+            result = await self.db.execute(
+                update(CountTask)
+                .where(
+                    CountTask.id == task_id,
+                    CountTask.session_id == session_id,
+                    CountTask.status != "DONE"
+                )
+                .values(
+                    status="DONE",
+                    assigned_to=func.coalesce(CountTask.assigned_to, user),
+                    completed_at=func.now()
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+            
+            task = await self.db.scalar(
+                select(CountTask).where(CountTask.id == task_id, CountTask.session_id == session_id)
+                .execution_options(populate_existing=True)
+            )
+            if task is None:
+                return {"ok": False, "error": {"code": "TASK_NOT_FOUND", "message": "Count task not found"}}
+            if result.rowcount != 1:
+                return {"ok": False, "error": {"code": "TASK_DONE", "message": "Count task is already completed"}}
+            
+            await self.audit_service.log_action(
+                user_name=user,
+                action="complete_count_task",
+                payload={
+                    "session_id": session_id,
+                    "task_id": task_id,
+                    "counted_lines": task.counted_lines,
+                    "total_lines": task.total_lines
+                }
+            )
+            
+            return {"ok": True, "data": task_to_dict(task)}
+            
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Complete count task failed: {str(e)}")
+            return {"ok": False, "error": {"code": "COMPLETE_TASK_FAILED", "message": str(e)}}
+
+    @property
+    def _count_batch_size(self) -> int:
+        if self.db.bind.dialect.name == "mssql":
+            return min(COUNT_ENTRY_BATCH_SIZE, MSSQL_COUNT_BATCH_SIZE)
+        return COUNT_ENTRY_BATCH_SIZE
+
+    async def _write_counts(self, session_id: int, entries: List[Dict[str, Any]]) -> set:
+        """Set counted_qty for one batch of details, returns the ids updated.
+
+        Ids that do not belong to the session, or arrive after the session
+        was closed, are not updated. Each counted detail's expected_qty is
+        rolled forward by the movements posted against its location since
+        its movement_hwm, so it is the book quantity at the moment of the
+        count and only later movements are replayed at apply time. The
+        tasks' counted/variance counters are moved by the difference
+        between each detail's old and new state, so they stay exact
+        without re-reading the task's details.
+        """
+        if not entries:
+            return set()
+        preparer = self.db.bind.dialect.identifier_preparer
+        table = preparer.format_table(CountDetail.__table__)
+        session_table = preparer.format_table(CountSession.__table__)
+        movement_table = preparer.format_table(Movement.__table__)
+        
+        movement_hwm = await self.db.scalar(select(func.coalesce(func.max(Movement.id), 0)))
+        params: Dict[str, Any] = {"session_id": session_id, "movement_hwm": movement_hwm}
+        values = []
+        for n, entry in enumerate(entries):
+            params[f"d{n}"] = entry["detailId"]
+            params[f"q{n}"] = entry["countedQty"]
+            values.append(f"(:d{n}, :q{n})")
+        
+        open_session = f"EXISTS (SELECT 1 FROM {session_table} WHERE id = :session_id AND status = 'OPEN')"
+        
+        def roll_forward(detail: str) -> str:
+            """SET clauses moving expected_qty up to :movement_hwm"""
+            return f"""
+                expected_qty = {detail}.expected_qty + COALESCE((
+                    SELECT SUM(CASE WHEN m.location_id_to = {detail}.location_id THEN m.qty ELSE 0 END
+                             - CASE WHEN m.location_id_from = {detail}.location_id THEN m.qty ELSE 0 END)
+                    FROM {movement_table} AS m
+                    WHERE m.id > {detail}.movement_hwm AND m.id <= :movement_hwm
+                      AND m.item_code = {detail}.item_code
+                      AND (m.lot_no = {detail}.lot_no OR (m.lot_no IS NULL AND {detail}.lot_no IS NULL))
+                      AND (m.location_id_to = {detail}.location_id OR m.location_id_from = {detail}.location_id)
+                ), 0),
+                movement_hwm = CASE WHEN {detail}.movement_hwm IS NULL THEN NULL ELSE :movement_hwm END
+            """
+        
+        if self.db.bind.dialect.name == "mssql":
+            statement = f"""
+                UPDATE d SET counted_qty = s.counted_qty, {roll_forward("d")}
+                OUTPUT inserted.id, inserted.task_id,
+                       deleted.counted_qty AS old_qty, deleted.expected_qty AS old_expected,
+                       inserted.counted_qty AS new_qty, inserted.expected_qty AS new_expected
+                FROM {table} AS d
+                JOIN (VALUES {", ".join(values)}) AS s (id, counted_qty) ON d.id = s.id
+                WHERE d.session_id = :session_id AND {open_session}
+            """
+            rows = (await self.db.execute(text(statement), params)).fetchall()
+        else:
+            # RETURNING only sees new values on SQLite; read the old state first.
+            old_state = {
+                row.id: row
+                for row in (await self.db.execute(
+                    select(CountDetail.id, CountDetail.counted_qty, CountDetail.expected_qty).where(
+                        CountDetail.session_id == session_id,
+                        CountDetail.id.in_([entry["detailId"] for entry in entries])
+                    )
+                )).all()
+            }
+            statement = f"""
+                WITH s (id, counted_qty) AS (VALUES {", ".join(values)})
+                UPDATE {table} SET counted_qty = s.counted_qty, {roll_forward(table)}
+                FROM s
+                WHERE {table}.id = s.id AND {table}.session_id = :session_id AND {open_session}
+                RETURNING {table}.id, {table}.task_id, {table}.counted_qty AS new_qty, {table}.expected_qty AS new_expected
+            """
+            rows = [
+                SimpleNamespace(
+                    id=row.id, task_id=row.task_id,
+                    old_qty=old_state[row.id].counted_qty, old_expected=old_state[row.id].expected_qty,
+                    new_qty=row.new_qty, new_expected=row.new_expected
+                )
+                for row in (await self.db.execute(text(statement), params)).fetchall()
+            ]
+        
+        deltas: Dict[int, List[int]] = {}
+        for row in rows:
+            if row.task_id is None:
+                continue
+            delta = deltas.setdefault(row.task_id, [0, 0])
+            was_counted = row.old_qty is not None
+            delta[0] += 0 if was_counted else 1
+            delta[1] += is_variance(row.new_qty, row.new_expected) - (was_counted and is_variance(row.old_qty, row.old_expected))
+        
+        if deltas:
+            await self.db.execute(
+                update(CountTask.__table__)
+                .where(CountTask.__table__.c.id == bindparam("task"))
+                .values(
+                    counted_lines=CountTask.__table__.c.counted_lines + bindparam("counted"),
+                    variance_lines=CountTask.__table__.c.variance_lines + bindparam("variance"),
+                    status=case((CountTask.__table__.c.status == "OPEN", "IN_PROGRESS"), else_=CountTask.__table__.c.status),
+                    started_at=func.coalesce(CountTask.__table__.c.started_at, func.now())
+                ),
+                [{"task": task_id, "counted": counted, "variance": variance} for task_id, (counted, variance) in deltas.items()]
+            )
+        
+        return {row.id for row in rows}
+
     async def apply_count_adjustments(
         self, 
         session_id: int, 
@@ -116,101 +697,138 @@ class CountingService:
         comment: str, 
         user: str
     ) -> Dict[str, Any]:
-        """Apply count adjustments and create SAP documents if needed"""
+        """Apply count adjustments and queue SAP documents if needed.
+
+        Variances are computed in SQL and applied with a fixed number of
+        statements whatever the session size: the session is closed with a
+        conditional UPDATE (so two concurrent applies cannot both run),
+        stock is set from the counted quantities in one upsert, the
+        ADJUST_POS/ADJUST_NEG movements are inserted with INSERT ... SELECT
+        and the details are flagged adjusted. SAP lines are summed per
+        item and lot.
+
+        Counts can be taken during a live shift: expected_qty is the book
+        quantity when the detail was counted (see _write_counts), so the
+        variance is counted - expected_qty and the new stock is the
+        counted quantity plus the movements posted since the count.
+        """
         try:
             idempotency_key = generate_idempotency_key()
+            reference = f"COUNT-{session_id}-{comment}"
             
-            with self.db.begin():
-                session = self.db.query(CountSession).filter(CountSession.id == session_id).first()
-                if not session or session.status != "OPEN":
+            async with self.db.begin():
+                closed = await self.db.execute(
+                    update(CountSession)
+                    .where(CountSession.id == session_id, CountSession.status == "OPEN")
+                    .values(status="CLOSED", closed_at=func.now())
+                )
+                if closed.rowcount != 1:
                     return {"ok": False, "error": {"code": "INVALID_SESSION", "message": "Session not found or not open"}}
                 
-                details = self.db.query(CountDetail).filter(CountDetail.session_id == session_id).all()
-                adjustments = []
+                whs = await self.db.scalar(select(CountSession.whs_code).where(CountSession.id == session_id))
+                variance = variance_filter(session_id)
                 
-                for detail in details:
-                    if detail.counted_qty is not None:
-                        diff = float(detail.counted_qty) - float(detail.expected_qty)
-                        
-                        if abs(diff) > 0.001:
-                            update_query = text("""
-                                UPDATE wms.stock_location
-                                   SET qty = :new_qty, last_updated = SYSUTCDATETIME()
-                                 WHERE location_id = :loc_id AND item_code = :item
-                                   AND ISNULL(lot_no, '') = ISNULL(:lot, '')
-                            """)
-                            
-                            self.db.execute(update_query, {
-                                "new_qty": detail.counted_qty,
-                                "loc_id": detail.location_id,
-                                "item": detail.item_code,
-                                "lot": detail.lot_no
-                            })
-                            
-                            movement_type = "ADJUST_POS" if diff > 0 else "ADJUST_NEG"
-                            movement = Movement(
-                                type=movement_type,
-                                whs_code_to=session.whs_code if diff > 0 else None,
-                                whs_code_from=session.whs_code if diff < 0 else None,
-                                location_id_to=detail.location_id if diff > 0 else None,
-                                location_id_from=detail.location_id if diff < 0 else None,
-                                item_code=detail.item_code,
-                                lot_no=detail.lot_no,
-                                qty=abs(diff),
-                                reference=f"COUNT-{session_id}-{comment}",
-                                idempotency_key=idempotency_key,
-                                created_by=user
-                            )
-                            self.db.add(movement)
-                            
-                            detail.adjusted = True
-                            adjustments.append({
-                                "item": detail.item_code,
-                                "lot": detail.lot_no,
-                                "diff": diff,
-                                "type": movement_type
-                            })
-                
-                if create_sap_adjustments and adjustments:
-                    positive_lines = [adj for adj in adjustments if adj["diff"] > 0]
-                    negative_lines = [adj for adj in adjustments if adj["diff"] < 0]
-                    
-                    if positive_lines:
-                        sap_lines = [
-                            {
-                                "item": adj["item"],
-                                "qty": abs(adj["diff"]),
-                                "lot": adj["lot"]
-                            }
-                            for adj in positive_lines
-                        ]
-                        
-                        await self.sap_client.good_receipt(
-                            whs=session.whs_code,
-                            reference=f"COUNT-ADJ-{session_id}",
-                            lines=sap_lines,
-                            idempotency_key=f"{idempotency_key}-POS"
-                        )
-                    
-                    if negative_lines:
-                        sap_lines = [
-                            {
-                                "item": adj["item"],
-                                "qty": abs(adj["diff"]),
-                                "lot": adj["lot"]
-                            }
-                            for adj in negative_lines
-                        ]
-                        
-                        await self.sap_client.good_issue(
-                            whs=session.whs_code,
-                            reference=f"COUNT-ADJ-{session_id}",
-                            lines=sap_lines,
-                            idempotency_key=f"{idempotency_key}-NEG"
+                stock_rows = await self.ledger.set_quantity_from(
+                    select(
+                        literal(whs, StockLocation.whs_code.type),
+                        CountDetail.location_id,
+                        CountDetail.item_code,
+                        CountDetail.lot_no,
+                        CountDetail.counted_qty + movement_delta(
+                            CountDetail.location_id,
+                            CountDetail.item_code,
+                            CountDetail.lot_no,
+                            CountDetail.movement_hwm
                         )
+                    ).where(variance)
+                )
+                
+                diff = CountDetail.counted_qty - CountDetail.expected_qty
+                positive = diff > 0
+                movements = await self.db.execute(
+                    insert(Movement.__table__).from_select(
+                        [
+                            "type", "whs_code_to", "whs_code_from", "location_id_to", "location_id_from",
+                            "item_code", "lot_no", "qty", "reference", "idempotency_key", "created_by"
+                        ],
+                        select(
+                            case((positive, "ADJUST_POS"), else_="ADJUST_NEG"),
+                            case((positive, whs), else_=None),
+                            case((positive, None), else_=whs),
+                            case((positive, CountDetail.location_id), else_=None),
+                            case((positive, None), else_=CountDetail.location_id),
+                            CountDetail.item_code,
+                            CountDetail.lot_no,
+                            func.abs(diff),
+                            literal(reference, Movement.reference.type),
+                            literal(idempotency_key, Movement.idempotency_key.type),
+                            literal(user, Movement.created_by.type)
+                        ).where(variance)
+                    )
+                )
                 
-                session.status = "CLOSED"
-                session.closed_at = func.now()
+                await self.db.execute(
+                    update(CountDetail).where(variance).values(adjusted=True),
+                    execution_options={"synchronize_session": False}
+                )
+                await self.db.execute(
+                    update(CountTask)
+                    .where(CountTask.session_id == session_id, CountTask.status != "DONE")
+                    .values(status="DONE", completed_at=func.now()),
+                    execution_options={"synchronize_session": False}
+                )
+                
+                sap_lines = (await self.db.execute(
+                    select(
+                        positive.label("positive"),
+                        CountDetail.item_code,
+                        CountDetail.lot_no,
+                        func.sum(func.abs(diff)).label("qty"),
+                        func.count().label("details")
+                    )
+                    .where(variance)
+                    .group_by(positive, CountDetail.item_code, CountDetail.lot_no)
+                    .order_by(CountDetail.item_code, CountDetail.lot_no)
+                )).all()
+                adjustments = sum(line.details for line in sap_lines)
+                positive_lines = [
+                    {"item": line.item_code, "qty": float(line.qty), "lot": line.lot_no}
+                    for line in sap_lines if line.positive
+                ]
+                negative_lines = [
+                    {"item": line.item_code, "qty": float(line.qty), "lot": line.lot_no}
+                    for line in sap_lines if not line.positive
+                ]
+                
+                if create_sap_adjustments and positive_lines:
+                    self.outbox.enqueue(
+                        doc_type="GoodReceipt",
+                        whs=whs,
+                        payload={
+                            "whs": whs,
+                            "reference": f"COUNT-ADJ-{session_id}",
+                            "lines": positive_lines
+                        },
+                        idempotency_key=f"{idempotency_key}-POS",
+                        user=user,
+                        movement_key=idempotency_key,
+                        movement_type="ADJUST_POS"
+                    )
+                
+                if create_sap_adjustments and negative_lines:
+                    self.outbox.enqueue(
+                        doc_type="GoodIssue",
+                        whs=whs,
+                        payload={
+                            "whs": whs,
+                            "reference": f"COUNT-ADJ-{session_id}",
+                            "lines": negative_lines
+                        },
+                        idempotency_key=f"{idempotency_key}-NEG",
+                        user=user,
+                        movement_key=idempotency_key,
+                        movement_type="ADJUST_NEG"
+                    )
                 
                 await self.audit_service.log_action(
                     user_name=user,
@@ -218,14 +836,17 @@ class CountingService:
                     payload={
                         "session_id": session_id,
                         "adjustments": adjustments,
+                        "movements_created": movements.rowcount,
+                        "stock_rows_updated": stock_rows,
+                        "positive_lines": len(positive_lines),
+                        "negative_lines": len(negative_lines),
                         "create_sap_adjustments": create_sap_adjustments,
                         "comment": comment,
                         "idempotency_key": idempotency_key
                     }
                 )
                 
-                return {"ok": True, "data": {"adjustments_applied": len(adjustments)}}
+                return {"ok": True, "data": {"adjustments_applied": adjustments}}
                 
         except Exception as e:
             logger.error(f"Apply count adjustments failed: {str(e)}")
-            return {"ok": False, "error": {"code": "APPLY_ADJUSTMENTS_FAILED", "message": str(e)}}
@@ -0,0 +1,339 @@
+import os
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.wms.models import IdempotencyRecord
+from app.wms.utils import hash_payload
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# How long a duplicate waits on a claim held by another process, and how old
+# an IN_PROGRESS claim must be before it is treated as abandoned.
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+IDEMPOTENCY_POLL_SECONDS = 0.1
+# How often rows older than the TTL are deleted from wms_idempotency_key.
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "3600"))
+
+STATUS_IN_PROGRESS = "IN_PROGRESS"
+STATUS_COMPLETED = "COMPLETED"
+
+Operation = Callable[[], Awaitable[Dict[str, Any]]]
+
+class IdempotencyStore:
+    """Response replay store for operations that accept an Idempotency-Key.
+
+    The first request for an (endpoint, key) pair claims a row in
+    wms_idempotency_key and runs the operation; a successful response is
+    saved on the row and in a bounded in-process LRU. Later requests with
+    the same key get the saved response back without re-running anything.
+    A duplicate that arrives while the first one is still running waits on
+    it: in-process through a shared future, across processes by polling the
+    claimed row. Failed responses are not stored, so the client may retry.
+
+    Bookkeeping runs in its own short sessions on the request's engine, so
+    the operation keeps full control of the request session's transaction.
+    """
+
+    def __init__(self, cache_size: int = IDEMPOTENCY_CACHE_SIZE, ttl_hours: float = IDEMPOTENCY_TTL_HOURS):
+        self.cache_size = cache_size
+        self.ttl = timedelta(hours=ttl_hours)
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[str, datetime, Dict[str, Any]]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+        self.stats = {"executed": 0, "replayed": 0, "waited": 0}
+
+    async def run(
+        self,
+        db: AsyncSession,
+        endpoint: str,
+        key: Optional[str],
+        payload: Dict[str, Any],
+        user: str,
+        operation: Operation
+    ) -> Dict[str, Any]:
+        """Run operation once per (endpoint, key) and replay its response"""
+        if not key:
+            return await operation()
+
+        request_hash = hash_payload(payload)
+        cache_key = (endpoint, key)
+
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            cached_hash, response = cached
+            if cached_hash != request_hash:
+                return self._key_reused(key)
+            self.stats["replayed"] += 1
+            return response
+
+        in_flight = self._in_flight.get(cache_key)
+        if in_flight is not None:
+            in_flight_hash, future = in_flight
+            if in_flight_hash != request_hash:
+                return self._key_reused(key)
+            self.stats["waited"] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting; retrieve the exception so it is not reported
+        # as never retrieved.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[cache_key] = (request_hash, future)
+        try:
+            result = await self._run_claimed(db, endpoint, key, request_hash, user, operation)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._in_flight.pop(cache_key, None)
+
+    async def _run_claimed(
+        self,
+        db: AsyncSession,
+        endpoint: str,
+        key: str,
+        request_hash: str,
+        user: str,
+        operation: Operation
+    ) -> Dict[str, Any]:
+        stored = await self._claim(db, endpoint, key, request_hash, user)
+        if stored is not None:
+            self.stats["replayed"] += 1
+            return stored
+
+        self.stats["executed"] += 1
+        try:
+            result = await operation()
+        except BaseException:
+            await self._release(db, endpoint, key)
+            raise
+
+        if result.get("ok"):
+            await self._complete(db, endpoint, key, result)
+            self._cache_put((endpoint, key), request_hash, result)
+        else:
+            await self._release(db, endpoint, key)
+        return result
+
+    async def _claim(
+        self,
+        db: AsyncSession,
+        endpoint: str,
+        key: str,
+        request_hash: str,
+        user: str
+    ) -> Optional[Dict[str, Any]]:
+        """Insert the IN_PROGRESS row, or return the response already stored.
+
+        Returns None once this request owns the claim.
+        """
+        deadline = datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_WAIT_SECONDS)
+
+        async with AsyncSession(db.bind, expire_on_commit=False) as session:
+            while True:
+                now = datetime.utcnow()
+                record = await session.scalar(select(IdempotencyRecord).where(
+                    IdempotencyRecord.endpoint == endpoint,
+                    IdempotencyRecord.idempotency_key == key
+                ))
+
+                if record is not None and self._is_stale(record, now):
+                    await session.execute(delete(IdempotencyRecord).where(
+                        IdempotencyRecord.id == record.id,
+                        IdempotencyRecord.status == record.status,
+                        IdempotencyRecord.created_at == record.created_at
+                    ))
+                    await session.commit()
+                    record = None
+
+                if record is None:
+                    session.add(IdempotencyRecord(
+                        endpoint=endpoint,
+                        idempotency_key=key,
+                        request_hash=request_hash,
+                        status=STATUS_IN_PROGRESS,
+                        created_by=user,
+                        created_at=now
+                    ))
+                    try:
+                        await session.commit()
+                        return None
+                    except IntegrityError:
+                        # Another process claimed the key between the select
+                        # and the insert; wait on its row instead.
+                        await session.rollback()
+                        continue
+
+                if record.request_hash != request_hash:
+                    return self._key_reused(key)
+
+                if record.status == STATUS_COMPLETED:
+                    response = json.loads(record.response)
+                    self._cache_put((endpoint, key), request_hash, response, record.created_at)
+                    return response
+
+                if now >= deadline:
+                    return {
+                        "ok": False,
+                        "error": {
+                            "code": "IDEMPOTENCY_KEY_IN_PROGRESS",
+                            "message": f"A request with Idempotency-Key {key} is still being processed"
+                        }
+                    }
+
+                session.expunge(record)
+                await session.rollback()
+                await asyncio.sleep(IDEMPOTENCY_POLL_SECONDS)
+
+    async def _complete(self, db: AsyncSession, endpoint: str, key: str, result: Dict[str, Any]):
+        async with AsyncSession(db.bind) as session:
+            await session.execute(
+                update(IdempotencyRecord)
+                .where(
+                    IdempotencyRecord.endpoint == endpoint,
+                    IdempotencyRecord.idempotency_key == key
+                )
+                .values(
+                    status=STATUS_COMPLETED,
+                    response=json.dumps(result, default=str),
+                    completed_at=datetime.utcnow()
+                )
+            )
+            await session.commit()
+
+    async def _release(self, db: AsyncSession, endpoint: str, key: str):
+        """Drop an unfinished claim so the client can retry with the same key"""
+        try:
+            async with AsyncSession(db.bind) as session:
+                await session.execute(delete(IdempotencyRecord).where(
+                    IdempotencyRecord.endpoint == endpoint,
+                    IdempotencyRecord.idempotency_key == key,
+                    IdempotencyRecord.status == STATUS_IN_PROGRESS
+                ))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Failed to release idempotency key {endpoint}/{key}: {str(e)}")
+
+    async def purge_expired(self, db: AsyncSession) -> int:
+        """Delete stored responses older than the TTL"""
+        cutoff = datetime.utcnow() - self.ttl
+        async with AsyncSession(db.bind) as session:
+            result = await session.execute(
+                delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff)
+            )
+            await session.commit()
+        return result.rowcount
+
+    def _is_stale(self, record: IdempotencyRecord, now: datetime) -> bool:
+        if record.status == STATUS_IN_PROGRESS:
+            return record.created_at < now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+        return record.created_at < now - self.ttl
+
+    def _cache_get(self, cache_key: Tuple[str, str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+        entry = self._cache.get(cache_key)
+        if entry is None:
+            return None
+        request_hash, created_at, response = entry
+        if created_at < datetime.utcnow() - self.ttl:
+            del self._cache[cache_key]
+            return None
+        self._cache.move_to_end(cache_key)
+        return request_hash, response
+
+    def _cache_put(
+        self,
+        cache_key: Tuple[str, str],
+        request_hash: str,
+        response: Dict[str, Any],
+        created_at: Optional[datetime] = None
+    ):
+        if self.cache_size <= 0:
+            return
+        self._cache[cache_key] = (request_hash, created_at or datetime.utcnow(), response)
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _key_reused(self, key: str) -> Dict[str, Any]:
+        return {
+            "ok": False,
+            "error": {
+                "code": "IDEMPOTENCY_KEY_REUSED",
+                "message": f"Idempotency-Key {key} was already used with a different request"
+            }
+        }
+
+idempotency_store = IdempotencyStore()
+
+class IdempotencyPurgeJob:
+    """Background task that deletes expired idempotency keys, and the
+    responses stored on them, every IDEMPOTENCY_PURGE_INTERVAL_SECONDS"""
+
+    def __init__(self, store: Optional[IdempotencyStore] = None, session_factory=None, interval: float = IDEMPOTENCY_PURGE_INTERVAL_SECONDS):
+        self.store = store or idempotency_store
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.interval = interval
+        self.stats = {"runs": 0, "purged": 0, "failed": 0, "last_run": None}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Idempotency purge job started")
+
+    async def stop(self, timeout: float = 10.0):
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+        logger.info("Idempotency purge job stopped")
+
+    async def _run(self):
+        while not self._stopping:
+            await self.run_once()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def run_once(self) -> int:
+        try:
+            async with self.session_factory() as db:
+                purged = await self.store.purge_expired(db)
+            self.stats["runs"] += 1
+            self.stats["purged"] += purged
+            self.stats["last_run"] = datetime.utcnow()
+            if purged:
+                logger.info(f"Purged {purged} expired idempotency keys")
+            return purged
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Idempotency purge failed: {str(e)}")
+            return 0
+
+idempotency_purge_job = IdempotencyPurgeJob()
@@ -0,0 +1,236 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, Iterable
+from app.wms.utils import hash_payload
+
+logger = logging.getLogger(__name__)
+
+LABEL_CACHE_SIZE = int(os.getenv("LABEL_CACHE_SIZE", "4096"))
+LABEL_CACHE_MAX_MB = float(os.getenv("LABEL_CACHE_MAX_MB", "64"))
+# Directory of the on-disk tier; empty keeps the cache in memory only.
+LABEL_CACHE_DIR = os.getenv("LABEL_CACHE_DIR", "")
+LABEL_CACHE_DISK_MAX_MB = float(os.getenv("LABEL_CACHE_DISK_MAX_MB", "512"))
+# Bump when the label layout changes, so rendered labels from the old layout stop matching.
+LABEL_LAYOUT_VERSION = 1
+
+class LabelCache:
+    """Content-addressed cache of rendered labels.
+
+    The key is a hash of everything a label prints (label_fields, or the
+    values bound into a ZPL template) plus the format, the template version
+    and LABEL_LAYOUT_VERSION, so a label is only ever served for
+    exactly the content it was rendered from: a changed location or
+    warehouse name simply produces a new key. Entries live in an LRU
+    bounded by count and bytes; with a directory configured, they are also
+    written to a disk tier that outlives restarts and is shared by every
+    process on the host. Disk reads and writes run in a worker thread, and
+    the tier is pruned oldest-first past its size limit by a background
+    task, never inside a request. Callers skip the disk tier for labels
+    that render faster than a file write.
+
+    invalidate_location drops the entries rendered for a location when it
+    is updated, so superseded labels do not hold memory until they age out.
+    Only entries still in memory are tracked per location; evicted ones
+    are forgotten with them.
+    """
+
+    def __init__(
+        self,
+        size: int = LABEL_CACHE_SIZE,
+        max_bytes: int = int(LABEL_CACHE_MAX_MB * 1024 * 1024),
+        directory: str = LABEL_CACHE_DIR,
+        disk_max_bytes: int = int(LABEL_CACHE_DISK_MAX_MB * 1024 * 1024)
+    ):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._by_location: Dict[int, Set[str]] = {}
+        self._location_of: Dict[str, int] = {}
+        self._disk_bytes: Optional[int] = None
+        self._pruning: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "disk_errors": 0}
+
+    def key(self, fields: Dict[str, Any], format: str, template: Optional[str] = None) -> str:
+        return hash_payload({"fields": fields, "format": format, "layout": LABEL_LAYOUT_VERSION, "template": template})
+
+    async def get(self, key: str, disk: bool = True) -> Optional[bytes]:
+        content = self._entries.get(key)
+        if content is not None:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return content
+
+        content = await asyncio.to_thread(self._disk_get, key) if disk and self.directory else None
+        if content is not None:
+            self._remember(key, content)
+            self.stats["disk_hits"] += 1
+            return content
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, location_id: int, content: bytes, disk: bool = True):
+        self._remember(key, content, location_id)
+        if disk and self.directory:
+            await asyncio.to_thread(self._disk_put, key, content)
+            self._schedule_prune()
+
+    async def invalidate_location(self, location_id: int):
+        """Drop every label rendered for a location"""
+        keys = self._by_location.pop(location_id, set())
+        for key in keys:
+            self._location_of.pop(key, None)
+            content = self._entries.pop(key, None)
+            if content is not None:
+                self._bytes -= len(content)
+            self.stats["invalidations"] += 1
+        if keys and self.directory:
+            await asyncio.to_thread(self._disk_remove, keys)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        self._by_location.clear()
+        self._location_of.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "disk": bool(self.directory),
+            "disk_bytes": self._disk_bytes,
+            "pruning": self._pruning is not None and not self._pruning.done(),
+            **self.stats,
+            "hit_rate": round((self.stats["hits"] + self.stats["disk_hits"]) / lookups, 4) if lookups else None
+        }
+
+    def _remember(self, key: str, content: bytes, location_id: Optional[int] = None):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = content
+        self._bytes += len(content)
+        if location_id is not None and self._location_of.get(key) != location_id:
+            self._forget_location(key)
+            self._location_of[key] = location_id
+            self._by_location.setdefault(location_id, set()).add(key)
+        while len(self._entries) > self.size or (self._bytes > self.max_bytes and len(self._entries) > 1):
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._forget_location(evicted_key)
+            self.stats["evictions"] += 1
+
+    def _forget_location(self, key: str):
+        location_id = self._location_of.pop(key, None)
+        if location_id is None:
+            return
+        keys = self._by_location.get(location_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_location[location_id]
+
+    def _schedule_prune(self):
+        """Start a background prune once the disk tier passes its limit,
+        unless one is already running"""
+        if self._disk_bytes is None or self._disk_bytes <= self.disk_max_bytes:
+            return
+        if self._pruning is not None and not self._pruning.done():
+            return
+        self._pruning = asyncio.create_task(asyncio.to_thread(self._disk_prune))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            # mtime doubles as the disk tier's recency for pruning.
+            os.utime(path)
+            return content
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self.stats["disk_errors"] += 1
+            logger.error(f"Label cache read failed: {str(e)}")
+            return None
+
+    def _disk_put(self, key: str, content: bytes):
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            if self._disk_bytes is None:
+                self._disk_bytes = self._disk_usage()
+            else:
+                self._disk_bytes += len(content)
+        except OSError as e:
+            self.stats["disk_errors"] += 1
+            logger.error(f"Label cache write failed: {str(e)}")
+
+    def _disk_remove(self, keys: Iterable[str]):
+        if not self.directory:
+            return
+        for key in keys:
+            try:
+                size = os.path.getsize(self._path(key))
+                os.remove(self._path(key))
+                if self._disk_bytes is not None:
+                    self._disk_bytes -= size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.stats["disk_errors"] += 1
+                logger.error(f"Label cache remove failed: {str(e)}")
+
+    def _disk_files(self):
+        for folder, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".tmp"):
+                    path = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        # Removed by another process since the directory was listed.
+                        continue
+                    yield path, stat
+
+    def _disk_usage(self) -> int:
+        return sum(stat.st_size for _, stat in self._disk_files())
+
+    def _disk_prune(self):
+        """Delete the least recently used files down to 90% of the limit;
+        runs in a worker thread"""
+        try:
+            files = sorted(self._disk_files(), key=lambda item: item[1].st_mtime)
+            total = sum(stat.st_size for _, stat in files)
+            target = self.disk_max_bytes * 0.9
+            for path, stat in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= stat.st_size
+                except FileNotFoundError:
+                    pass
+            self._disk_bytes = total
+        except OSError as e:
+            self.stats["disk_errors"] += 1
+            logger.error(f"Label cache prune failed: {str(e)}")
+
+label_cache = LabelCache()
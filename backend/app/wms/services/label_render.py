@@ -0,0 +1,135 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+from app.wms.services.sap_client import Bulkhead
+
+logger = logging.getLogger(__name__)
+
+# Processes that render PDF labels; 0 renders in a thread of the API process.
+LABEL_RENDER_WORKERS = int(os.getenv("LABEL_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Render jobs admitted per worker (running plus queued in the pool).
+LABEL_RENDER_QUEUE_PER_WORKER = int(os.getenv("LABEL_RENDER_QUEUE_PER_WORKER", "2"))
+# How long a request waits for a free render slot before it is turned away.
+LABEL_RENDER_WAIT_SECONDS = float(os.getenv("LABEL_RENDER_WAIT_SECONDS", "30"))
+
+def label_fields(location) -> Dict[str, Any]:
+    """The plain values a label prints, so render jobs can cross to a worker process"""
+    return {
+        "warehouse_name": location.warehouse.name or location.whs_code,
+        "code": location.code,
+        "name": location.name or "",
+        "attributes": location.attributes
+    }
+
+def render_pdf(labels: List[Dict[str, Any]]) -> bytes:
+    """One PDF with a page per label; runs in a render worker"""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter
+    import io
+
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    for label in labels:
+        _draw_bin_label(p, label)
+        p.showPage()
+    p.save()
+
+    buffer.seek(0)
+    return buffer.getvalue()
+
+def _draw_bin_label(p, label: Dict[str, Any]):
+    from reportlab.lib.units import inch
+    from reportlab.graphics.barcode import code128
+
+    p.setFont("Helvetica-Bold", 24)
+    p.drawString(1*inch, 9*inch, label["warehouse_name"])
+
+    p.setFont("Helvetica-Bold", 18)
+    p.drawString(1*inch, 8.5*inch, label["code"])
+
+    p.setFont("Helvetica", 14)
+    p.drawString(1*inch, 8*inch, label["name"])
+
+    if label["attributes"]:
+        import json
+        try:
+            attrs = json.loads(label["attributes"]) if isinstance(label["attributes"], str) else label["attributes"]
+            attributes_text = " | ".join([f"{k}: {v}" for k, v in attrs.items()])
+            p.setFont("Helvetica", 10)
+            p.drawString(1*inch, 7.5*inch, attributes_text)
+        except:
+            pass
+
+    barcode = code128.Code128(label["code"], barHeight=0.5*inch, barWidth=1.5)
+    barcode.drawOn(p, 1*inch, 6*inch)
+
+def _warm_worker():
+    """Import reportlab up front so the first real job does not pay for it"""
+    render_pdf([])
+
+class LabelRenderPool:
+    """Renders PDF labels in a bounded process pool.
+
+    reportlab drawing and Code128 generation are CPU-bound and hold the
+    GIL, so on the event loop (or in a thread) a large batch stalls every
+    other request. Jobs run in `workers` spawned processes instead. At
+    most workers * queue_per_worker jobs are admitted at a time; further
+    callers wait for a slot up to wait_seconds and then get
+    BulkheadFullError, which the API turns into a 503.
+    """
+
+    def __init__(
+        self,
+        workers: int = LABEL_RENDER_WORKERS,
+        queue_per_worker: int = LABEL_RENDER_QUEUE_PER_WORKER,
+        wait_seconds: float = LABEL_RENDER_WAIT_SECONDS
+    ):
+        self.workers = workers
+        self.bulkhead = Bulkhead(max(1, workers) * queue_per_worker, wait_seconds, name="label render")
+        self.stats = {"jobs": 0, "labels": 0, "failed": 0}
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    async def start(self):
+        """Spawn the workers ahead of the first render"""
+        if self.running or self.workers <= 0:
+            return
+        # spawn: a forked child would inherit the event loop's threads and pooled connections.
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self._executor, _warm_worker) for _ in range(self.workers)])
+        logger.info(f"Label render pool started with {self.workers} workers")
+
+    async def stop(self):
+        if not self.running:
+            return
+        executor, self._executor = self._executor, None
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+        logger.info("Label render pool stopped")
+
+    async def render_pdf(self, labels: List[Dict[str, Any]]) -> bytes:
+        async with self.bulkhead.slot():
+            try:
+                if self.workers <= 0:
+                    content = await asyncio.to_thread(render_pdf, labels)
+                else:
+                    if not self.running:
+                        await self.start()
+                    content = await asyncio.get_running_loop().run_in_executor(self._executor, render_pdf, labels)
+            except Exception:
+                self.stats["failed"] += 1
+                raise
+        self.stats["jobs"] += 1
+        self.stats["labels"] += len(labels)
+        return content
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "running": self.running, **self.bulkhead.snapshot(), **self.stats}
+
+label_render_pool = LabelRenderPool()
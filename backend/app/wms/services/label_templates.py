@@ -0,0 +1,321 @@
+import os
+import re
+import json
+import time
+import logging
+from functools import lru_cache
+from typing import Dict, Any, Optional, List, Tuple
+from sqlalchemy import select, update, or_, String, Text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.wms.models import LabelTemplate, Location, Warehouse
+from app.wms.services.audit import WMSAuditService
+
+logger = logging.getLogger(__name__)
+
+# How long a warehouse's resolved template is reused before it is looked up again.
+LABEL_TEMPLATE_TTL_SECONDS = float(os.getenv("LABEL_TEMPLATE_TTL_SECONDS", "60"))
+LABEL_TYPES = ("bin",)
+
+PLACEHOLDER = re.compile(r"\{\{\s*(.*?)\s*\}\}")
+LOCATION_COLUMNS = {column.name: column for column in Location.__table__.columns}
+WAREHOUSE_COLUMNS = {column.name: column for column in Warehouse.__table__.columns}
+
+DEFAULT_BIN_TEMPLATE = """^XA
+^CF0,60
+^FO50,50^FD{{warehouse_name}}^FS
+^CF0,40
+^FO50,120^FD{{location.code}}^FS
+^CF0,30
+^FO50,170^FD{{location.name}}^FS
+^CF0,25
+^FO50,210^FD{{attributes}}^FS
+^BY3,3,100
+^FO50,250^BC^FD{{location.code}}^FS
+^XZ"""
+
+class TemplateError(ValueError):
+    pass
+
+def _text(value) -> str:
+    return "" if value is None else str(value)
+
+# Bulk-generated bins share their attributes JSON, so a batch parses each distinct value once.
+@lru_cache(maxsize=1024)
+def _parse_attributes(raw: str) -> Dict[str, Any]:
+    try:
+        attrs = json.loads(raw)
+    except ValueError:
+        return {}
+    return attrs if isinstance(attrs, dict) else {}
+
+@lru_cache(maxsize=1024)
+def _attributes_text(raw: str) -> str:
+    """All attributes as 'key: value | ...', or the raw text if it is not a JSON object"""
+    try:
+        attrs = json.loads(raw)
+        return " | ".join([f"{k}: {v}" for k, v in attrs.items()])
+    except Exception:
+        return raw
+
+def _column_expression(owner: str, column) -> str:
+    value = f"{owner}.{column.name}"
+    if isinstance(column.type, (String, Text)):
+        return f'({value} or "")' if column.nullable else value
+    return f"_text({value})"
+
+class CompiledTemplate:
+    """A label template compiled to a Python function.
+
+    The body is parsed once and turned into the source of an f-string
+    whose fields read the location, its warehouse or its parsed
+    attributes directly; render, render_many and values are compiled from
+    it. Rendering a label is then one function call and a batch is a
+    single loop with no parsing or per-field dispatch.
+
+    key identifies the template version; it goes into the label cache key.
+    """
+
+    def __init__(self, body: str, key: str = "default"):
+        self.body = body
+        self.key = key
+        if "^XA" not in body or "^XZ" not in body:
+            raise TemplateError("A ZPL template must start a label with ^XA and end it with ^XZ")
+
+        namespace: Dict[str, Any] = {
+            "_text": _text,
+            "_attributes_text": _attributes_text,
+            "_parse_attributes": _parse_attributes
+        }
+        pieces, fields, expressions, position = [], [], [], 0
+        for match in PLACEHOLDER.finditer(body):
+            pieces.append(self._literal(body[position:match.start()]))
+            expression = self._expression(match.group(1), namespace)
+            pieces.append(f"f'{{{expression}}}'")
+            fields.append(match.group(1))
+            expressions.append(expression)
+            position = match.end()
+        pieces.append(self._literal(body[position:]))
+        self.fields = tuple(fields)
+
+        setup = []
+        if any("warehouse." in expression for expression in expressions):
+            setup.append("warehouse = location.warehouse")
+        if any("attrs." in expression for expression in expressions):
+            setup.append("attrs = _parse_attributes(location.attributes) if location.attributes else {}")
+        label = " ".join(piece for piece in pieces if piece)
+        values = "".join(f"{expression}, " for expression in expressions)
+
+        source = "\n".join([
+            "def render(location):",
+            *[f"    {line}" for line in setup],
+            f"    return {label}",
+            "def render_many(locations):",
+            "    rendered = []",
+            "    append = rendered.append",
+            "    for location in locations:",
+            *[f"        {line}" for line in setup],
+            f"        append({label})",
+            "    return rendered",
+            "def values(location):",
+            *[f"    {line}" for line in setup],
+            f"    return ({values})",
+        ])
+        exec(compile(source, f"<label template {key}>", "exec"), namespace)
+        self.render = namespace["render"]
+        self.render_many = namespace["render_many"]
+        self._values = namespace["values"]
+
+    @staticmethod
+    def _literal(text: str) -> str:
+        if "{{" in text or "}}" in text:
+            raise TemplateError("Unclosed template placeholder")
+        return f"f{text.replace('{', '{{').replace('}', '}}')!r}" if text else ""
+
+    @staticmethod
+    def _expression(field: str, namespace: Dict[str, Any]) -> str:
+        """Python expression for a placeholder; attribute keys are bound
+        as constants so no template text ends up in the source"""
+        if field == "warehouse_name":
+            return "(warehouse.name or location.whs_code)"
+        if field == "attributes":
+            return '(_attributes_text(location.attributes) if location.attributes else "")'
+        scope, _, name = field.partition(".")
+        if scope == "location" and name in LOCATION_COLUMNS:
+            return _column_expression("location", LOCATION_COLUMNS[name])
+        if scope == "warehouse" and name in WAREHOUSE_COLUMNS:
+            return _column_expression("warehouse", WAREHOUSE_COLUMNS[name])
+        if scope == "attr" and name:
+            constant = f"_key{len(namespace)}"
+            namespace[constant] = name
+            return f"_text(attrs.get({constant}))"
+        raise TemplateError(f"Unknown template field '{field}'")
+
+    def values(self, location) -> Dict[str, str]:
+        """The placeholder values a label is rendered from"""
+        return dict(zip(self.fields, self._values(location)))
+
+default_bin_template = CompiledTemplate(DEFAULT_BIN_TEMPLATE)
+
+class LabelTemplateRegistry:
+    """Compiled label templates, shared by every request in the process.
+
+    The template a warehouse uses (its own, else the global one, else the
+    built-in default) is cached for LABEL_TEMPLATE_TTL_SECONDS; compiled
+    templates are kept by id and version, so a template is compiled once
+    per process however often it is resolved.
+    """
+
+    def __init__(self, ttl_seconds: float = LABEL_TEMPLATE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._resolved: Dict[Tuple[str, str], Tuple[float, CompiledTemplate]] = {}
+        self._compiled: Dict[str, CompiledTemplate] = {}
+        self.stats = {"lookups": 0, "compiled": 0}
+
+    async def resolve(self, db: AsyncSession, whs: str, label_type: str = "bin") -> CompiledTemplate:
+        cached = self._resolved.get((whs, label_type))
+        if cached is not None and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+
+        self.stats["lookups"] += 1
+        candidates = (await db.scalars(
+            select(LabelTemplate)
+            .where(
+                LabelTemplate.label_type == label_type,
+                LabelTemplate.is_active == True,
+                or_(LabelTemplate.whs_code == whs, LabelTemplate.whs_code.is_(None))
+            )
+        )).all()
+        template = default_bin_template
+        if candidates:
+            row = max(candidates, key=lambda t: (t.whs_code is not None, t.version, t.id))
+            template = self.compiled(row)
+        self._resolved[(whs, label_type)] = (time.monotonic(), template)
+        return template
+
+    def compiled(self, row: LabelTemplate) -> CompiledTemplate:
+        key = f"{row.id}:{row.version}"
+        template = self._compiled.get(key)
+        if template is None:
+            try:
+                template = CompiledTemplate(row.body, key)
+            except TemplateError as e:
+                logger.error(f"Label template {row.id} does not compile, using the default: {str(e)}")
+                template = default_bin_template
+            self._compiled[key] = template
+            self.stats["compiled"] += 1
+        return template
+
+    def invalidate(self):
+        self._resolved.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"resolved": len(self._resolved), "compiled_templates": len(self._compiled), **self.stats}
+
+label_templates = LabelTemplateRegistry()
+
+class LabelTemplateService:
+    def __init__(self, db: AsyncSession, registry: Optional[LabelTemplateRegistry] = None):
+        self.db = db
+        self.registry = registry or label_templates
+        self.audit_service = WMSAuditService(db)
+
+    async def list_templates(self, whs: Optional[str] = None, label_type: Optional[str] = None, include_inactive: bool = False) -> List[LabelTemplate]:
+        query = select(LabelTemplate).order_by(LabelTemplate.label_type, LabelTemplate.whs_code, LabelTemplate.version.desc())
+        if whs:
+            query = query.where(or_(LabelTemplate.whs_code == whs, LabelTemplate.whs_code.is_(None)))
+        if label_type:
+            query = query.where(LabelTemplate.label_type == label_type)
+        if not include_inactive:
+            query = query.where(LabelTemplate.is_active == True)
+        return (await self.db.scalars(query)).all()
+
+    async def create_template(
+        self,
+        name: str,
+        body: str,
+        user: str,
+        whs: Optional[str] = None,
+        label_type: str = "bin"
+    ) -> Dict[str, Any]:
+        """Store a template as the active one for its warehouse (or all
+        warehouses) and label type; the one it replaces is kept, inactive"""
+        try:
+            if label_type not in LABEL_TYPES:
+                return {"ok": False, "error": {"code": "INVALID_LABEL_TYPE", "message": f"Label type must be one of {', '.join(LABEL_TYPES)}"}}
+            try:
+                compiled = CompiledTemplate(body)
+            except TemplateError as e:
+                return {"ok": False, "error": {"code": "INVALID_TEMPLATE", "message": str(e)}}
+
+            scope = LabelTemplate.whs_code == whs if whs else LabelTemplate.whs_code.is_(None)
+            previous = await self.db.scalar(
+                select(LabelTemplate.version)
+                .where(LabelTemplate.label_type == label_type, scope)
+                .order_by(LabelTemplate.version.desc())
+                .limit(1)
+            )
+            await self.db.execute(
+                update(LabelTemplate)
+                .where(LabelTemplate.label_type == label_type, scope, LabelTemplate.is_active == True)
+                .values(is_active=False)
+                .execution_options(synchronize_session=False)
+            )
+            template = LabelTemplate(
+                whs_code=whs,
+                label_type=label_type,
+                name=name,
+                format="zpl",
+                body=body,
+                version=(previous or 0) + 1,
+                is_active=True,
+                created_by=user
+            )
+            self.db.add(template)
+            await self.db.flush()
+
+            await self.audit_service.log_action(
+                user_name=user,
+                action="create_label_template",
+                payload={"template_id": template.id, "whs": whs, "label_type": label_type, "version": template.version, "fields": list(compiled.fields)}
+            )
+            await self.db.commit()
+            await self.db.refresh(template)
+            self.registry.invalidate()
+
+            return {"ok": True, "data": label_template_dict(template)}
+
+        except Exception as e:
+            await self.db.rollback()
+            logger.error(f"Create label template failed: {str(e)}")
+            return {"ok": False, "error": {"code": "TEMPLATE_ERROR", "message": str(e)}}
+
+    async def deactivate_template(self, template_id: int, user: str) -> Dict[str, Any]:
+        """Retire a template; its warehouse falls back to the global or default one"""
+        template = await self.db.get(LabelTemplate, template_id)
+        if not template:
+            return {"ok": False, "error": {"code": "TEMPLATE_NOT_FOUND", "message": "Label template not found"}}
+
+        template.is_active = False
+        await self.audit_service.log_action(
+            user_name=user,
+            action="deactivate_label_template",
+            payload={"template_id": template_id, "whs": template.whs_code, "label_type": template.label_type}
+        )
+        await self.db.commit()
+        self.registry.invalidate()
+
+        return {"ok": True, "data": label_template_dict(template)}
+
+def label_template_dict(template: LabelTemplate) -> Dict[str, Any]:
+    return {
+        "id": template.id,
+        "whs_code": template.whs_code,
+        "label_type": template.label_type,
+        "name": template.name,
+        "format": template.format,
+        "body": template.body,
+        "version": template.version,
+        "is_active": template.is_active,
+        "created_by": template.created_by,
+        "created_at": template.created_at
+    }
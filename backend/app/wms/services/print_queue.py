@@ -0,0 +1,372 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from app.database import AsyncSessionLocal
+from app.wms.models import PrintJob
+
+logger = logging.getLogger(__name__)
+
+PRINT_QUEUE_ENABLED = os.getenv("PRINT_QUEUE_ENABLED", "true").lower() == "true"
+PRINT_QUEUE_POLL_SECONDS = float(os.getenv("PRINT_QUEUE_POLL_SECONDS", "1.0"))
+PRINT_QUEUE_BATCH_SIZE = int(os.getenv("PRINT_QUEUE_BATCH_SIZE", "50"))
+# Jobs sent to the printer API per second, with bursts of up to PRINT_QUEUE_BURST.
+PRINT_QUEUE_RATE_PER_SECOND = float(os.getenv("PRINT_QUEUE_RATE_PER_SECOND", "5"))
+PRINT_QUEUE_BURST = int(os.getenv("PRINT_QUEUE_BURST", "5"))
+PRINT_QUEUE_MAX_ATTEMPTS = int(os.getenv("PRINT_QUEUE_MAX_ATTEMPTS", "6"))
+PRINT_QUEUE_BACKOFF_SECONDS = float(os.getenv("PRINT_QUEUE_BACKOFF_SECONDS", "2"))
+PRINT_QUEUE_MAX_BACKOFF_SECONDS = float(os.getenv("PRINT_QUEUE_MAX_BACKOFF_SECONDS", "120"))
+# A PROCESSING job older than this belongs to a worker that died mid-send.
+PRINT_QUEUE_LEASE_SECONDS = float(os.getenv("PRINT_QUEUE_LEASE_SECONDS", "300"))
+# Largest page of print jobs.
+PRINT_JOB_PAGE_MAX = 1000
+
+STATUS_PENDING = "PENDING"
+STATUS_PROCESSING = "PROCESSING"
+STATUS_PRINTED = "PRINTED"
+STATUS_FAILED = "FAILED"
+
+# The printer API turned the job away before looking at it; the attempt is not counted.
+DEFERRED_ERROR_CODES = {"RATE_LIMITED", "PRINTER_QUEUE_FULL"}
+
+class RateLimiter:
+    """Token bucket: rate tokens per second, holding at most burst"""
+
+    def __init__(self, rate: float = PRINT_QUEUE_RATE_PER_SECOND, burst: int = PRINT_QUEUE_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.waited_seconds = 0.0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+                self.waited_seconds += delay
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hold every caller back, e.g. for a Retry-After from the API"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+class PrintQueueService:
+    """Queue print jobs in the caller's transaction and report on them"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    def enqueue(
+        self,
+        printer: str,
+        title: str,
+        format: str,
+        content: bytes,
+        user: str,
+        location_id: Optional[int] = None,
+        labels: int = 1
+    ) -> PrintJob:
+        job = PrintJob(
+            printer=printer,
+            title=title[:200],
+            format=format,
+            content=base64.b64encode(content).decode(),
+            labels=labels,
+            location_id=location_id,
+            status=STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=datetime.utcnow(),
+            created_by=user
+        )
+        self.db.add(job)
+        return job
+
+    async def get_job(self, job_id: int) -> Optional[PrintJob]:
+        """A job without its label content, which only the dispatcher needs"""
+        return await self.db.scalar(
+            select(PrintJob).options(defer(PrintJob.content)).where(PrintJob.id == job_id)
+        )
+
+    async def list_jobs(self, status: Optional[str] = None, limit: int = 100) -> List[PrintJob]:
+        """Newest jobs first, at most PRINT_JOB_PAGE_MAX, without their label content"""
+        limit = max(1, min(limit, PRINT_JOB_PAGE_MAX))
+        query = select(PrintJob).options(defer(PrintJob.content)).order_by(PrintJob.id.desc()).limit(limit)
+        if status:
+            query = query.where(PrintJob.status == status)
+        return (await self.db.scalars(query)).all()
+
+    async def retry(self, job_id: int) -> Dict[str, Any]:
+        """Put a FAILED job back in the queue with a fresh attempt budget"""
+        try:
+            result = await self.db.execute(
+                update(PrintJob)
+                .where(PrintJob.id == job_id, PrintJob.status == STATUS_FAILED)
+                .values(status=STATUS_PENDING, attempts=0, next_attempt_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+            if result.rowcount != 1:
+                return {"ok": False, "error": {"code": "NOT_FAILED", "message": f"Print job {job_id} is not in FAILED state"}}
+            return {"ok": True, "data": {"id": job_id, "status": STATUS_PENDING}}
+        except Exception as e:
+            logger.error(f"Print job retry failed: {str(e)}")
+            return {"ok": False, "error": {"code": "PRINT_RETRY_FAILED", "message": str(e)}}
+
+def print_job_dict(job: PrintJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "printer": job.printer,
+        "title": job.title,
+        "format": job.format,
+        "labels": job.labels,
+        "location_id": job.location_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "next_attempt_at": job.next_attempt_at,
+        "last_error": json.loads(job.last_error) if job.last_error else None,
+        "printer_job_id": job.printer_job_id,
+        "created_by": job.created_by,
+        "created_at": job.created_at,
+        "printed_at": job.printed_at
+    }
+
+class PrintJobDispatcher:
+    """Background worker that sends queued print jobs to the printer backend.
+
+    Jobs are claimed in id order with a conditional update, so several API
+    workers can share one queue, and each printer gets its jobs in queue
+    order. Every send first takes a token from a shared rate limiter, so a
+    burst of labels (say, after a bulk-generate) drains at the API's pace
+    instead of tripping its rate limit. A 429 pauses the limiter for the
+    Retry-After and hands the job back without spending an attempt; other
+    failures are retried with exponential backoff until
+    PRINT_QUEUE_MAX_ATTEMPTS, after which the job is parked as FAILED for a
+    manual retry.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        backend=None,
+        limiter: Optional[RateLimiter] = None,
+        poll_interval: float = PRINT_QUEUE_POLL_SECONDS,
+        batch_size: int = PRINT_QUEUE_BATCH_SIZE,
+        max_attempts: int = PRINT_QUEUE_MAX_ATTEMPTS
+    ):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.backend = backend
+        self.limiter = limiter or RateLimiter()
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.stats = {"printed": 0, "retried": 0, "deferred": 0, "failed": 0}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _backend(self):
+        if self.backend is not None:
+            return self.backend
+        # Imported here: printing queues its jobs through this module.
+        from app.wms.services.printing import printer_backend
+        return printer_backend
+
+    async def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Print job dispatcher started")
+
+    async def stop(self, timeout: float = 10.0):
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+        logger.info("Print job dispatcher stopped")
+
+    def wake(self):
+        """Skip the rest of the poll interval"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                processed = await self.dispatch_once()
+            except Exception as e:
+                logger.error(f"Print job dispatch failed: {str(e)}")
+                processed = 0
+
+            if processed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def dispatch_once(self) -> int:
+        """Claim due jobs and send them, returns the number of jobs handled"""
+        jobs = await self._claim_batch(self.batch_size)
+
+        by_printer: Dict[str, List[PrintJob]] = OrderedDict()
+        for job in jobs:
+            by_printer.setdefault(job.printer, []).append(job)
+
+        await asyncio.gather(*(self._dispatch_sequence(group) for group in by_printer.values()))
+        return len(jobs)
+
+    async def _claim_batch(self, limit: int) -> List[PrintJob]:
+        now = datetime.utcnow()
+        lease_expired = now - timedelta(seconds=PRINT_QUEUE_LEASE_SECONDS)
+
+        async with self.session_factory() as db:
+            candidates = (await db.scalars(
+                select(PrintJob)
+                .where(or_(
+                    and_(PrintJob.status == STATUS_PENDING, PrintJob.next_attempt_at <= now),
+                    and_(PrintJob.status == STATUS_PROCESSING, PrintJob.locked_at < lease_expired)
+                ))
+                .order_by(PrintJob.id)
+                .limit(limit)
+            )).all()
+            db.expunge_all()
+
+            claimed = []
+            for job in candidates:
+                result = await db.execute(
+                    update(PrintJob)
+                    .where(PrintJob.id == job.id, PrintJob.status == job.status, PrintJob.attempts == job.attempts)
+                    .values(status=STATUS_PROCESSING, locked_at=now, attempts=job.attempts + 1)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 1:
+                    job.status = STATUS_PROCESSING
+                    job.attempts += 1
+                    claimed.append(job)
+            await db.commit()
+
+        return claimed
+
+    async def _dispatch_sequence(self, jobs: List[PrintJob]):
+        for position, job in enumerate(jobs):
+            if not await self._dispatch(job):
+                # The rest of this printer's jobs go back too, so none overtakes the deferred one.
+                for later in jobs[position + 1:]:
+                    await self._mark_deferred(later, None)
+                return
+
+    async def _dispatch(self, job: PrintJob) -> bool:
+        """Send one job, returns False when the API deferred it"""
+        await self.limiter.acquire()
+        try:
+            result = await self._backend().submit(job.printer, job.title, job.format, base64.b64decode(job.content))
+        except Exception as e:
+            result = {"ok": False, "error": {"code": "DISPATCH_ERROR", "message": str(e)}}
+
+        if result.get("ok"):
+            await self._mark_printed(job, result.get("data"))
+            return True
+        error = result.get("error") or {}
+        if error.get("code") in DEFERRED_ERROR_CODES:
+            self.limiter.pause(error.get("retry_after") or PRINT_QUEUE_BACKOFF_SECONDS)
+            await self._mark_deferred(job, error)
+            return False
+        await self._mark_failed(job, error)
+        return True
+
+    async def _mark_printed(self, job: PrintJob, printer_job_id: Any):
+        async with self.session_factory() as db:
+            await db.execute(
+                update(PrintJob)
+                .where(PrintJob.id == job.id)
+                .values(
+                    status=STATUS_PRINTED,
+                    # The label has been delivered; only FAILED jobs can be retried.
+                    content="",
+                    printer_job_id=str(printer_job_id)[:64] if printer_job_id is not None else None,
+                    last_error=None,
+                    locked_at=None,
+                    printed_at=datetime.utcnow()
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        self.stats["printed"] += 1
+
+    async def _mark_failed(self, job: PrintJob, error: Dict[str, Any]):
+        now = datetime.utcnow()
+        if job.attempts >= self.max_attempts:
+            values = {"status": STATUS_FAILED}
+            self.stats["failed"] += 1
+            logger.error(f"Print job {job.id} ({job.title}) failed permanently: {error}")
+        else:
+            delay = min(PRINT_QUEUE_MAX_BACKOFF_SECONDS, PRINT_QUEUE_BACKOFF_SECONDS * 2 ** (job.attempts - 1))
+            values = {"status": STATUS_PENDING, "next_attempt_at": now + timedelta(seconds=delay)}
+            self.stats["retried"] += 1
+            logger.warning(f"Print job {job.id} ({job.title}) failed (attempt {job.attempts}), retrying in {delay:.0f}s: {error}")
+
+        async with self.session_factory() as db:
+            await db.execute(
+                update(PrintJob)
+                .where(PrintJob.id == job.id)
+                .values(locked_at=None, last_error=json.dumps(error, default=str), **values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _mark_deferred(self, job: PrintJob, error: Optional[Dict[str, Any]]):
+        """Hand the job back to the queue without spending an attempt"""
+        values = {"last_error": json.dumps(error, default=str)} if error else {}
+        async with self.session_factory() as db:
+            await db.execute(
+                update(PrintJob)
+                .where(PrintJob.id == job.id)
+                .values(status=STATUS_PENDING, attempts=PrintJob.attempts - 1, locked_at=None, **values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        self.stats["deferred"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "rate_per_second": self.limiter.rate,
+            "rate_limited_seconds": round(self.limiter.waited_seconds, 1),
+            **self.stats
+        }
+
+print_job_dispatcher = PrintJobDispatcher()
@@ -1,95 +1,551 @@
 import os
+import asyncio
+import itertools
 import logging
+import time
 import aiohttp
 import base64
-from typing import Dict, Any, Optional
-from sqlalchemy.orm import Session
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from app.wms.models import Location
 from app.wms.services.audit import WMSAuditService
+from app.wms.services.counting import scope_location_filter
+from app.wms.services.label_render import label_render_pool, label_fields, render_pdf
+from app.wms.services.label_cache import label_cache
+from app.wms.services.label_templates import CompiledTemplate, label_templates, default_bin_template
+from app.wms.services.print_queue import PrintQueueService, print_job_dispatcher, PRINT_QUEUE_ENABLED, STATUS_PENDING
+from app.wms.services.sap_client import BulkheadFullError
 
 logger = logging.getLogger(__name__)
 
-class PrintingService:
-    def __init__(self, db: Session):
-        self.db = db
-        self.audit_service = WMSAuditService(db)
-        self.api_key = os.getenv("PRINTNODE_API_KEY")
-        self.printer_name = os.getenv("PRINTNODE_PRINTER_NAME", "WMS Label Printer")
-        self.base_url = "https://api.printnode.com"
-
-    def generate_bin_label_zpl(self, location: Location) -> str:
-        """Generate ZPL for bin location label"""
-        warehouse_name = location.warehouse.name or location.whs_code
-        location_code = location.code
-        location_name = location.name or ""
-        
-        attributes_text = ""
-        if location.attributes:
-            import json
-            try:
-                attrs = json.loads(location.attributes) if isinstance(location.attributes, str) else location.attributes
-                attributes_text = " | ".join([f"{k}: {v}" for k, v in attrs.items()])
-            except:
-                attributes_text = str(location.attributes)
-        
-        zpl = f"""
-^XA
-^CF0,60
-^FO50,50^FD{warehouse_name}^FS
-^CF0,40
-^FO50,120^FD{location_code}^FS
-^CF0,30
-^FO50,170^FD{location_name}^FS
-^CF0,25
-^FO50,210^FD{attributes_text}^FS
-^BY3,3,100
-^FO50,250^BC^FD{location_code}^FS
-^XZ
-"""
-        return zpl.strip()
+# Most labels one batch may render.
+LABEL_BATCH_MAX = int(os.getenv("LABEL_BATCH_MAX", "10000"))
+# Labels per chunk of a streamed ZPL batch.
+LABEL_BATCH_CHUNK = 200
 
-    def generate_bin_label_pdf(self, location: Location) -> bytes:
-        """Generate PDF for bin location label"""
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import letter
-        from reportlab.lib.units import inch
-        from reportlab.graphics.barcode import code128
-        import io
-        
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        
-        warehouse_name = location.warehouse.name or location.whs_code
-        location_code = location.code
-        location_name = location.name or ""
-        
-        p.setFont("Helvetica-Bold", 24)
-        p.drawString(1*inch, 9*inch, warehouse_name)
-        
-        p.setFont("Helvetica-Bold", 18)
-        p.drawString(1*inch, 8.5*inch, location_code)
+# "printnode" prints through the PrintNode cloud API, "raw" straight to LAN printers on port 9100.
+PRINTER_BACKEND = os.getenv("PRINTER_BACKEND", "printnode").lower()
+# The printer labels go to: a PrintNode printer name, or one of RAW_PRINTERS.
+LABEL_PRINTER_NAME = os.getenv("LABEL_PRINTER_NAME", os.getenv("PRINTNODE_PRINTER_NAME", "WMS Label Printer"))
+PRINTNODE_BASE_URL = "https://api.printnode.com"
+PRINTNODE_TIMEOUT_SECONDS = 30
+# How long the PrintNode printer list is reused before it is fetched again.
+PRINTNODE_REGISTRY_TTL_SECONDS = float(os.getenv("PRINTNODE_REGISTRY_TTL_SECONDS", "300"))
+# A printer name missing from the cached list triggers a refetch at most this often.
+PRINTNODE_REGISTRY_MISS_SECONDS = float(os.getenv("PRINTNODE_REGISTRY_MISS_SECONDS", "30"))
+# Raw printers as comma-separated name=host[:port] pairs.
+RAW_PRINTERS = os.getenv("RAW_PRINTERS", "")
+RAW_PRINT_PORT = 9100
+RAW_PRINT_QUEUE_SIZE = int(os.getenv("RAW_PRINT_QUEUE_SIZE", "1000"))
+# Queued jobs written to a printer in one go, capped by count and bytes.
+RAW_PRINT_BATCH_JOBS = int(os.getenv("RAW_PRINT_BATCH_JOBS", "50"))
+RAW_PRINT_BATCH_BYTES = int(os.getenv("RAW_PRINT_BATCH_BYTES", str(256 * 1024)))
+# A printer connection left idle this long is closed; 0 closes it after every write.
+RAW_PRINT_IDLE_SECONDS = float(os.getenv("RAW_PRINT_IDLE_SECONDS", "60"))
+RAW_PRINT_TIMEOUT_SECONDS = float(os.getenv("RAW_PRINT_TIMEOUT_SECONDS", "10"))
+
+class PrinterError(Exception):
+    """Raised when a raw printer cannot be reached or written to"""
+
+class PrinterRegistry:
+    """TTL cache of the PrintNode printer list, shared by every request.
+
+    Concurrent lookups on an expired list share one fetch. A name that is
+    not in the list refetches it (a printer just added), but no more often
+    than miss_seconds. If PrintNode cannot be reached, the last list is
+    served until a fetch succeeds.
+    """
+
+    def __init__(self, fetch, ttl_seconds: float = PRINTNODE_REGISTRY_TTL_SECONDS, miss_seconds: float = PRINTNODE_REGISTRY_MISS_SECONDS):
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.miss_seconds = miss_seconds
+        self.stats = {"hits": 0, "fetches": 0, "fetch_errors": 0, "stale_served": 0}
+        self._printers: Optional[List[Dict[str, Any]]] = None
+        self._fetched_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _age(self) -> float:
+        return time.monotonic() - self._fetched_at
+
+    async def printers(self, refresh: bool = False) -> Dict[str, Any]:
+        if not refresh and self._printers is not None and self._age() < self.ttl_seconds:
+            self.stats["hits"] += 1
+            return {"ok": True, "data": {"printers": self._printers}}
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        requested_at = time.monotonic()
+        async with self._lock:
+            # Another request refreshed the list while this one waited.
+            if self._printers is not None and self._fetched_at >= requested_at - (0 if refresh else self.ttl_seconds):
+                self.stats["hits"] += 1
+                return {"ok": True, "data": {"printers": self._printers}}
+            fetched = await self.fetch()
+            if fetched["ok"]:
+                self.stats["fetches"] += 1
+                self._printers = fetched["data"]["printers"]
+                self._fetched_at = time.monotonic()
+                return fetched
+            self.stats["fetch_errors"] += 1
+            if self._printers is None:
+                return fetched
+            self.stats["stale_served"] += 1
+            logger.error(f"PrintNode printer list unavailable, using the one from {self._age():.0f}s ago: {fetched['error']['message']}")
+            return {"ok": True, "data": {"printers": self._printers}}
+
+    async def find(self, printer_name: str) -> Optional[int]:
+        """Find printer ID by name"""
+        listed = await self.printers()
+        if not listed["ok"]:
+            logger.error(f"Error finding printer: {listed['error']['message']}")
+            return None
+        printer_id = self._lookup(listed["data"]["printers"], printer_name)
+        if printer_id is None and self._age() >= self.miss_seconds:
+            listed = await self.printers(refresh=True)
+            if listed["ok"]:
+                printer_id = self._lookup(listed["data"]["printers"], printer_name)
+        return printer_id
+
+    def _lookup(self, printers: List[Dict[str, Any]], printer_name: str) -> Optional[int]:
+        for printer in printers:
+            if printer.get("name") == printer_name:
+                return printer.get("id")
+        return None
+
+    def invalidate(self):
+        self._printers = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "printers": len(self._printers) if self._printers is not None else None,
+            "age_seconds": round(self._age(), 1) if self._printers is not None else None,
+            **self.stats
+        }
+
+class PrintNodeBackend:
+    """Prints through the PrintNode cloud API over one keep-alive session.
+
+    The printer list comes from a shared PrinterRegistry, so a print costs
+    one API call. Jobs normally go through the print job queue
+    (print_queue), which spaces them out under PrintNode's rate limit.
+    """
+
+    name = "printnode"
+    not_configured = {"code": "PRINTNODE_NOT_CONFIGURED", "message": "PrintNode API key not configured"}
+    queue_jobs = PRINT_QUEUE_ENABLED
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = PRINTNODE_BASE_URL):
+        self.api_key = api_key if api_key is not None else os.getenv("PRINTNODE_API_KEY")
+        self.base_url = base_url
+        self.stats = {"jobs": 0, "failed": 0, "rate_limited": 0}
+        self.registry = PrinterRegistry(self._fetch_printers)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(self.api_key, ""),
+                timeout=aiohttp.ClientTimeout(total=PRINTNODE_TIMEOUT_SECONDS)
+            )
+        return self._session
+
+    async def list_printers(self, refresh: bool = False) -> Dict[str, Any]:
+        return await self.registry.printers(refresh=refresh)
+
+    async def find_printer(self, printer_name: str) -> Optional[int]:
+        return await self.registry.find(printer_name)
+
+    async def _fetch_printers(self) -> Dict[str, Any]:
+        try:
+            async with self._get_session().get(f"{self.base_url}/printers") as response:
+                if response.status == 200:
+                    printers = await response.json()
+                    return {"ok": True, "data": {"printers": printers}}
+                else:
+                    error_text = await response.text()
+                    return {"ok": False, "error": {"code": "PRINTNODE_ERROR", "message": error_text}}
+        except Exception as e:
+            return {"ok": False, "error": {"code": "PRINTNODE_CONNECTION_ERROR", "message": str(e)}}
+
+    async def submit(self, printer_name: str, title: str, format: str, content: bytes) -> Dict[str, Any]:
+        """Post one job to PrintNode, returns its job id as data"""
+        printer_id = await self.find_printer(printer_name)
+        if not printer_id:
+            return {"ok": False, "error": {"code": "PRINTER_NOT_FOUND", "message": f"Printer '{printer_name}' not found"}}
         
-        p.setFont("Helvetica", 14)
-        p.drawString(1*inch, 8*inch, location_name)
+        print_job = {
+            "printerId": printer_id,
+            "title": title,
+            "contentType": "raw_base64" if format == "zpl" else "pdf_base64",
+            "content": base64.b64encode(content).decode(),
+            "source": "WMS Bin Location System"
+        }
         
-        if location.attributes:
-            import json
+        async with self._get_session().post(f"{self.base_url}/printjobs", json=print_job) as response:
+            if response.status == 201:
+                self.stats["jobs"] += 1
+                return {"ok": True, "data": await response.json()}
+            elif response.status == 429:
+                self.stats["rate_limited"] += 1
+                retry_after = response.headers.get("Retry-After", "")
+                return {"ok": False, "error": {
+                    "code": "RATE_LIMITED",
+                    "message": await response.text(),
+                    "retry_after": float(retry_after) if retry_after.replace(".", "", 1).isdigit() else None
+                }}
+            else:
+                self.stats["failed"] += 1
+                error_text = await response.text()
+                return {"ok": False, "error": {"code": "PRINT_FAILED", "message": error_text}}
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.name, "configured": self.configured, **self.stats, "registry": self.registry.snapshot()}
+
+class RawPrinterQueue:
+    """Job queue and persistent connection for one raw (port 9100) printer.
+
+    A single writer task owns the connection, so jobs reach the printer in
+    the order they were queued. Whatever is waiting when the writer comes
+    round is sent as one write, up to batch_jobs jobs or batch_bytes. A
+    pooled connection the printer has since dropped (closed, reset or
+    broken pipe) is reopened once and the write retried. A printer that
+    stops reading partway through a write may already have printed what
+    it took, so a write timeout fails the batch instead; so does any
+    failure on a fresh connection, so nothing is sent twice.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        host: str,
+        port: int = RAW_PRINT_PORT,
+        queue_size: int = RAW_PRINT_QUEUE_SIZE,
+        batch_jobs: int = RAW_PRINT_BATCH_JOBS,
+        batch_bytes: int = RAW_PRINT_BATCH_BYTES,
+        idle_seconds: float = RAW_PRINT_IDLE_SECONDS,
+        timeout_seconds: float = RAW_PRINT_TIMEOUT_SECONDS
+    ):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.batch_jobs = batch_jobs
+        self.batch_bytes = batch_bytes
+        self.idle_seconds = idle_seconds
+        self.timeout_seconds = timeout_seconds
+        self.queue: "asyncio.Queue[Tuple[bytes, asyncio.Future]]" = asyncio.Queue(maxsize=queue_size)
+        self.stats = {"jobs": 0, "batches": 0, "bytes": 0, "connects": 0, "reconnects": 0, "failed": 0}
+        self._job_ids = itertools.count(1)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def submit(self, content: bytes) -> str:
+        """Queue one job and wait until it has been written to the printer;
+        returns the job id.
+
+        Raises asyncio.QueueFull when the printer's queue is full and
+        PrinterError when the write fails.
+        """
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((content, future))
+        return await future
+
+    async def close(self, timeout: float = 30.0):
+        if self.running:
             try:
-                attrs = json.loads(location.attributes) if isinstance(location.attributes, str) else location.attributes
-                attributes_text = " | ".join([f"{k}: {v}" for k, v in attrs.items()])
-                p.setFont("Helvetica", 10)
-                p.drawString(1*inch, 7.5*inch, attributes_text)
-            except:
+                await asyncio.wait_for(self.queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
                 pass
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self._disconnect()
+
+    async def _run(self):
+        while True:
+            try:
+                job = await asyncio.wait_for(self.queue.get(), timeout=self.idle_seconds or None)
+            except asyncio.TimeoutError:
+                await self._disconnect()
+                continue
+            
+            batch = [job]
+            size = len(job[0])
+            while len(batch) < self.batch_jobs and size < self.batch_bytes and not self.queue.empty():
+                job = self.queue.get_nowait()
+                batch.append(job)
+                size += len(job[0])
+            
+            try:
+                await self._write(b"".join(content for content, _ in batch))
+                self.stats["jobs"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["bytes"] += size
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(f"{self.name}-{next(self._job_ids)}")
+            except Exception as e:
+                self.stats["failed"] += len(batch)
+                logger.error(f"Raw print to {self.name} ({self.host}:{self.port}) failed: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(PrinterError(f"Printer '{self.name}' at {self.host}:{self.port}: {str(e) or type(e).__name__}"))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            
+            if not self.idle_seconds:
+                await self._disconnect()
+
+    async def _write(self, data: bytes):
+        reused = self._writer is not None
+        if reused and self._reader.at_eof():
+            # The printer closed the pooled connection while it sat idle.
+            await self._disconnect()
+            reused = False
+        try:
+            await self._send(data)
+        except asyncio.TimeoutError:
+            # The printer stopped reading; the labels it took may print, so the batch is not resent.
+            # Aborting drops what is still buffered instead of trickling it out after the failure.
+            await self._disconnect(abort=True)
+            raise PrinterError(f"write timed out after {self.timeout_seconds:g}s, labels may be partly printed")
+        except (ConnectionResetError, BrokenPipeError):
+            await self._disconnect()
+            if not reused:
+                raise
+            self.stats["reconnects"] += 1
+            await self._send(data)
+        except OSError:
+            await self._disconnect()
+            raise
+
+    async def _send(self, data: bytes):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), timeout=self.timeout_seconds
+            )
+            self.stats["connects"] += 1
+        self._writer.write(data)
+        await asyncio.wait_for(self._writer.drain(), timeout=self.timeout_seconds)
+
+    async def _disconnect(self, abort: bool = False):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            if abort:
+                writer.transport.abort()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "host": self.host,
+            "port": self.port,
+            "connected": self._writer is not None,
+            "queued": self.queue.qsize(),
+            **self.stats
+        }
+
+def parse_raw_printers(spec: str) -> Dict[str, Tuple[str, int]]:
+    """RAW_PRINTERS "Dock 1=10.0.0.21, Dock 2=10.0.0.22:9101" -> {name: (host, port)}"""
+    printers = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        name, _, address = entry.partition("=")
+        host, _, port = address.strip().partition(":")
+        if not name.strip() or not host:
+            raise ValueError(f"RAW_PRINTERS entry '{entry.strip()}' must be name=host[:port]")
+        printers[name.strip()] = (host, int(port) if port else RAW_PRINT_PORT)
+    return printers
+
+class RawTcpBackend:
+    """Sends ZPL straight to LAN label printers on their raw TCP port"""
+
+    name = "raw"
+    not_configured = {"code": "PRINTER_NOT_CONFIGURED", "message": "RAW_PRINTERS not configured"}
+    # LAN printers have no rate limit and each has its own in-memory queue.
+    queue_jobs = False
+
+    def __init__(self, printers: Optional[Dict[str, Tuple[str, int]]] = None, **queue_options):
+        self.printers = printers if printers is not None else parse_raw_printers(RAW_PRINTERS)
+        self.queue_options = queue_options
+        self._queues: Dict[str, RawPrinterQueue] = {}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.printers)
+
+    def queue(self, printer_name: str) -> Optional[RawPrinterQueue]:
+        address = self.printers.get(printer_name)
+        if address is None:
+            return None
+        queue = self._queues.get(printer_name)
+        if queue is None:
+            queue = self._queues[printer_name] = RawPrinterQueue(printer_name, *address, **self.queue_options)
+        return queue
+
+    async def list_printers(self, refresh: bool = False) -> Dict[str, Any]:
+        printers = [
+            self._queues[name].snapshot() if name in self._queues else {"name": name, "host": host, "port": port, "connected": False, "queued": 0}
+            for name, (host, port) in self.printers.items()
+        ]
+        return {"ok": True, "data": {"printers": printers}}
+
+    async def submit(self, printer_name: str, title: str, format: str, content: bytes) -> Dict[str, Any]:
+        if format != "zpl":
+            return {"ok": False, "error": {"code": "INVALID_FORMAT", "message": "Raw printers take ZPL labels only"}}
+        queue = self.queue(printer_name)
+        if queue is None:
+            return {"ok": False, "error": {"code": "PRINTER_NOT_FOUND", "message": f"Printer '{printer_name}' not found"}}
+        try:
+            return {"ok": True, "data": await queue.submit(content)}
+        except asyncio.QueueFull:
+            return {"ok": False, "error": {"code": "PRINTER_QUEUE_FULL", "message": f"Print queue for '{printer_name}' is full"}}
+        except PrinterError as e:
+            return {"ok": False, "error": {"code": "PRINT_FAILED", "message": str(e)}}
+
+    async def close(self):
+        await asyncio.gather(*[queue.close() for queue in self._queues.values()])
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"backend": self.name, "configured": self.configured, "printers": [queue.snapshot() for queue in self._queues.values()]}
+
+def create_printer_backend(name: str = PRINTER_BACKEND):
+    if name == "raw":
+        return RawTcpBackend()
+    if name != "printnode":
+        raise ValueError(f"PRINTER_BACKEND must be 'printnode' or 'raw', not '{name}'")
+    return PrintNodeBackend()
+
+printer_backend = create_printer_backend()
+
+class PrintingService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.audit_service = WMSAuditService(db)
+        self.backend = printer_backend
+        self.printer_name = LABEL_PRINTER_NAME
+        self.print_queue = PrintQueueService(db)
+        self.dispatcher = print_job_dispatcher
+        self.render_pool = label_render_pool
+        self.cache = label_cache
+        self.templates = label_templates
+
+    async def get_location(self, location_id: int) -> Optional[Location]:
+        """Load location with its warehouse for label rendering"""
+        query = (
+            select(Location)
+            .options(joinedload(Location.warehouse))
+            .where(Location.id == location_id)
+        )
+        return await self.db.scalar(query)
+
+    async def get_batch_locations(self, whs: str, scope: Dict[str, Any]) -> Dict[str, Any]:
+        """Load every active location of a label batch in one query, warehouse
+        joined, in hierarchy order.
+
+        The scope is the same location filter count sessions use (ids,
+        section/aisle/rack/level areas, code patterns or all); see
+        scope_location_filter.
+        """
+        try:
+            location_filter = scope_location_filter(whs, scope)
+        except ValueError as e:
+            return {"ok": False, "error": {"code": "INVALID_SCOPE", "message": str(e)}}
         
-        barcode = code128.Code128(location_code, barHeight=0.5*inch, barWidth=1.5)
-        barcode.drawOn(p, 1*inch, 6*inch)
-        
-        p.showPage()
-        p.save()
-        
-        buffer.seek(0)
-        return buffer.getvalue()
+        locations = (await self.db.scalars(
+            select(Location)
+            .options(joinedload(Location.warehouse))
+            .where(location_filter, Location.is_active == True)
+            .order_by(Location.section, Location.aisle, Location.rack, Location.level, Location.bin, Location.code)
+            .limit(LABEL_BATCH_MAX + 1)
+        )).all()
+        if not locations:
+            return {"ok": False, "error": {"code": "LOCATION_NOT_FOUND", "message": "No active locations match the filter"}}
+        if len(locations) > LABEL_BATCH_MAX:
+            return {"ok": False, "error": {"code": "BATCH_TOO_LARGE", "message": f"Filter selects more than {LABEL_BATCH_MAX} locations"}}
+        return {"ok": True, "data": locations}
+
+    async def get_template(self, whs: str) -> CompiledTemplate:
+        """The compiled bin label template for a warehouse"""
+        return await self.templates.resolve(self.db, whs, "bin")
+
+    def generate_bin_label_zpl(self, location: Location, template: Optional[CompiledTemplate] = None) -> str:
+        """Generate ZPL for bin location label, with the built-in layout
+        unless a warehouse template is passed"""
+        return (template or default_bin_template).render(location)
+
+    def iter_batch_zpl(self, locations: List[Location], template: Optional[CompiledTemplate] = None, chunk_size: int = LABEL_BATCH_CHUNK) -> Iterator[str]:
+        """One ZPL job for many labels, yielded chunk_size labels at a time"""
+        render_many = (template or default_bin_template).render_many
+        for start in range(0, len(locations), chunk_size):
+            yield "\n".join(render_many(locations[start:start + chunk_size])) + "\n"
+
+    def generate_bin_label_pdf(self, location: Location) -> bytes:
+        """Generate PDF for bin location label, in the calling thread"""
+        return render_pdf([label_fields(location)])
+
+    async def render_labels_pdf(self, locations: List[Location]) -> bytes:
+        """One PDF with a page per label, rendered in the label render pool"""
+        return await self.render_pool.render_pdf([label_fields(location) for location in locations])
+
+    async def render_label(self, location: Location, format: str) -> bytes:
+        """One label as ZPL or PDF bytes, from the label cache when this
+        exact content has been rendered before"""
+        if format == "zpl":
+            template = await self.get_template(location.whs_code)
+            key = self.cache.key(template.values(location), format, template=template.key)
+        else:
+            key = self.cache.key(label_fields(location), format)
+        # ZPL renders faster than the disk tier can read or write it.
+        disk = format == "pdf"
+        content = await self.cache.get(key, disk=disk)
+        if content is None:
+            if format == "zpl":
+                content = template.render(location).encode()
+            else:
+                content = await self.render_labels_pdf([location])
+            await self.cache.put(key, location.id, content, disk=disk)
+        return content
+
+    def queues_jobs(self) -> bool:
+        """Whether prints go through the print job queue rather than
+        straight to the backend"""
+        return self.backend.queue_jobs and self.dispatcher.running
+
+    async def queue_print(self, title: str, format: str, content: bytes, user: str, location_id: Optional[int] = None, labels: int = 1) -> Dict[str, Any]:
+        """Queue a print job for the dispatcher, returns it as PENDING"""
+        job = self.print_queue.enqueue(self.printer_name, title, format, content, user, location_id=location_id, labels=labels)
+        await self.db.flush()
+        job_id = job.id
+        await self.db.commit()
+        self.dispatcher.wake()
+        return {"job_id": job_id, "status": STATUS_PENDING, "queued": True}
 
     async def print_bin_label(
         self, 
@@ -99,22 +555,16 @@ class PrintingService:
     ) -> Dict[str, Any]:
         """Print bin location label"""
         try:
-            location = self.db.query(Location).filter(Location.id == location_id).first()
+            location = await self.get_location(location_id)
             if not location:
                 return {"ok": False, "error": {"code": "LOCATION_NOT_FOUND", "message": "Location not found"}}
             
-            if format.lower() == "zpl":
-                label_content = self.generate_bin_label_zpl(location)
-                content_type = "raw_base64"
-                content = base64.b64encode(label_content.encode()).decode()
-            elif format.lower() == "pdf":
-                label_content = self.generate_bin_label_pdf(location)
-                content_type = "pdf_base64"
-                content = base64.b64encode(label_content).decode()
-            else:
+            format = format.lower()
+            if format not in ("zpl", "pdf"):
                 return {"ok": False, "error": {"code": "INVALID_FORMAT", "message": "Format must be 'zpl' or 'pdf'"}}
+            label_content = await self.render_label(location, format)
             
-            if not self.api_key:
+            if not self.backend.configured:
                 await self.audit_service.log_action(
                     user_name=user,
                     action="generate_label",
@@ -124,58 +574,97 @@ class PrintingService:
                         "format": format
                     }
                 )
-                return {"ok": True, "data": {"content": content, "format": format, "printed": False, "message": "Label generated but not printed (PrintNode not configured)"}}
+                content = base64.b64encode(label_content).decode()
+                return {"ok": True, "data": {"content": content, "format": format, "printed": False, "message": f"Label generated but not printed ({self.backend.not_configured['message']})"}}
+            
+            title = f"Bin Label - {location.code}"
+            if self.queues_jobs():
+                queued = await self.queue_print(title, format, label_content, user, location_id=location_id)
+                await self.audit_service.log_action(
+                    user_name=user,
+                    action="print_label",
+                    payload={
+                        "location_id": location_id,
+                        "location_code": location.code,
+                        "format": format,
+                        "queue_job_id": queued["job_id"]
+                    }
+                )
+                return {"ok": True, "data": {**queued, "printed": False}}
             
-            printer_id = await self._find_printer_by_name()
-            if not printer_id:
-                return {"ok": False, "error": {"code": "PRINTER_NOT_FOUND", "message": f"Printer '{self.printer_name}' not found"}}
+            submitted = await self.backend.submit(self.printer_name, title, format, label_content)
+            if not submitted["ok"]:
+                return submitted
             
-            print_job = {
-                "printerId": printer_id,
-                "title": f"Bin Label - {location.code}",
-                "contentType": content_type,
-                "content": content,
-                "source": "WMS Bin Location System"
-            }
+            await self.audit_service.log_action(
+                user_name=user,
+                action="print_label",
+                payload={
+                    "location_id": location_id,
+                    "location_code": location.code,
+                    "format": format,
+                    "print_job_id": submitted["data"]
+                }
+            )
             
-            async with aiohttp.ClientSession() as session:
-                auth = aiohttp.BasicAuth(self.api_key, "")
-                async with session.post(f"{self.base_url}/printjobs", json=print_job, auth=auth) as response:
-                    if response.status == 201:
-                        result = await response.json()
-                        
-                        await self.audit_service.log_action(
-                            user_name=user,
-                            action="print_label",
-                            payload={
-                                "location_id": location_id,
-                                "location_code": location.code,
-                                "format": format,
-                                "print_job_id": result
-                            }
-                        )
-                        
-                        return {"ok": True, "data": {"job_id": result, "printed": True}}
-                    else:
-                        error_text = await response.text()
-                        return {"ok": False, "error": {"code": "PRINT_FAILED", "message": error_text}}
-                        
+            return {"ok": True, "data": {"job_id": submitted["data"], "printed": True}}
+        
+        except BulkheadFullError as e:
+            return {"ok": False, "error": {"code": "RENDER_BUSY", "message": str(e)}}
         except Exception as e:
             logger.error(f"Print label failed: {str(e)}")
             return {"ok": False, "error": {"code": "PRINT_ERROR", "message": str(e)}}
 
-    async def _find_printer_by_name(self) -> Optional[int]:
-        """Find printer ID by name"""
+    async def print_label_batch(
+        self,
+        whs: str,
+        scope: Dict[str, Any],
+        format: str = "zpl",
+        user: str = "system"
+    ) -> Dict[str, Any]:
+        """Render the labels of every location in a filter and send them
+        to the printer as a single print job"""
         try:
-            async with aiohttp.ClientSession() as session:
-                auth = aiohttp.BasicAuth(self.api_key, "")
-                async with session.get(f"{self.base_url}/printers", auth=auth) as response:
-                    if response.status == 200:
-                        printers = await response.json()
-                        for printer in printers:
-                            if printer.get("name") == self.printer_name:
-                                return printer.get("id")
-                    return None
+            format = format.lower()
+            if format not in ("zpl", "pdf"):
+                return {"ok": False, "error": {"code": "INVALID_FORMAT", "message": "Format must be 'zpl' or 'pdf'"}}
+            if not self.backend.configured:
+                return {"ok": False, "error": self.backend.not_configured}
+            
+            loaded = await self.get_batch_locations(whs, scope)
+            if not loaded["ok"]:
+                return loaded
+            locations = loaded["data"]
+            
+            if format == "zpl":
+                content = "".join(self.iter_batch_zpl(locations, await self.get_template(whs))).encode()
+            else:
+                content = await self.render_labels_pdf(locations)
+            
+            title = f"Bin Labels - {whs} ({len(locations)})"
+            if self.queues_jobs():
+                queued = await self.queue_print(title, format, content, user, labels=len(locations))
+                await self.audit_service.log_action(
+                    user_name=user,
+                    action="print_label_batch",
+                    payload={"whs": whs, "scope": scope, "format": format, "labels": len(locations), "queue_job_id": queued["job_id"]}
+                )
+                return {"ok": True, "data": {**queued, "labels": len(locations), "printed": False}}
+            
+            submitted = await self.backend.submit(self.printer_name, title, format, content)
+            if not submitted["ok"]:
+                return submitted
+            
+            await self.audit_service.log_action(
+                user_name=user,
+                action="print_label_batch",
+                payload={"whs": whs, "scope": scope, "format": format, "labels": len(locations), "print_job_id": submitted["data"]}
+            )
+            
+            return {"ok": True, "data": {"job_id": submitted["data"], "labels": len(locations), "printed": True}}
+        
+        except BulkheadFullError as e:
+            return {"ok": False, "error": {"code": "RENDER_BUSY", "message": str(e)}}
         except Exception as e:
-            logger.error(f"Error finding printer: {str(e)}")
-            return None
+            logger.error(f"Print label batch failed: {str(e)}")
+            return {"ok": False, "error": {"code": "PRINT_ERROR", "message": str(e)}}
@@ -1,58 +1,57 @@
 import logging
-from typing import Dict, Any, List
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app.wms.models import StockLocation, Movement
-from app.wms.services.sap_client import SAPClient
+from typing import Dict, Any, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert
+from app.wms.models import StockLocation, Movement, Location
 from app.wms.services.audit import WMSAuditService
+from app.wms.services.stock_ledger import StockLedger, ledger_key
+from app.wms.services.sap_outbox import SapOutboxService
 from app.wms.utils import generate_idempotency_key
 
 logger = logging.getLogger(__name__)
 
+# Location ids per IN (...) lookup; keeps SQL Server under 2100 parameters.
+LOCATION_LOOKUP_BATCH = 1000
+
 class PutawayService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        self.sap_client = SAPClient()
         self.audit_service = WMSAuditService(db)
+        self.ledger = StockLedger(db)
+        self.outbox = SapOutboxService(db)
 
     async def execute_putaway(
         self, 
         whs: str, 
         lines: List[Dict[str, Any]], 
         user: str,
-        create_good_receipt: bool = False
+        create_good_receipt: bool = False,
+        idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Execute put-away operation with optional SAP Good Receipt"""
+        """Execute put-away operation, optionally queueing a SAP Good Receipt"""
         try:
-            idempotency_key = generate_idempotency_key()
+            idempotency_key = idempotency_key or generate_idempotency_key()
             
-            with self.db.begin():
+            async with self.db.begin():
                 movements = []
                 
+                await self.ledger.increment([
+                    {
+                        "whs": whs,
+                        "location_id": line["toLocationId"],
+                        "item": line["item"],
+                        "lot": line.get("lot"),
+                        "qty": line["qty"]
+                    }
+                    for line in lines
+                ])
+                
                 for line in lines:
                     item_code = line["item"]
                     lot_no = line.get("lot")
                     qty = float(line["qty"])
                     to_location_id = line["toLocationId"]
                     
-                    stock_query = text("""
-                        MERGE wms.stock_location AS t
-                        USING (SELECT :whs whs_code, :loc location_id, :item item_code, :lot lot_no) s
-                        ON (t.whs_code=s.whs_code AND t.location_id=s.location_id AND t.item_code=s.item_code
-                            AND ISNULL(t.lot_no,'')=ISNULL(s.lot_no,''))
-                        WHEN MATCHED THEN UPDATE SET qty = t.qty + :qty, last_updated = SYSUTCDATETIME()
-                        WHEN NOT MATCHED THEN INSERT (whs_code, location_id, item_code, lot_no, qty)
-                                             VALUES (:whs, :loc, :item, :lot, :qty);
-                    """)
-                    
-                    self.db.execute(stock_query, {
-                        "whs": whs,
-                        "loc": to_location_id,
-                        "item": item_code,
-                        "lot": lot_no,
-                        "qty": qty
-                    })
-                    
                     movement = Movement(
                         type="RECEIPT",
                         whs_code_to=whs,
@@ -77,19 +76,18 @@ class PutawayService:
                         for line in lines
                     ]
                     
-                    sap_result = await self.sap_client.good_receipt(
+                    self.outbox.enqueue(
+                        doc_type="GoodReceipt",
                         whs=whs,
-                        reference=f"PUTAWAY-{idempotency_key}",
-                        lines=sap_lines,
-                        idempotency_key=idempotency_key
+                        payload={
+                            "whs": whs,
+                            "reference": f"PUTAWAY-{idempotency_key}",
+                            "lines": sap_lines
+                        },
+                        idempotency_key=idempotency_key,
+                        user=user,
+                        movement_key=idempotency_key
                     )
-                    
-                    if not sap_result.get("ok"):
-                        raise Exception(f"SAP Good Receipt failed: {sap_result.get('error')}")
-                    
-                    for movement in movements:
-                        movement.sap_doc_type = "GoodReceipt"
-                        movement.sap_doc_entry = sap_result.get("data", {}).get("docEntry")
                 
                 await self.audit_service.log_action(
                     user_name=user,
@@ -107,3 +105,152 @@ class PutawayService:
         except Exception as e:
             logger.error(f"Putaway operation failed: {str(e)}")
             return {"ok": False, "error": {"code": "PUTAWAY_FAILED", "message": str(e)}}
+
+    async def execute_bulk_putaway(
+        self, 
+        whs: str, 
+        lines: List[Dict[str, Any]], 
+        user: str,
+        create_good_receipt: bool = False,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Set-based put-away for large receipts.
+
+        All lines are validated up front. Lines for the same location/item/lot
+        are merged and applied to stock_location by the ledger in one
+        statement per batch, and the matching movements are bulk-inserted.
+        Any rejected line fails the whole receipt; per-line results are
+        returned either way.
+        """
+        try:
+            idempotency_key = idempotency_key or generate_idempotency_key()
+            reference = f"PUTAWAY-{idempotency_key}"
+            
+            async with self.db.begin():
+                results = await self._validate_putaway_lines(whs, lines)
+                rejected = [r for r in results if r["status"] == "REJECTED"]
+                if rejected:
+                    return {
+                        "ok": False,
+                        "data": {"lines": results},
+                        "error": {
+                            "code": "PUTAWAY_LINES_REJECTED",
+                            "message": f"{len(rejected)} of {len(lines)} lines rejected"
+                        }
+                    }
+                
+                ledger_lines = [
+                    {
+                        "whs": whs,
+                        "location_id": line["toLocationId"],
+                        "item": line["item"],
+                        "lot": line.get("lot"),
+                        "qty": line["qty"]
+                    }
+                    for line in lines
+                ]
+                stock_rows = await self.ledger.increment(ledger_lines)
+                
+                stock_keys = {}
+                for result, ledger_line in zip(results, ledger_lines):
+                    result["stock_row"] = stock_keys.setdefault(ledger_key(ledger_line), len(stock_keys))
+                    result["status"] = "APPLIED"
+                
+                if create_good_receipt:
+                    self.outbox.enqueue(
+                        doc_type="GoodReceipt",
+                        whs=whs,
+                        payload={
+                            "whs": whs,
+                            "reference": reference,
+                            "lines": [
+                                {
+                                    "item": line["item"],
+                                    "qty": float(line["qty"]),
+                                    "lot": line.get("lot")
+                                }
+                                for line in lines
+                            ]
+                        },
+                        # /putaway queues a GoodReceipt under the same client key.
+                        idempotency_key=f"{idempotency_key}-BULK",
+                        user=user,
+                        movement_key=idempotency_key
+                    )
+                
+                await self.db.execute(insert(Movement.__table__), [
+                    {
+                        "type": "RECEIPT",
+                        "whs_code_to": whs,
+                        "location_id_to": line["toLocationId"],
+                        "item_code": line["item"],
+                        "lot_no": line.get("lot"),
+                        "qty": float(line["qty"]),
+                        "reference": reference,
+                        "idempotency_key": idempotency_key,
+                        "created_by": user
+                    }
+                    for line in lines
+                ])
+                
+                await self.audit_service.log_action(
+                    user_name=user,
+                    action="bulk_putaway",
+                    payload={
+                        "whs": whs,
+                        "line_count": len(lines),
+                        "stock_rows": stock_rows,
+                        "create_good_receipt": create_good_receipt,
+                        "idempotency_key": idempotency_key
+                    }
+                )
+                
+                return {
+                    "ok": True,
+                    "data": {
+                        "movements_created": len(lines),
+                        "stock_rows_updated": stock_rows,
+                        "lines": results
+                    }
+                }
+                
+        except Exception as e:
+            logger.error(f"Bulk putaway operation failed: {str(e)}")
+            return {"ok": False, "error": {"code": "PUTAWAY_FAILED", "message": str(e)}}
+
+    async def _validate_putaway_lines(
+        self, 
+        whs: str, 
+        lines: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Check quantities and target locations, one result per input line"""
+        location_ids = sorted({line["toLocationId"] for line in lines})
+        valid_locations = set()
+        for start in range(0, len(location_ids), LOCATION_LOOKUP_BATCH):
+            batch = location_ids[start:start + LOCATION_LOOKUP_BATCH]
+            query = select(Location.id).where(
+                Location.whs_code == whs,
+                Location.is_active == True,
+                Location.id.in_(batch)
+            )
+            valid_locations.update((await self.db.scalars(query)).all())
+        
+        results = []
+        for index, line in enumerate(lines):
+            result = {
+                "line": index,
+                "item": line["item"],
+                "lot": line.get("lot"),
+                "qty": float(line["qty"]),
+                "toLocationId": line["toLocationId"],
+                "status": "ACCEPTED"
+            }
+            if float(line["qty"]) <= 0:
+                result["status"] = "REJECTED"
+                result["reason"] = "Quantity must be positive"
+            elif line["toLocationId"] not in valid_locations:
+                result["status"] = "REJECTED"
+                result["reason"] = f"Location {line['toLocationId']} is not an active location in {whs}"
+            results.append(result)
+        
+        return results
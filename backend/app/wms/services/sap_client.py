@@ -1,16 +1,279 @@
 import os
+import time
+import bisect
 import logging
 import aiohttp
 import asyncio
-from typing import Dict, Any, Optional
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List
 from app.wms.utils import generate_idempotency_key
 
 logger = logging.getLogger(__name__)
 
+SAP_DI_POOL_LIMIT = int(os.getenv("SAP_DI_POOL_LIMIT", "100"))
+SAP_DI_POOL_LIMIT_PER_HOST = int(os.getenv("SAP_DI_POOL_LIMIT_PER_HOST", "20"))
+SAP_DI_KEEPALIVE_SECONDS = float(os.getenv("SAP_DI_KEEPALIVE_SECONDS", "30"))
+SAP_DI_TIMEOUT_SECONDS = float(os.getenv("SAP_DI_TIMEOUT_SECONDS", "30"))
+SAP_BREAKER_FAILURE_THRESHOLD = int(os.getenv("SAP_BREAKER_FAILURE_THRESHOLD", "5"))
+SAP_BREAKER_RESET_SECONDS = float(os.getenv("SAP_BREAKER_RESET_SECONDS", "30"))
+SAP_BULKHEAD_SIZE = int(os.getenv("SAP_BULKHEAD_SIZE", "10"))
+SAP_BULKHEAD_WAIT_SECONDS = float(os.getenv("SAP_BULKHEAD_WAIT_SECONDS", "5"))
+
+# Error codes the DI service returns when SAP itself is unreachable; these
+# count against the circuit breaker, business rejections do not.
+SAP_UNAVAILABLE_CODES = {"CONNECTION_ERROR", "CONFIG_ERROR"}
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed millisecond buckets"""
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS_MS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.errors = 0
+
+    def observe(self, elapsed_ms: float, ok: bool = True):
+        self.counts[bisect.bisect_left(self.buckets, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if not ok:
+            self.errors += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + [float("inf")], self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            buckets[f"le_{bound}"] = cumulative
+        buckets["le_inf"] = self.count
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "sum_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+class SAPHttpPool:
+    """Process-wide keep-alive connection pool for the SAP DI service.
+
+    The aiohttp session is created lazily on first use inside the running
+    event loop and closed from the application's shutdown hook. Every
+    SAPClient shares it, so documents reuse open connections and the
+    connector limits cap concurrent requests to the DI service.
+    """
+
+    def __init__(self, timeout_seconds: float = SAP_DI_TIMEOUT_SECONDS):
+        self.timeout_seconds = timeout_seconds
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.latency: Dict[str, LatencyHistogram] = {}
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self._session is not None and not self._session.closed:
+            return self._session
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=SAP_DI_POOL_LIMIT,
+                    limit_per_host=SAP_DI_POOL_LIMIT_PER_HOST,
+                    keepalive_timeout=SAP_DI_KEEPALIVE_SECONDS
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout_seconds)
+                )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._lock = None
+
+    def observe(self, endpoint: str, elapsed_ms: float, ok: bool):
+        histogram = self.latency.get(endpoint)
+        if histogram is None:
+            histogram = self.latency[endpoint] = LatencyHistogram()
+        histogram.observe(elapsed_ms, ok)
+
+    def metrics(self) -> Dict[str, Any]:
+        connector = self._session.connector if self._session is not None and not self._session.closed else None
+        return {
+            "pool": {
+                "open": connector is not None,
+                "limit": SAP_DI_POOL_LIMIT,
+                "limit_per_host": SAP_DI_POOL_LIMIT_PER_HOST,
+                "keepalive_seconds": SAP_DI_KEEPALIVE_SECONDS,
+                "timeout_seconds": self.timeout_seconds
+            },
+            "latency": {endpoint: h.snapshot() for endpoint, h in sorted(self.latency.items())}
+        }
+
+sap_http_pool = SAPHttpPool()
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker for the SAP DI service.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast for reset_seconds. It then goes half-open and lets a single
+    probe through: success closes the circuit, failure re-opens it.
+    """
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(
+        self,
+        failure_threshold: int = SAP_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = SAP_BREAKER_RESET_SECONDS
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started_at: Optional[float] = None
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self._state = self.HALF_OPEN
+            self.probe_started_at = None
+        return self._state
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN:
+            # One probe at a time; a probe that never reported back (e.g. it
+            # was cancelled) is replaced after reset_seconds.
+            now = time.monotonic()
+            if self.probe_started_at is None or now - self.probe_started_at >= self.reset_seconds:
+                self.probe_started_at = now
+                return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self._state != self.CLOSED:
+            logger.info("SAP DI circuit closed")
+        self._state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self.failures >= self.failure_threshold):
+            self._open()
+
+    def _open(self):
+        if self._state != self.OPEN:
+            self.times_opened += 1
+            logger.warning(f"SAP DI circuit opened after {self.failures} failures, retrying in {self.reset_seconds:.0f}s")
+        self._state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.probe_started_at = None
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a probe through"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_seconds": self.reset_seconds,
+            "retry_after_seconds": round(self.retry_after(), 3),
+            "times_opened": self.times_opened,
+            "rejected": self.rejected
+        }
+
+class BulkheadFullError(Exception):
+    """Raised when no SAP DI slot frees up within the bulkhead wait"""
+
+class Bulkhead:
+    """Caps concurrent SAP DI requests; callers wait at most wait_seconds"""
+
+    def __init__(self, size: int = SAP_BULKHEAD_SIZE, wait_seconds: float = SAP_BULKHEAD_WAIT_SECONDS, name: str = "SAP DI"):
+        self.size = size
+        self.wait_seconds = wait_seconds
+        self.name = name
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.wait_seconds)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise BulkheadFullError(f"All {self.size} {self.name} slots busy for {self.wait_seconds:.1f}s")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected
+        }
+
+sap_circuit_breaker = CircuitBreaker()
+sap_bulkhead = Bulkhead()
+
 class SAPClient:
-    def __init__(self):
+    def __init__(
+        self,
+        pool: Optional[SAPHttpPool] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        bulkhead: Optional[Bulkhead] = None
+    ):
         self.base_url = os.getenv("SAP_DI_BASE_URL", "http://localhost:8001")
-        self.timeout = aiohttp.ClientTimeout(total=30)
+        self.pool = pool or sap_http_pool
+        self.breaker = breaker or sap_circuit_breaker
+        self.bulkhead = bulkhead or sap_bulkhead
         self.max_retries = 3
         self.retry_delay = 1.0
 
@@ -21,7 +284,7 @@ class SAPClient:
         data: Optional[Dict[str, Any]] = None,
         idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Make HTTP request to SAP DI service with retries"""
+        """Make HTTP request to SAP DI service with retries, behind the breaker and bulkhead"""
         url = f"{self.base_url}/{endpoint.lstrip('/')}"
         headers = {}
         
@@ -29,27 +292,72 @@ class SAPClient:
             headers["Idempotency-Key"] = idempotency_key
         
         for attempt in range(self.max_retries):
+            if not self.breaker.allow_request():
+                return self._circuit_open()
+            
             try:
-                async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                    async with session.request(method, url, json=data, headers=headers) as response:
-                        result = await response.json()
-                        
-                        if response.status == 200:
-                            return result
-                        else:
-                            logger.error(f"SAP DI service error: {response.status} - {result}")
-                            if attempt == self.max_retries - 1:
-                                return {"ok": False, "error": {"code": response.status, "message": str(result)}}
-                            
+                async with self.bulkhead.slot():
+                    # The circuit may have opened while this call queued for a slot.
+                    if self.breaker.state == CircuitBreaker.OPEN:
+                        self.breaker.rejected += 1
+                        return self._circuit_open()
+                    status, result = await self._send(method, url, endpoint, data, headers)
+            except BulkheadFullError as e:
+                return {"ok": False, "error": {"code": "BULKHEAD_FULL", "message": str(e)}}
             except Exception as e:
-                logger.error(f"SAP DI service request failed (attempt {attempt + 1}): {str(e)}")
+                self.breaker.record_failure()
+                message = str(e) or type(e).__name__
+                logger.error(f"SAP DI service request failed (attempt {attempt + 1}): {message}")
                 if attempt == self.max_retries - 1:
-                    return {"ok": False, "error": {"code": "CONNECTION_ERROR", "message": str(e)}}
+                    return {"ok": False, "error": {"code": "CONNECTION_ERROR", "message": message}}
                 
                 await asyncio.sleep(self.retry_delay * (attempt + 1))
+                continue
+            
+            if status == 200:
+                error_code = (result.get("error") or {}).get("code") if isinstance(result, dict) else None
+                if error_code in SAP_UNAVAILABLE_CODES:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                return result
+            
+            self.breaker.record_failure()
+            logger.error(f"SAP DI service error: {status} - {result}")
+            if attempt == self.max_retries - 1:
+                return {"ok": False, "error": {"code": status, "message": str(result)}}
         
         return {"ok": False, "error": {"code": "MAX_RETRIES_EXCEEDED", "message": "Failed after maximum retries"}}
 
+    def _circuit_open(self) -> Dict[str, Any]:
+        return {
+            "ok": False,
+            "error": {
+                "code": "CIRCUIT_OPEN",
+                "message": f"SAP DI service unavailable, retry in {self.breaker.retry_after():.0f}s"
+            }
+        }
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        endpoint: str,
+        data: Optional[Dict[str, Any]],
+        headers: Dict[str, str]
+    ):
+        """One HTTP round trip, recorded in the endpoint's latency histogram"""
+        started = time.perf_counter()
+        ok = False
+        try:
+            session = await self.pool.get_session()
+            async with session.request(method, url, json=data, headers=headers) as response:
+                result = await response.json()
+                ok = response.status == 200
+                return response.status, result
+        finally:
+            self.pool.observe(endpoint, (time.perf_counter() - started) * 1000, ok)
+
     async def health_check(self) -> Dict[str, Any]:
         """Check SAP DI service health"""
         return await self._make_request("GET", "/health")
@@ -0,0 +1,487 @@
+import os
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal
+from app.wms.models import SapOutbox, Movement
+from app.wms.services.sap_client import SAPClient
+from app.wms.utils import hash_payload
+
+logger = logging.getLogger(__name__)
+
+SAP_OUTBOX_ENABLED = os.getenv("SAP_OUTBOX_ENABLED", "true").lower() == "true"
+SAP_OUTBOX_POLL_SECONDS = float(os.getenv("SAP_OUTBOX_POLL_SECONDS", "1.0"))
+SAP_OUTBOX_BATCH_SIZE = int(os.getenv("SAP_OUTBOX_BATCH_SIZE", "50"))
+SAP_OUTBOX_MAX_ATTEMPTS = int(os.getenv("SAP_OUTBOX_MAX_ATTEMPTS", "10"))
+SAP_OUTBOX_BACKOFF_SECONDS = float(os.getenv("SAP_OUTBOX_BACKOFF_SECONDS", "2"))
+SAP_OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("SAP_OUTBOX_MAX_BACKOFF_SECONDS", "300"))
+# A PROCESSING entry older than this belongs to a worker that died mid-post.
+SAP_OUTBOX_LEASE_SECONDS = float(os.getenv("SAP_OUTBOX_LEASE_SECONDS", "300"))
+# Optional coalescing of Good Issue/Good Receipt lines per warehouse: a new
+# entry waits up to the window for others to share its SAP document.
+SAP_COALESCE_ENABLED = os.getenv("SAP_COALESCE_ENABLED", "false").lower() == "true"
+SAP_COALESCE_WINDOW_SECONDS = float(os.getenv("SAP_COALESCE_WINDOW_SECONDS", "5"))
+SAP_COALESCE_MAX_LINES = int(os.getenv("SAP_COALESCE_MAX_LINES", "200"))
+
+STATUS_PENDING = "PENDING"
+STATUS_PROCESSING = "PROCESSING"
+STATUS_SENT = "SENT"
+STATUS_FAILED = "FAILED"
+
+# SAPClient failed fast without reaching SAP; the attempt is not counted.
+DEFERRED_ERROR_CODES = {"CIRCUIT_OPEN", "BULKHEAD_FULL"}
+
+COALESCIBLE_DOC_TYPES = ("GoodIssue", "GoodReceipt")
+# Length of wms_sap_outbox.idempotency_key.
+OUTBOX_KEY_LENGTH = 64
+
+def outbox_key(doc_type: str, key: str) -> str:
+    """Outbox (and SAP Idempotency-Key) for a document: the operation's key
+    scoped by doc type, since clients may reuse one key across endpoints.
+    A key too long for the column is hashed."""
+    scoped = f"{doc_type}:{key}"
+    if len(scoped) <= OUTBOX_KEY_LENGTH:
+        return scoped
+    return f"{doc_type}:{hash_payload(key)[:40]}"
+
+class SapOutboxService:
+    """Queue SAP documents in the caller's transaction and manage the queue.
+
+    The entry commits or rolls back together with the stock change and the
+    movements it describes. Movements are linked through their idempotency
+    key (and optionally their type), which is how the dispatcher writes
+    sap_doc_type/sap_doc_entry back once SAP has accepted the document.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    def enqueue(
+        self,
+        doc_type: str,
+        whs: str,
+        payload: Dict[str, Any],
+        idempotency_key: str,
+        user: str,
+        movement_key: Optional[str] = None,
+        movement_type: Optional[str] = None
+    ) -> SapOutbox:
+        """Add a PENDING document; payload holds the SAPClient call arguments.
+
+        The entry's key is idempotency_key scoped by doc_type (outbox_key);
+        movement_key, which links the movements, stays the bare key.
+        """
+        next_attempt_at = datetime.utcnow()
+        if SAP_COALESCE_ENABLED and doc_type in COALESCIBLE_DOC_TYPES:
+            next_attempt_at += timedelta(seconds=SAP_COALESCE_WINDOW_SECONDS)
+        
+        entry = SapOutbox(
+            doc_type=doc_type,
+            whs_code=whs,
+            payload=json.dumps(payload, default=str),
+            idempotency_key=outbox_key(doc_type, idempotency_key),
+            movement_key=movement_key,
+            movement_type=movement_type,
+            status=STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=next_attempt_at,
+            created_by=user
+        )
+        self.db.add(entry)
+        return entry
+
+    async def list_entries(self, status: Optional[str] = None, limit: int = 100) -> List[SapOutbox]:
+        query = select(SapOutbox).order_by(SapOutbox.id.desc()).limit(limit)
+        if status:
+            query = query.where(SapOutbox.status == status)
+        return (await self.db.scalars(query)).all()
+
+    async def retry(self, entry_id: int) -> Dict[str, Any]:
+        """Put a FAILED entry back in the queue with a fresh attempt budget"""
+        try:
+            result = await self.db.execute(
+                update(SapOutbox)
+                .where(SapOutbox.id == entry_id, SapOutbox.status == STATUS_FAILED)
+                .values(status=STATUS_PENDING, attempts=0, next_attempt_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await self.db.commit()
+            if result.rowcount != 1:
+                return {"ok": False, "error": {"code": "NOT_FAILED", "message": f"Outbox entry {entry_id} is not in FAILED state"}}
+            return {"ok": True, "data": {"id": entry_id, "status": STATUS_PENDING}}
+        except Exception as e:
+            logger.error(f"Outbox retry failed: {str(e)}")
+            return {"ok": False, "error": {"code": "OUTBOX_RETRY_FAILED", "message": str(e)}}
+
+class SapOutboxDispatcher:
+    """Background worker that posts queued documents to the SAP DI service.
+
+    Entries are claimed in id order with a conditional update, so several
+    API workers can share one outbox. Within a batch, documents for the same
+    warehouse are posted in queue order and warehouses run concurrently. A
+    failed document is retried with exponential backoff (without holding
+    back the ones behind it) until SAP_OUTBOX_MAX_ATTEMPTS, after which it
+    is parked as FAILED for a manual retry. With coalescing on, Good
+    Issue/Good Receipt entries for one warehouse share multi-line documents.
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        sap_client: Optional[SAPClient] = None,
+        poll_interval: float = SAP_OUTBOX_POLL_SECONDS,
+        batch_size: int = SAP_OUTBOX_BATCH_SIZE,
+        max_attempts: int = SAP_OUTBOX_MAX_ATTEMPTS,
+        coalesce: bool = SAP_COALESCE_ENABLED,
+        coalesce_max_lines: int = SAP_COALESCE_MAX_LINES
+    ):
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.sap_client = sap_client or SAPClient()
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.coalesce = coalesce
+        self.coalesce_max_lines = coalesce_max_lines
+        self.stats = {"sent": 0, "documents": 0, "retried": 0, "deferred": 0, "failed": 0}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("SAP outbox dispatcher started")
+
+    async def stop(self, timeout: float = 10.0):
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+        logger.info("SAP outbox dispatcher stopped")
+
+    def wake(self):
+        """Skip the rest of the poll interval"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                processed = await self.dispatch_once()
+            except Exception as e:
+                logger.error(f"SAP outbox dispatch failed: {str(e)}")
+                processed = 0
+
+            if processed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def dispatch_once(self) -> int:
+        """Claim due entries and post them, returns the number of entries handled"""
+        breaker = getattr(self.sap_client, "breaker", None)
+        limit = self.batch_size
+        if breaker is not None and breaker.state != breaker.CLOSED:
+            # Leave the queue alone while the circuit is open; once half-open,
+            # send a single document as the probe.
+            if breaker.state == breaker.OPEN:
+                return 0
+            limit = 1
+
+        entries = await self._claim_batch(limit)
+        if self.coalesce:
+            documents = await self._coalesce(entries)
+        else:
+            documents = [[entry] for entry in entries]
+
+        by_warehouse: Dict[str, List[List[SapOutbox]]] = OrderedDict()
+        for document in documents:
+            by_warehouse.setdefault(document[0].whs_code, []).append(document)
+
+        await asyncio.gather(*(self._dispatch_sequence(group) for group in by_warehouse.values()))
+        return sum(len(document) for document in documents)
+
+    async def _claim_batch(self, limit: int) -> List[SapOutbox]:
+        now = datetime.utcnow()
+        lease_expired = now - timedelta(seconds=SAP_OUTBOX_LEASE_SECONDS)
+
+        async with self.session_factory() as db:
+            candidates = (await db.scalars(
+                select(SapOutbox)
+                .where(or_(
+                    and_(SapOutbox.status == STATUS_PENDING, SapOutbox.next_attempt_at <= now),
+                    and_(SapOutbox.status == STATUS_PROCESSING, SapOutbox.locked_at < lease_expired)
+                ))
+                .order_by(SapOutbox.id)
+                .limit(limit)
+            )).all()
+            db.expunge_all()
+
+            claimed = [entry for entry in candidates if await self._claim_entry(db, entry, now)]
+            await db.commit()
+
+        return claimed
+
+    async def _claim_entry(self, db: AsyncSession, entry: SapOutbox, now: datetime) -> bool:
+        """Conditionally move one entry to PROCESSING; False if another worker won"""
+        result = await db.execute(
+            update(SapOutbox)
+            .where(
+                SapOutbox.id == entry.id,
+                SapOutbox.status == entry.status,
+                SapOutbox.attempts == entry.attempts
+            )
+            .values(status=STATUS_PROCESSING, locked_at=now, attempts=entry.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            return False
+        entry.status = STATUS_PROCESSING
+        entry.attempts += 1
+        return True
+
+    async def _coalesce(self, entries: List[SapOutbox]) -> List[List[SapOutbox]]:
+        """Group claimed Good Issue/Good Receipt entries into multi-line documents.
+
+        A due first-attempt entry opens a document for its doc type and
+        warehouse and pulls in younger PENDING entries for the same key, up
+        to coalesce_max_lines. A key whose pending lines already reach the
+        limit is flushed before its window ends. The composition is saved as
+        batch_key, which is also the document's Idempotency-Key, so a retry
+        re-sends exactly the same document.
+        """
+        now = datetime.utcnow()
+        documents: List[List[SapOutbox]] = []
+        retries: Dict[str, List[SapOutbox]] = OrderedDict()
+        groups: Dict[Tuple[str, str], List[SapOutbox]] = OrderedDict()
+
+        for entry in entries:
+            if entry.doc_type not in COALESCIBLE_DOC_TYPES:
+                documents.append([entry])
+            elif entry.batch_key:
+                retries.setdefault(entry.batch_key, []).append(entry)
+            elif entry.attempts > 1:
+                # Already posted once on its own, under its own key.
+                documents.append([entry])
+            else:
+                groups.setdefault((entry.doc_type, entry.whs_code), []).append(entry)
+
+        async with self.session_factory() as db:
+            pending = (await db.scalars(
+                select(SapOutbox)
+                .where(
+                    SapOutbox.status == STATUS_PENDING,
+                    SapOutbox.batch_key.is_(None),
+                    SapOutbox.attempts == 0,
+                    SapOutbox.doc_type.in_(COALESCIBLE_DOC_TYPES)
+                )
+                .order_by(SapOutbox.id)
+                .limit(self.coalesce_max_lines * self.batch_size)
+            )).all()
+            db.expunge_all()
+
+            riders: Dict[Tuple[str, str], List[SapOutbox]] = OrderedDict()
+            for entry in pending:
+                riders.setdefault((entry.doc_type, entry.whs_code), []).append(entry)
+
+            for key, candidates in riders.items():
+                if key not in groups and sum(map(line_count, candidates)) < self.coalesce_max_lines:
+                    continue
+                group = groups.setdefault(key, [])
+                lines = sum(map(line_count, group))
+                for entry in candidates:
+                    if lines and lines + line_count(entry) > self.coalesce_max_lines:
+                        break
+                    if await self._claim_entry(db, entry, now):
+                        group.append(entry)
+                        lines += line_count(entry)
+
+            for batch_key, members in retries.items():
+                siblings = (await db.scalars(
+                    select(SapOutbox)
+                    .where(
+                        SapOutbox.batch_key == batch_key,
+                        SapOutbox.status == STATUS_PENDING,
+                        SapOutbox.id.notin_([entry.id for entry in members])
+                    )
+                    .order_by(SapOutbox.id)
+                )).all()
+                db.expunge_all()
+                members.extend([entry for entry in siblings if await self._claim_entry(db, entry, now)])
+                documents.append(sorted(members, key=lambda entry: entry.id))
+
+            for group in groups.values():
+                for document in split_by_lines(group, self.coalesce_max_lines):
+                    if len(document) > 1:
+                        batch_key = "batch-" + hash_payload(sorted(entry.idempotency_key for entry in document))[:40]
+                        await db.execute(
+                            update(SapOutbox)
+                            .where(SapOutbox.id.in_([entry.id for entry in document]))
+                            .values(batch_key=batch_key)
+                            .execution_options(synchronize_session=False)
+                        )
+                        for entry in document:
+                            entry.batch_key = batch_key
+                    documents.append(document)
+
+            await db.commit()
+
+        return documents
+
+    async def _dispatch_sequence(self, documents: List[List[SapOutbox]]):
+        for document in documents:
+            await self._dispatch(document)
+
+    async def _dispatch(self, document: List[SapOutbox]):
+        try:
+            result = await self._post(document)
+        except Exception as e:
+            result = {"ok": False, "error": {"code": "DISPATCH_ERROR", "message": str(e)}}
+
+        if result.get("ok"):
+            await self._mark_sent(document, result.get("data") or {})
+        elif (result.get("error") or {}).get("code") in DEFERRED_ERROR_CODES:
+            await self._mark_deferred(document)
+        else:
+            await self._mark_failed(document, result.get("error"))
+
+    async def _post(self, document: List[SapOutbox]) -> Dict[str, Any]:
+        entry = document[0]
+        payload = json.loads(entry.payload)
+        idempotency_key = entry.idempotency_key
+        if len(document) > 1:
+            payloads = [json.loads(member.payload) for member in document]
+            payload = {
+                "whs": entry.whs_code,
+                "reference": combined_reference([p["reference"] for p in payloads]),
+                "lines": [line for p in payloads for line in p["lines"]]
+            }
+            idempotency_key = entry.batch_key
+
+        if entry.doc_type == "GoodReceipt":
+            return await self.sap_client.good_receipt(idempotency_key=idempotency_key, **payload)
+        if entry.doc_type == "GoodIssue":
+            return await self.sap_client.good_issue(idempotency_key=idempotency_key, **payload)
+        if entry.doc_type == "InventoryTransfer":
+            return await self.sap_client.inventory_transfer(idempotency_key=idempotency_key, **payload)
+        return {"ok": False, "error": {"code": "UNKNOWN_DOC_TYPE", "message": entry.doc_type}}
+
+    async def _mark_sent(self, document: List[SapOutbox], data: Dict[str, Any]):
+        doc_entry = data.get("docEntry")
+        # The DI service returns docNum as a string.
+        doc_num = data.get("docNum")
+        doc_num = int(doc_num) if str(doc_num).isdigit() else None
+
+        async with self.session_factory() as db:
+            async with db.begin():
+                await db.execute(
+                    update(SapOutbox)
+                    .where(SapOutbox.id.in_([entry.id for entry in document]))
+                    .values(
+                        status=STATUS_SENT,
+                        sap_doc_entry=doc_entry,
+                        sap_doc_num=doc_num,
+                        last_error=None,
+                        locked_at=None,
+                        sent_at=datetime.utcnow()
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                for entry in document:
+                    if not entry.movement_key:
+                        continue
+                    movements = update(Movement).where(Movement.idempotency_key == entry.movement_key)
+                    if entry.movement_type:
+                        movements = movements.where(Movement.type == entry.movement_type)
+                    await db.execute(
+                        movements
+                        .values(sap_doc_type=entry.doc_type, sap_doc_entry=doc_entry)
+                        .execution_options(synchronize_session=False)
+                    )
+
+        self.stats["sent"] += len(document)
+        self.stats["documents"] += 1
+        ids = ", ".join(str(entry.id) for entry in document)
+        logger.info(f"SAP {document[0].doc_type} posted for outbox entries {ids}: docEntry={doc_entry}")
+
+    async def _mark_failed(self, document: List[SapOutbox], error: Optional[Dict[str, Any]]):
+        now = datetime.utcnow()
+        entry = document[0]
+        ids = ", ".join(str(member.id) for member in document)
+        if entry.attempts >= self.max_attempts:
+            values = {"status": STATUS_FAILED}
+            self.stats["failed"] += len(document)
+            logger.error(f"SAP {entry.doc_type} for outbox entries {ids} failed permanently: {error}")
+        else:
+            delay = min(SAP_OUTBOX_MAX_BACKOFF_SECONDS, SAP_OUTBOX_BACKOFF_SECONDS * 2 ** (entry.attempts - 1))
+            values = {"status": STATUS_PENDING, "next_attempt_at": now + timedelta(seconds=delay)}
+            self.stats["retried"] += len(document)
+            logger.warning(f"SAP {entry.doc_type} for outbox entries {ids} failed (attempt {entry.attempts}), retrying in {delay:.0f}s: {error}")
+
+        async with self.session_factory() as db:
+            await db.execute(
+                update(SapOutbox)
+                .where(SapOutbox.id.in_([member.id for member in document]))
+                .values(locked_at=None, last_error=json.dumps(error, default=str), **values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _mark_deferred(self, document: List[SapOutbox]):
+        """Hand entries back to the queue without spending an attempt"""
+        async with self.session_factory() as db:
+            await db.execute(
+                update(SapOutbox)
+                .where(SapOutbox.id.in_([entry.id for entry in document]))
+                .values(status=STATUS_PENDING, attempts=SapOutbox.attempts - 1, locked_at=None)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        self.stats["deferred"] += len(document)
+
+def line_count(entry: SapOutbox) -> int:
+    return len(json.loads(entry.payload).get("lines", []))
+
+def split_by_lines(entries: List[SapOutbox], max_lines: int) -> List[List[SapOutbox]]:
+    """Split entries, in order, into documents of at most max_lines lines"""
+    documents = []
+    current: List[SapOutbox] = []
+    lines = 0
+    for entry in entries:
+        n = line_count(entry)
+        if current and lines + n > max_lines:
+            documents.append(current)
+            current, lines = [], 0
+        current.append(entry)
+        lines += n
+    if current:
+        documents.append(current)
+    return documents
+
+def combined_reference(references: List[str]) -> str:
+    """Reference for a coalesced document; SAP Comments hold 254 characters"""
+    unique = list(OrderedDict.fromkeys(r for r in references if r))
+    reference = ", ".join(unique)
+    if len(reference) > 200:
+        reference = f"{unique[0]} (+{len(unique) - 1} more)"
+    return reference
+
+sap_outbox_dispatcher = SapOutboxDispatcher()
@@ -0,0 +1,268 @@
+import logging
+from typing import Dict, Any, List, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, Select
+from app.wms.models import StockLocation
+
+logger = logging.getLogger(__name__)
+
+# SQL Server caps a statement at 2100 parameters; 5 parameters per line.
+MSSQL_BATCH_SIZE = 400
+# SQLite's default SQLITE_MAX_VARIABLE_NUMBER is 32766.
+SQLITE_BATCH_SIZE = 5000
+
+class InsufficientStockError(Exception):
+    """Raised when a guarded decrement cannot be applied to every line"""
+
+    def __init__(self, lines: List[Dict[str, Any]]):
+        self.lines = lines
+        items = ", ".join(
+            f"{line['item']} at location {line['location_id']}" for line in lines
+        )
+        super().__init__(f"Insufficient stock or concurrent change for {items}")
+
+def ledger_key(line: Dict[str, Any]) -> Tuple[str, int, str, str]:
+    """Identity of a stock_location row: warehouse, location, item and lot"""
+    return (line["whs"], line["location_id"], line["item"], line.get("lot") or "")
+
+def merge_lines(lines: List[Dict[str, Any]], accumulate: bool = True) -> List[Dict[str, Any]]:
+    """Collapse lines that touch the same stock row into one.
+
+    Quantities are summed for increments/decrements; for set-quantity the
+    last line for a key wins. A MERGE may not match a target row twice, so
+    every batch is merged before it is sent.
+    """
+    merged: Dict[Tuple[str, int, str, str], Dict[str, Any]] = {}
+    for line in lines:
+        key = ledger_key(line)
+        qty = float(line["qty"])
+        if key in merged and accumulate:
+            merged[key]["qty"] += qty
+        else:
+            merged[key] = {
+                "whs": line["whs"],
+                "location_id": line["location_id"],
+                "item": line["item"],
+                "lot": line.get("lot"),
+                "qty": qty
+            }
+    return list(merged.values())
+
+def net_lines(
+    decrements: List[Dict[str, Any]],
+    increments: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Net decrements against increments of the same stock row.
+
+    Returns (decrements, increments) with at most one line per row: rows
+    whose net change is negative go to the guarded decrement, positive ones
+    to the increment and rows that net to zero are left alone. A move
+    A->B followed by B->C therefore succeeds with B empty, and whether a
+    request fits the stock on hand depends on its net effect, not on the
+    order of its lines. Quantities are rounded to the qty column's scale.
+    """
+    net: Dict[Tuple[str, int, str, str], Dict[str, Any]] = {}
+    for sign, lines in ((-1, decrements), (1, increments)):
+        for line in lines:
+            key = ledger_key(line)
+            if key not in net:
+                net[key] = {
+                    "whs": line["whs"],
+                    "location_id": line["location_id"],
+                    "item": line["item"],
+                    "lot": line.get("lot"),
+                    "qty": 0.0
+                }
+            net[key]["qty"] += sign * float(line["qty"])
+
+    decrements, increments = [], []
+    for line in net.values():
+        qty = round(line["qty"], 3)
+        if qty < 0:
+            decrements.append({**line, "qty": -qty})
+        elif qty > 0:
+            increments.append({**line, "qty": qty})
+    return decrements, increments
+
+class StockLedger:
+    """Batched writes against stock_location.
+
+    Lines are dicts with ``whs``, ``location_id``, ``item``, ``lot`` and
+    ``qty``. Each operation emits one statement per batch: a table-valued
+    MERGE/UPDATE on SQL Server and ``INSERT ... ON CONFLICT``/``UPDATE ... FROM``
+    on SQLite, so the number of round trips does not grow with each line.
+    Callers own the transaction.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.round_trips = 0
+
+    @property
+    def dialect(self) -> str:
+        return self.db.bind.dialect.name
+
+    @property
+    def table_name(self) -> str:
+        preparer = self.db.bind.dialect.identifier_preparer
+        return preparer.format_table(StockLocation.__table__)
+
+    @property
+    def _upsert_timestamp(self) -> str:
+        # MERGE stamps last_updated itself; the ON CONFLICT insert carries it
+        # as a sixth VALUES column.
+        return "" if self.dialect == "mssql" else ", CURRENT_TIMESTAMP"
+
+    @property
+    def batch_size(self) -> int:
+        return MSSQL_BATCH_SIZE if self.dialect == "mssql" else SQLITE_BATCH_SIZE
+
+    def _upsert_template(self, mssql_qty: str, sqlite_qty: str) -> str:
+        if self.dialect == "mssql":
+            return f"""
+                MERGE {{table}} WITH (HOLDLOCK) AS t
+                USING (VALUES {{values}}) AS s (whs_code, location_id, item_code, lot_no, qty)
+                ON (t.whs_code=s.whs_code AND t.location_id=s.location_id AND t.item_code=s.item_code
+                    AND ISNULL(t.lot_no,'')=ISNULL(s.lot_no,''))
+                WHEN MATCHED THEN UPDATE SET qty = {mssql_qty}, last_updated = SYSUTCDATETIME()
+                WHEN NOT MATCHED THEN INSERT (whs_code, location_id, item_code, lot_no, qty, last_updated)
+                                     VALUES (s.whs_code, s.location_id, s.item_code, s.lot_no, s.qty, SYSUTCDATETIME());
+            """
+        return f"""
+            INSERT INTO {{table}} (whs_code, location_id, item_code, lot_no, qty, last_updated)
+            VALUES {{values}}
+            ON CONFLICT (whs_code, location_id, item_code, coalesce(lot_no, ''))
+            DO UPDATE SET qty = {sqlite_qty}, last_updated = excluded.last_updated
+        """
+
+    async def increment(self, lines: List[Dict[str, Any]]) -> int:
+        """Add qty to each stock row, creating rows that do not exist yet"""
+        lines = merge_lines(lines)
+        template = self._upsert_template("t.qty + s.qty", "qty + excluded.qty")
+        await self._execute_batches(template, lines, row_suffix=self._upsert_timestamp)
+        return len(lines)
+
+    async def set_quantity(self, lines: List[Dict[str, Any]]) -> int:
+        """Overwrite qty on each stock row, creating rows that do not exist yet"""
+        lines = merge_lines(lines, accumulate=False)
+        template = self._upsert_template("s.qty", "excluded.qty")
+        await self._execute_batches(template, lines, row_suffix=self._upsert_timestamp)
+        return len(lines)
+
+    async def set_quantity_from(self, source: Select) -> int:
+        """Overwrite qty from a query instead of a list of lines.
+
+        source selects (whs_code, location_id, item_code, lot_no, qty) with
+        at most one row per stock row; the upsert runs as one statement, so
+        the rows never travel through Python. Returns the rows written.
+        """
+        source_sql, params = self._render(source)
+        if self.dialect == "mssql":
+            template = """
+                MERGE {table} WITH (HOLDLOCK) AS t
+                USING ({source}) AS s (whs_code, location_id, item_code, lot_no, qty)
+                ON (t.whs_code=s.whs_code AND t.location_id=s.location_id AND t.item_code=s.item_code
+                    AND ISNULL(t.lot_no,'')=ISNULL(s.lot_no,''))
+                WHEN MATCHED THEN UPDATE SET qty = s.qty, last_updated = SYSUTCDATETIME()
+                WHEN NOT MATCHED THEN INSERT (whs_code, location_id, item_code, lot_no, qty, last_updated)
+                                     VALUES (s.whs_code, s.location_id, s.item_code, s.lot_no, s.qty, SYSUTCDATETIME());
+            """
+        else:
+            # WHERE true keeps SQLite from reading ON CONFLICT as a join constraint.
+            template = """
+                INSERT INTO {table} (whs_code, location_id, item_code, lot_no, qty, last_updated)
+                SELECT s.*, CURRENT_TIMESTAMP FROM ({source}) AS s WHERE true
+                ON CONFLICT (whs_code, location_id, item_code, coalesce(lot_no, ''))
+                DO UPDATE SET qty = excluded.qty, last_updated = excluded.last_updated
+            """
+        result = await self.db.execute(text(template.format(table=self.table_name, source=source_sql)), params)
+        self.round_trips += 1
+        return result.rowcount
+
+    def _render(self, statement: Select) -> Tuple[str, Dict[str, Any]]:
+        """Compile a Core statement for this dialect with named parameters"""
+        dialect = type(self.db.bind.dialect)(paramstyle="named")
+        compiled = statement.compile(dialect=dialect)
+        return str(compiled), dict(compiled.params)
+
+    async def decrement(self, lines: List[Dict[str, Any]]) -> int:
+        """Subtract qty from each stock row, only where enough stock is on hand.
+
+        Raises InsufficientStockError listing every line that could not be
+        decremented; the caller's transaction must then be rolled back.
+        """
+        lines = merge_lines(lines)
+        if self.dialect == "mssql":
+            template = """
+                UPDATE t SET qty = t.qty - s.qty, last_updated = SYSUTCDATETIME()
+                OUTPUT inserted.whs_code, inserted.location_id, inserted.item_code, inserted.lot_no
+                FROM {table} AS t WITH (UPDLOCK)
+                JOIN (VALUES {values}) AS s (whs_code, location_id, item_code, lot_no, qty)
+                  ON t.whs_code=s.whs_code AND t.location_id=s.location_id AND t.item_code=s.item_code
+                 AND ISNULL(t.lot_no,'')=ISNULL(s.lot_no,'')
+                WHERE t.qty >= s.qty
+            """
+        else:
+            template = """
+                WITH s (whs_code, location_id, item_code, lot_no, qty) AS (VALUES {values})
+                UPDATE {table} SET qty = {table}.qty - s.qty, last_updated = CURRENT_TIMESTAMP
+                FROM s
+                WHERE {table}.whs_code=s.whs_code AND {table}.location_id=s.location_id
+                  AND {table}.item_code=s.item_code
+                  AND coalesce({table}.lot_no,'')=coalesce(s.lot_no,'')
+                  AND {table}.qty >= s.qty
+                RETURNING {table}.whs_code, {table}.location_id, {table}.item_code, {table}.lot_no
+            """
+        results = await self._execute_batches(template, lines, returning=True)
+
+        applied = {
+            (row.whs_code, row.location_id, row.item_code, row.lot_no or "")
+            for row in results
+        }
+        missing = [line for line in lines if ledger_key(line) not in applied]
+        if missing:
+            raise InsufficientStockError(missing)
+        return len(lines)
+
+    async def move(self, decrements: List[Dict[str, Any]], increments: List[Dict[str, Any]]) -> int:
+        """Apply the two sides of a set of moves as one net change per stock
+        row (see net_lines); raises InsufficientStockError like decrement.
+        Returns the rows changed."""
+        decrements, increments = net_lines(decrements, increments)
+        if decrements:
+            await self.decrement(decrements)
+        if increments:
+            await self.increment(increments)
+        return len(decrements) + len(increments)
+
+    async def _execute_batches(
+        self,
+        template: str,
+        lines: List[Dict[str, Any]],
+        row_suffix: str = "",
+        returning: bool = False
+    ) -> list:
+        """Render each batch of lines into the VALUES list of one statement"""
+        rows = []
+
+        for start in range(0, len(lines), self.batch_size):
+            batch = lines[start:start + self.batch_size]
+            params: Dict[str, Any] = {}
+            values = []
+            for n, line in enumerate(batch):
+                params.update({
+                    f"w{n}": line["whs"],
+                    f"l{n}": line["location_id"],
+                    f"i{n}": line["item"],
+                    f"lot{n}": line.get("lot"),
+                    f"q{n}": line["qty"]
+                })
+                values.append(f"(:w{n}, :l{n}, :i{n}, :lot{n}, :q{n}{row_suffix})")
+
+            statement = text(template.format(table=self.table_name, values=", ".join(values)))
+            result = await self.db.execute(statement, params)
+            self.round_trips += 1
+            if returning:
+                rows.extend(result.fetchall())
+
+        return rows
@@ -1,33 +1,59 @@
 import logging
-from typing import Dict, Any, List
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from typing import Dict, Any, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.wms.models import StockLocation, Movement
-from app.wms.services.sap_client import SAPClient
 from app.wms.services.audit import WMSAuditService
+from app.wms.services.stock_ledger import StockLedger
+from app.wms.services.sap_outbox import SapOutboxService
 from app.wms.utils import generate_idempotency_key
 
 logger = logging.getLogger(__name__)
 
 class TransferService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
-        self.sap_client = SAPClient()
         self.audit_service = WMSAuditService(db)
+        self.ledger = StockLedger(db)
+        self.outbox = SapOutboxService(db)
 
     async def execute_internal_move(
         self, 
         whs: str, 
         moves: List[Dict[str, Any]], 
-        user: str
+        user: str,
+        idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
         """Execute internal move within same warehouse (no SAP document)"""
         try:
-            idempotency_key = generate_idempotency_key()
+            idempotency_key = idempotency_key or generate_idempotency_key()
             
-            with self.db.begin():
+            async with self.db.begin():
                 movements = []
                 
+                # Netted per stock row, so chained moves (A->B, B->C) work with B empty.
+                await self.ledger.move(
+                    [
+                        {
+                            "whs": whs,
+                            "location_id": move["fromLocationId"],
+                            "item": move["item"],
+                            "lot": move.get("lot"),
+                            "qty": move["qty"]
+                        }
+                        for move in moves
+                    ],
+                    [
+                        {
+                            "whs": whs,
+                            "location_id": move["toLocationId"],
+                            "item": move["item"],
+                            "lot": move.get("lot"),
+                            "qty": move["qty"]
+                        }
+                        for move in moves
+                    ]
+                )
+                
                 for move in moves:
                     item_code = move["item"]
                     lot_no = move.get("lot")
@@ -35,36 +61,6 @@ class TransferService:
                     from_location_id = move["fromLocationId"]
                     to_location_id = move["toLocationId"]
                     
-                    dec_query = text("""
-                        UPDATE wms.stock_location
-                           SET qty = qty - :q, last_updated = SYSUTCDATETIME()
-                         WHERE whs_code=:w AND location_id=:loc AND item_code=:it
-                           AND (lot_no IS NULL OR lot_no=:lot) AND qty >= :q
-                    """)
-                    
-                    result = self.db.execute(dec_query, {
-                        "q": qty, "w": whs, "loc": from_location_id, 
-                        "it": item_code, "lot": lot_no
-                    })
-                    
-                    if result.rowcount == 0:
-                        raise Exception(f"Insufficient stock or concurrent change for {item_code}")
-                    
-                    inc_query = text("""
-                        MERGE wms.stock_location AS t
-                        USING (SELECT :w whs_code, :loc location_id, :it item_code, :lot lot_no) s
-                        ON (t.whs_code=s.whs_code AND t.location_id=s.location_id AND t.item_code=s.item_code
-                            AND ISNULL(t.lot_no,'')=ISNULL(s.lot_no,''))
-                        WHEN MATCHED THEN UPDATE SET qty = t.qty + :q, last_updated = SYSUTCDATETIME()
-                        WHEN NOT MATCHED THEN INSERT (whs_code, location_id, item_code, lot_no, qty)
-                                             VALUES (:w, :loc, :it, :lot, :q);
-                    """)
-                    
-                    self.db.execute(inc_query, {
-                        "q": qty, "w": whs, "loc": to_location_id,
-                        "it": item_code, "lot": lot_no
-                    })
-                    
                     movement = Movement(
                         type="MOVE_INTERNAL",
                         whs_code_from=whs,
@@ -103,15 +99,40 @@ class TransferService:
         to_whs: str, 
         moves: List[Dict[str, Any]], 
         user: str,
-        create_sap_transfer: bool = True
+        create_sap_transfer: bool = True,
+        idempotency_key: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Execute cross-warehouse transfer with SAP Inventory Transfer"""
+        """Execute cross-warehouse transfer, queueing the SAP Inventory Transfer"""
         try:
-            idempotency_key = generate_idempotency_key()
+            idempotency_key = idempotency_key or generate_idempotency_key()
             
-            with self.db.begin():
+            async with self.db.begin():
                 movements = []
                 
+                # Netted per stock row, so chained moves (A->B, B->C) work with B empty.
+                await self.ledger.move(
+                    [
+                        {
+                            "whs": from_whs,
+                            "location_id": move["fromLocationId"],
+                            "item": move["item"],
+                            "lot": move.get("lot"),
+                            "qty": move["qty"]
+                        }
+                        for move in moves
+                    ],
+                    [
+                        {
+                            "whs": to_whs,
+                            "location_id": move["toLocationId"],
+                            "item": move["item"],
+                            "lot": move.get("lot"),
+                            "qty": move["qty"]
+                        }
+                        for move in moves
+                    ]
+                )
+                
                 for move in moves:
                     item_code = move["item"]
                     lot_no = move.get("lot")
@@ -119,36 +140,6 @@ class TransferService:
                     from_location_id = move["fromLocationId"]
                     to_location_id = move["toLocationId"]
                     
-                    dec_query = text("""
-                        UPDATE wms.stock_location
-                           SET qty = qty - :q, last_updated = SYSUTCDATETIME()
-                         WHERE whs_code=:w AND location_id=:loc AND item_code=:it
-                           AND (lot_no IS NULL OR lot_no=:lot) AND qty >= :q
-                    """)
-                    
-                    result = self.db.execute(dec_query, {
-                        "q": qty, "w": from_whs, "loc": from_location_id,
-                        "it": item_code, "lot": lot_no
-                    })
-                    
-                    if result.rowcount == 0:
-                        raise Exception(f"Insufficient stock or concurrent change for {item_code}")
-                    
-                    inc_query = text("""
-                        MERGE wms.stock_location AS t
-                        USING (SELECT :w whs_code, :loc location_id, :it item_code, :lot lot_no) s
-                        ON (t.whs_code=s.whs_code AND t.location_id=s.location_id AND t.item_code=s.item_code
-                            AND ISNULL(t.lot_no,'')=ISNULL(s.lot_no,''))
-                        WHEN MATCHED THEN UPDATE SET qty = t.qty + :q, last_updated = SYSUTCDATETIME()
-                        WHEN NOT MATCHED THEN INSERT (whs_code, location_id, item_code, lot_no, qty)
-                                             VALUES (:w, :loc, :it, :lot, :q);
-                    """)
-                    
-                    self.db.execute(inc_query, {
-                        "q": qty, "w": to_whs, "loc": to_location_id,
-                        "it": item_code, "lot": lot_no
-                    })
-                    
                     movement = Movement(
                         type="TRANSFER_WAREHOUSE",
                         whs_code_from=from_whs,
@@ -175,20 +166,19 @@ class TransferService:
                         for move in moves
                     ]
                     
-                    sap_result = await self.sap_client.inventory_transfer(
-                        from_whs=from_whs,
-                        to_whs=to_whs,
-                        reference=f"TRANSFER-{idempotency_key}",
-                        lines=sap_lines,
-                        idempotency_key=idempotency_key
+                    self.outbox.enqueue(
+                        doc_type="InventoryTransfer",
+                        whs=from_whs,
+                        payload={
+                            "from_whs": from_whs,
+                            "to_whs": to_whs,
+                            "reference": f"TRANSFER-{idempotency_key}",
+                            "lines": sap_lines
+                        },
+                        idempotency_key=idempotency_key,
+                        user=user,
+                        movement_key=idempotency_key
                     )
-                    
-                    if not sap_result.get("ok"):
-                        raise Exception(f"SAP Inventory Transfer failed: {sap_result.get('error')}")
-                    
-                    for movement in movements:
-                        movement.sap_doc_type = "InventoryTransfer"
-                        movement.sap_doc_entry = sap_result.get("data", {}).get("docEntry")
                 
                 await self.audit_service.log_action(
                     user_name=user,
@@ -0,0 +1,159 @@
+"""Audit retention: archive size, retention run time and read-through pages.
+
+Seeds an audit log (default 1,000,000 rows over a year), seals the hash
+chain, copies the database, and runs AuditRetentionJob on one copy with
+--retention-days. It then reports:
+
+* retention - rows moved, run time, and payload bytes in the table
+              against the compressed archive on disk
+* pages     - audit trail pages from the retained log (hot table +
+              archive read-through) against the same pages from the
+              untouched log, all of which must return the same records
+
+and checks that the chain still verifies after the move.
+
+    cd backend
+    python -m benchmarks.bench_audit_archive --rows 1000000 --retention-days 180
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app.wms.models import AuditLog
+from app.wms.services.audit import WMSAuditService
+from app.wms.services.audit_archive import AuditArchive, AuditRetentionJob
+from app.wms.services.audit_chain import AuditChainSealer, verify_chain
+from benchmarks.bench_audit_query import seed_audit_log
+from benchmarks.common import BenchDatabase, print_report
+
+
+def archive_bytes(root: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(folder, name))
+        for folder, _, names in os.walk(root) for name in names
+    )
+
+
+async def walk(service, pages: int, limit: int, **filters):
+    """Follow next_cursor for `pages` pages; returns ids and median page ms"""
+    ids, timings, cursor = [], [], None
+    for _ in range(pages):
+        started = time.perf_counter()
+        page = await service.get_audit_trail(limit=limit, cursor=cursor, **filters)
+        timings.append((time.perf_counter() - started) * 1000)
+        ids.extend(record["id"] for record in page["records"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    return ids, sorted(timings)[len(timings) // 2]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--retention-days", type=int, default=180)
+    parser.add_argument("--checkpoint-rows", type=int, default=50000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=17)
+    args = parser.parse_args()
+
+    archive_root = tempfile.mkdtemp(prefix="wms_audit_archive_")
+    retained = BenchDatabase()
+    control = None
+    try:
+        started = time.perf_counter()
+        seed_audit_log(retained, args.rows, args.seed)
+        await AuditChainSealer(retained.AsyncSessionLocal, checkpoint_rows=args.checkpoint_rows).seal()
+        print(f"seeded and sealed {args.rows} audit rows in {time.perf_counter() - started:.1f}s")
+        control_path = retained.path + ".control"
+        shutil.copyfile(retained.path, control_path)
+        control = BenchDatabase(control_path)
+
+        # Column bytes of the rows that retention will move, as the table stores them.
+        cutoff = datetime.combine(date.today() - timedelta(days=args.retention_days), datetime.min.time())
+        with retained.engine.connect() as conn:
+            table_bytes = conn.execute(
+                select(func.sum(
+                    8 + func.length(AuditLog.ts) + func.length(AuditLog.user_name) + func.length(AuditLog.action)
+                    + func.coalesce(func.length(AuditLog.payload), 0) + func.coalesce(func.length(AuditLog.payload_hash), 0)
+                    + func.coalesce(func.length(AuditLog.chain_hash), 0)
+                )).where(AuditLog.ts < cutoff)
+            ).scalar() or 0
+
+        archive = AuditArchive(archive_root)
+        job = AuditRetentionJob(
+            retained.AsyncSessionLocal, archive, retention_days=args.retention_days,
+            database_url=str(retained.engine.url)
+        )
+        started = time.perf_counter()
+        moved = await job.run_once()
+        retention_seconds = time.perf_counter() - started
+        with retained.engine.connect() as conn:
+            hot_rows = conn.execute(select(func.count()).select_from(AuditLog)).scalar()
+        stored = archive_bytes(archive_root)
+        print_report(f"retention of rows older than {args.retention_days} days", [{
+            "moved": moved,
+            "hot_rows": hot_rows,
+            "days": job.stats["days_written"],
+            "seconds": retention_seconds,
+            "table_mb": table_bytes / 1e6,
+            "archive_mb": stored / 1e6,
+        }])
+
+        rows = []
+        same = True
+        async with retained.AsyncSessionLocal() as retained_db, control.AsyncSessionLocal() as control_db:
+            retained_service = WMSAuditService(retained_db, archive=archive)
+            control_service = WMSAuditService(control_db, archive=AuditArchive(os.path.join(archive_root, "none")))
+
+            # Start a few pages above the oldest row left in the table, so the walk crosses into the archive.
+            crossing = {"until": (await retained_db.execute(
+                select(AuditLog.ts).order_by(AuditLog.ts, AuditLog.id).limit(1).offset(args.limit * 4)
+            )).scalar()}
+            days = archive.days()
+            deep_archive = {"until": days[len(days) // 2]["newest"][0]}
+
+            cases = [
+                ("newest pages (table only)", 5, {}),
+                ("across the boundary", 8, crossing),
+                ("deep in the archive", 5, deep_archive),
+                ("one user, in the archive", 5, {"user_name": "user07", **deep_archive}),
+                ("rare action, across", 3, {"action": "receive", **crossing}),
+            ]
+            for label, pages, filters in cases:
+                archived_ids, archived_ms = await walk(retained_service, pages, args.limit, **filters)
+                control_ids, control_ms = await walk(control_service, pages, args.limit, **filters)
+                same = same and archived_ids == control_ids
+                rows.append({"pages": label, "records": len(archived_ids), "read_through_ms": archived_ms, "table_ms": control_ms})
+
+            archived_id = (await retained_db.scalar(select(func.min(AuditLog.id)))) - 1
+            started = time.perf_counter()
+            entry = await retained_service.get_audit_entry(archived_id)
+            entry_ms = (time.perf_counter() - started) * 1000
+            control_entry = await control_service.get_audit_entry(archived_id)
+            same = same and entry == control_entry
+            rows.append({"pages": "single archived entry", "records": 1, "read_through_ms": entry_ms, "table_ms": "-"})
+
+        print_report(f"audit trail pages of {args.limit} (median page)", rows)
+
+        verified = await verify_chain(retained.AsyncSessionLocal, str(retained.engine.url), workers=1)
+        if moved:
+            print(f"\narchive: {stored / table_bytes:.1%} of the rows' column bytes in the table ({table_bytes / stored:.1f}x smaller)")
+        print(f"{'PASS' if same else 'FAIL'}  read-through pages match the untouched log")
+        print(f"{'PASS' if verified['valid'] else 'FAIL'}  chain verifies after retention"
+              f" ({verified['segments_archived']} archived segment(s) skipped, {verified['rows_verified']} rows checked)")
+    finally:
+        await retained.dispose()
+        if control:
+            await control.dispose()
+        shutil.rmtree(archive_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
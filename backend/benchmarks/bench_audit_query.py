@@ -0,0 +1,130 @@
+"""Audit trail paging: keyset (ts, id) pages vs OFFSET pages.
+
+Seeds wms_audit_log (default 5,000,000 rows from 50 users and 20
+actions over a year) and times WMSAuditService.get_audit_trail for the
+first page, a page deep into the trail, filtered pages and a payload
+page, against the same pages read with LIMIT/OFFSET. Keyset pages must
+return the same records as the OFFSET pages.
+
+    cd backend
+    python -m benchmarks.bench_audit_query --rows 5000000
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from app.wms.models import AuditLog
+from app.wms.services.audit import WMSAuditService, encode_cursor
+from benchmarks.common import BenchDatabase, print_report
+
+ACTIONS = [
+    "putaway", "issue", "move_internal", "transfer_warehouse", "create_count_session", "enter_counts",
+    "apply_count_adjustments", "generate_label", "print_label", "update_location", "bulk_generate_locations",
+    "bulk_putaway", "pick", "claim_count_task", "complete_count_task", "upload_counts", "retry_sap",
+    "pack", "ship", "receive"
+]
+
+
+def seed_audit_log(bench_db: BenchDatabase, rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64(datetime.utcnow() - timedelta(days=365), "us")
+    offsets = np.sort(rng.integers(0, 365 * 86400 * 10**6, size=rows))
+    ts = np.char.replace(np.datetime_as_string(start + offsets.astype("timedelta64[us]"), unit="us"), "T", " ").tolist()
+    users = [f"user{n:02d}" for n in rng.integers(0, 50, size=rows).tolist()]
+    actions = [ACTIONS[n - 1] for n in rng.zipf(1.5, size=rows).clip(1, len(ACTIONS)).tolist()]
+    payload = json.dumps({"whs": "01", "lines": [{"item": "ITEM0001", "qty": 5, "toLocationId": 12}]})
+
+    raw = bench_db.engine.raw_connection()
+    try:
+        raw.cursor().executemany(
+            f"INSERT INTO {AuditLog.__tablename__} (ts, user_name, action, payload) VALUES (?, ?, ?, ?)",
+            zip(ts, users, actions, [payload] * rows)
+        )
+        raw.commit()
+    finally:
+        raw.close()
+
+
+async def offset_page(db, offset: int, limit: int, user_name=None, action=None):
+    query = select(AuditLog.id, AuditLog.ts, AuditLog.user_name, AuditLog.action)
+    if user_name:
+        query = query.where(AuditLog.user_name == user_name)
+    if action:
+        query = query.where(AuditLog.action == action)
+    rows = (await db.execute(
+        query.order_by(AuditLog.ts.desc(), AuditLog.id.desc()).offset(offset).limit(limit)
+    )).all()
+    return [row.id for row in rows]
+
+
+async def timed_ms(coro_fn, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await coro_fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, sorted(timings)[len(timings) // 2]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--depth", type=float, default=0.5, help="position of the deep page, as a share of the trail")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    bench_db = BenchDatabase()
+    try:
+        started = time.perf_counter()
+        seed_audit_log(bench_db, args.rows, args.seed)
+        print(f"seeded {args.rows} audit rows in {time.perf_counter() - started:.1f}s")
+
+        deep = int(args.rows * args.depth)
+        rows = []
+        same = True
+        async with bench_db.AsyncSessionLocal() as db:
+            service = WMSAuditService(db)
+
+            # The record just above the deep page gives its keyset cursor.
+            anchor = (await db.execute(
+                select(AuditLog.ts, AuditLog.id).order_by(AuditLog.ts.desc(), AuditLog.id.desc()).offset(deep - 1).limit(1)
+            )).one()
+            deep_cursor = encode_cursor(anchor.ts, anchor.id)
+            user_anchor = (await db.execute(
+                select(AuditLog.ts, AuditLog.id).where(AuditLog.user_name == "user07")
+                .order_by(AuditLog.ts.desc(), AuditLog.id.desc()).offset(999).limit(1)
+            )).one()
+
+            cases = [
+                ("first page", {}, 0, {}),
+                (f"page at row {deep}", {"cursor": deep_cursor}, deep, {}),
+                ("user, page 11", {"user_name": "user07", "cursor": encode_cursor(user_anchor.ts, user_anchor.id)}, 1000, {"user_name": "user07"}),
+                ("rare action, first page", {"action": "receive"}, 0, {"action": "receive"}),
+            ]
+            for label, kwargs, offset, filters in cases:
+                page, keyset_ms = await timed_ms(lambda: service.get_audit_trail(limit=args.limit, **kwargs), args.repeat)
+                ids, offset_ms = await timed_ms(lambda: offset_page(db, offset, args.limit, **filters), args.repeat)
+                same = same and [record["id"] for record in page["records"]] == ids
+                rows.append({"query": label, "keyset_ms": keyset_ms, "offset_ms": offset_ms, "rows": len(ids)})
+
+            _, payload_ms = await timed_ms(
+                lambda: service.get_audit_trail(limit=args.limit, cursor=deep_cursor, payload="json"), args.repeat
+            )
+            rows.append({"query": "deep page + json payload", "keyset_ms": payload_ms, "offset_ms": "-", "rows": args.limit})
+
+        print_report(f"audit trail pages of {args.limit} over {args.rows} rows (median of {args.repeat})", rows)
+        print(f"\n{'PASS' if same else 'FAIL'}  keyset pages match OFFSET pages")
+    finally:
+        await bench_db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
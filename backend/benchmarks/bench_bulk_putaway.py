@@ -0,0 +1,111 @@
+"""Put-away throughput: per-line loop vs set-based bulk put-away.
+
+Three variants receive the same receipt into a seeded SQLite database:
+
+* per-line    - one upsert and one ORM Movement flush per line (the
+                original MERGE-per-line shape)
+* loop        - PutawayService.execute_putaway
+* bulk        - PutawayService.execute_bulk_putaway
+
+    cd backend
+    python -m benchmarks.bench_bulk_putaway --lines 5000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import event
+
+from app.wms.models import Movement
+from app.wms.services.putaway import PutawayService
+from app.wms.services.stock_ledger import StockLedger
+from benchmarks.common import BenchDatabase, print_report, seed_locations
+
+
+async def per_line_putaway(db, whs, lines, user):
+    """The pre-ledger shape: one stock statement and one movement per line"""
+    ledger = StockLedger(db)
+    async with db.begin():
+        for line in lines:
+            await ledger.increment([{
+                "whs": whs,
+                "location_id": line["toLocationId"],
+                "item": line["item"],
+                "lot": line.get("lot"),
+                "qty": line["qty"]
+            }])
+            db.add(Movement(
+                type="RECEIPT",
+                whs_code_to=whs,
+                location_id_to=line["toLocationId"],
+                item_code=line["item"],
+                lot_no=line.get("lot"),
+                qty=float(line["qty"]),
+                created_by=user
+            ))
+            await db.flush()
+    return {"ok": True}
+
+
+def build_receipt(line_count: int, locations: int, seed: int = 7):
+    rng = random.Random(seed)
+    return [
+        {
+            "item": f"RCV{rng.randrange(200):04d}",
+            "lot": rng.choice([None, "LOT-A", "LOT-B"]),
+            "qty": rng.randrange(1, 50),
+            "toLocationId": rng.randrange(1, locations + 1)
+        }
+        for _ in range(line_count)
+    ]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--locations", type=int, default=2000)
+    args = parser.parse_args()
+
+    receipt = build_receipt(args.lines, args.locations)
+    rows = []
+
+    for label in ("per-line", "loop", "bulk"):
+        bench_db = BenchDatabase()
+        try:
+            seed_locations(bench_db, locations=args.locations, items_per_location=1)
+            statements = []
+            event.listen(
+                bench_db.async_engine.sync_engine,
+                "before_cursor_execute",
+                lambda *a: statements.append(1)
+            )
+
+            async with bench_db.AsyncSessionLocal() as db:
+                started = time.perf_counter()
+                if label == "per-line":
+                    result = await per_line_putaway(db, "01", receipt, "bench")
+                elif label == "loop":
+                    result = await PutawayService(db).execute_putaway("01", receipt, "bench")
+                else:
+                    result = await PutawayService(db).execute_bulk_putaway("01", receipt, "bench")
+                elapsed = time.perf_counter() - started
+
+            if not result.get("ok"):
+                raise RuntimeError(f"{label} put-away failed: {result.get('error')}")
+
+            rows.append({
+                "mode": label,
+                "lines": args.lines,
+                "seconds": elapsed,
+                "lines_per_s": args.lines / elapsed,
+                "statements": len(statements),
+            })
+        finally:
+            await bench_db.dispose()
+
+    print_report(f"put-away of {args.lines} lines over {args.locations} locations", rows)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
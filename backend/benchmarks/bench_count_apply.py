@@ -0,0 +1,185 @@
+"""Count adjustment apply: per-detail loop vs set-based apply.
+
+Seeds a count session (default 10,000 locations x 5 items = 50,000
+details), enters counted quantities with a share of variances, then
+applies the session with:
+
+* loop       - the pre-set-based shape: every detail loaded into Python,
+               one ORM Movement and one adjusted flag per variance line
+* set-based  - CountingService.apply_count_adjustments
+
+Both runs start from identical databases and must end with the same
+stock, movements and adjusted flags.
+
+    cd backend
+    python -m benchmarks.bench_count_apply --locations 10000 --items 5
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import event, select, func, update
+
+from app.wms.models import CountSession, CountDetail, Movement, StockLocation
+from app.wms.services.counting import CountingService
+from app.wms.services.sap_outbox import SapOutboxService
+from app.wms.services.stock_ledger import StockLedger
+from app.wms.utils import generate_idempotency_key
+from benchmarks.common import BenchDatabase, print_report, seed_locations
+
+
+async def loop_apply(db, session_id: int, create_sap_adjustments: bool, comment: str, user: str):
+    """The per-detail apply this benchmark replaces"""
+    idempotency_key = generate_idempotency_key()
+    outbox = SapOutboxService(db)
+    async with db.begin():
+        session = await db.scalar(select(CountSession).where(CountSession.id == session_id))
+        details = (await db.scalars(select(CountDetail).where(CountDetail.session_id == session_id))).all()
+        adjustments = []
+        stock_updates = []
+
+        for detail in details:
+            if detail.counted_qty is None:
+                continue
+            diff = float(detail.counted_qty) - float(detail.expected_qty)
+            if abs(diff) <= 0.001:
+                continue
+            stock_updates.append({
+                "whs": session.whs_code,
+                "location_id": detail.location_id,
+                "item": detail.item_code,
+                "lot": detail.lot_no,
+                "qty": detail.counted_qty
+            })
+            movement_type = "ADJUST_POS" if diff > 0 else "ADJUST_NEG"
+            db.add(Movement(
+                type=movement_type,
+                whs_code_to=session.whs_code if diff > 0 else None,
+                whs_code_from=session.whs_code if diff < 0 else None,
+                location_id_to=detail.location_id if diff > 0 else None,
+                location_id_from=detail.location_id if diff < 0 else None,
+                item_code=detail.item_code,
+                lot_no=detail.lot_no,
+                qty=abs(diff),
+                reference=f"COUNT-{session_id}-{comment}",
+                idempotency_key=idempotency_key,
+                created_by=user
+            ))
+            detail.adjusted = True
+            adjustments.append({"item": detail.item_code, "lot": detail.lot_no, "diff": diff})
+
+        await StockLedger(db).set_quantity(stock_updates)
+
+        if create_sap_adjustments:
+            for doc_type, suffix, lines in (
+                ("GoodReceipt", "POS", [a for a in adjustments if a["diff"] > 0]),
+                ("GoodIssue", "NEG", [a for a in adjustments if a["diff"] < 0]),
+            ):
+                if lines:
+                    outbox.enqueue(
+                        doc_type=doc_type,
+                        whs=session.whs_code,
+                        payload={
+                            "whs": session.whs_code,
+                            "reference": f"COUNT-ADJ-{session_id}",
+                            "lines": [{"item": a["item"], "qty": abs(a["diff"]), "lot": a["lot"]} for a in lines]
+                        },
+                        idempotency_key=f"{idempotency_key}-{suffix}",
+                        user=user,
+                        movement_key=idempotency_key,
+                        movement_type=f"ADJUST_{suffix}"
+                    )
+
+        session.status = "CLOSED"
+        session.closed_at = func.now()
+    return {"ok": True, "data": {"adjustments_applied": len(adjustments)}}
+
+
+async def prepare_session(bench_db: BenchDatabase, args) -> int:
+    seed_locations(bench_db, locations=args.locations, items_per_location=args.items, qty=10.0)
+    async with bench_db.AsyncSessionLocal() as db:
+        result = await CountingService(db).create_count_session("01", {"all": True}, "bench")
+    session_id = result["data"]["session_id"]
+
+    # Same pseudo-random counts in every run: most match, some are over or short.
+    rng = random.Random(args.seed)
+    details = CountDetail.__table__
+    with bench_db.engine.begin() as conn:
+        conn.execute(update(details).where(details.c.session_id == session_id).values(counted_qty=details.c.expected_qty))
+        ids = [row.id for row in conn.execute(select(details.c.id).where(details.c.session_id == session_id))]
+        varied = [detail_id for detail_id in ids if rng.random() < args.variance]
+        for start in range(0, len(varied), 5000):
+            batch = varied[start:start + 5000]
+            conn.execute(
+                update(details).where(details.c.id.in_([d for d in batch if d % 2])).values(counted_qty=details.c.expected_qty + 3)
+            )
+            conn.execute(
+                update(details).where(details.c.id.in_([d for d in batch if not d % 2])).values(counted_qty=details.c.expected_qty - 2)
+            )
+    return session_id
+
+
+async def outcome(bench_db: BenchDatabase, session_id: int):
+    async with bench_db.AsyncSessionLocal() as db:
+        stock = await db.scalar(select(func.sum(StockLocation.qty)))
+        movements = (await db.execute(
+            select(Movement.type, func.count(), func.sum(Movement.qty)).group_by(Movement.type).order_by(Movement.type)
+        )).all()
+        adjusted = await db.scalar(select(func.count()).where(CountDetail.session_id == session_id, CountDetail.adjusted == True))
+    return float(stock), [(t, n, float(q)) for t, n, q in movements], adjusted
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=5, help="stocked items per location")
+    parser.add_argument("--variance", type=float, default=0.2, help="share of details counted off")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    outcomes = {}
+    for label in ("loop", "set-based"):
+        bench_db = BenchDatabase()
+        try:
+            session_id = await prepare_session(bench_db, args)
+            statements = []
+            event.listen(
+                bench_db.async_engine.sync_engine,
+                "before_cursor_execute",
+                lambda *a: statements.append(1)
+            )
+
+            async with bench_db.AsyncSessionLocal() as db:
+                started = time.perf_counter()
+                if label == "loop":
+                    result = await loop_apply(db, session_id, True, "bench", "bench")
+                else:
+                    result = await CountingService(db).apply_count_adjustments(session_id, True, "bench", "bench")
+                elapsed = time.perf_counter() - started
+
+            if not result.get("ok"):
+                raise RuntimeError(f"{label} apply failed: {result.get('error')}")
+
+            outcomes[label] = await outcome(bench_db, session_id)
+            rows.append({
+                "mode": label,
+                "details": args.locations * args.items,
+                "variances": result["data"]["adjustments_applied"],
+                "seconds": elapsed,
+                "statements": len(statements),
+            })
+        finally:
+            await bench_db.dispose()
+
+    print_report(f"count apply of {args.locations * args.items} details ({args.variance:.0%} variances)", rows)
+    same = outcomes["loop"] == outcomes["set-based"]
+    print(f"\n{'PASS' if same else 'FAIL'}  same stock, movements and adjusted flags")
+    if not same:
+        for label, (stock, movements, adjusted) in outcomes.items():
+            print(f"      {label}: stock={stock} movements={movements} adjusted={adjusted}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
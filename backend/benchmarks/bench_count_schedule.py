@@ -0,0 +1,195 @@
+"""Cycle count scheduler: ABC/velocity classification over a movement history.
+
+Seeds a warehouse (default 20,000 locations, 5,000 items) and a synthetic
+movement history (default 2,000,000 rows over 90 days, item popularity
+following a Zipf-like curve), then measures:
+
+* load      - streaming the history from the database into NumPy columns
+* classify  - per-item/per-location aggregation and ABC classes, NumPy vs
+              the same aggregation with Python dicts (results must match)
+* plan      - the full CycleCountScheduler.plan for one day
+
+and finally replays the scheduler for --simulate-days days to check that
+A locations are counted more often than B, and B more often than C.
+
+    cd backend
+    python -m benchmarks.bench_count_schedule --movements 2000000
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import text
+
+from app.wms.models import Movement
+from app.wms.services.count_scheduler import (
+    CycleCountScheduler, classify, select_due, COUNT_FREQUENCY_DAYS, CLASS_NAMES
+)
+from benchmarks.common import BenchDatabase, print_report, seed_locations
+
+
+def seed_history(bench_db: BenchDatabase, args):
+    """Stock rows spread over the items and a skewed movement history"""
+    rng = np.random.default_rng(args.seed)
+    seed_locations(bench_db, locations=args.locations, items_per_location=2, qty=50.0)
+    with bench_db.engine.begin() as conn:
+        conn.execute(text(
+            f"UPDATE wms_stock_location SET item_code = 'ITEM' || printf('%05d', (location_id * 7 + id) % {args.items})"
+        ))
+        stock = conn.execute(text("SELECT location_id, item_code FROM wms_stock_location ORDER BY id")).all()
+
+    # Movements hit stock rows with Zipf-like popularity by item.
+    item_rank = rng.permutation(args.items)
+    stock_items = np.array([int(code[4:]) for _, code in stock])
+    weights = 1.0 / (item_rank[stock_items] + 1.0) ** 1.1
+    rows = rng.choice(len(stock), size=args.movements, p=weights / weights.sum())
+    kinds = rng.random(args.movements)
+    other = rng.integers(1, args.locations + 1, size=args.movements)
+    qty = rng.integers(1, 21, size=args.movements).astype(np.float64)
+    # Oldest first, as ids grow with created_at in a live ledger.
+    now = np.datetime64(datetime.combine(date.today(), datetime.min.time()), "us")
+    age = np.sort(rng.integers(0, args.days * 86400 * 10**6, size=args.movements))[::-1]
+    created_at = np.char.replace(np.datetime_as_string(now - age.astype("timedelta64[us]"), unit="us"), "T", " ")
+
+    location = np.array([loc for loc, _ in stock], dtype=np.int64)[rows]
+    item = np.array([code for _, code in stock], dtype=object)[rows]
+    issue, putaway = kinds < 0.6, (kinds >= 0.6) & (kinds < 0.9)
+    movement_type = np.where(issue, "ISSUE", np.where(putaway, "PUTAWAY", "TRANSFER")).astype(object)
+    location_from = np.where(putaway, 0, location)
+    location_to = np.where(issue, 0, np.where(putaway, location, other))
+
+    def column(values, blank=0):
+        return [None if value == blank else value for value in values.tolist()]
+
+    from_ids, to_ids = column(location_from), column(location_to)
+    table = Movement.__table__
+    raw = bench_db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.executemany(
+            f"INSERT INTO {table.name} (type, whs_code_from, location_id_from, whs_code_to, location_id_to, "
+            "item_code, qty, created_by, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            zip(
+                movement_type.tolist(),
+                ("01" if loc else None for loc in from_ids), from_ids,
+                ("01" if loc else None for loc in to_ids), to_ids,
+                item.tolist(), qty.tolist(), ["bench"] * args.movements, created_at.tolist()
+            )
+        )
+        raw.commit()
+    finally:
+        raw.close()
+    return stock
+
+
+def python_classify(rows, location_ids, stock):
+    """classify() with dicts and sorted(), the shape this replaces"""
+    item_value, item_lines, touches = {}, {}, {}
+    for item, location_from, location_to, qty in rows:
+        item_value[item] = item_value.get(item, 0.0) + float(qty)
+        item_lines[item] = item_lines.get(item, 0) + 1
+        for location in (location_from, location_to):
+            if location:
+                touches[location] = touches.get(location, 0) + 1
+
+    def classes(values):
+        total = sum(values.values())
+        result, running = {}, 0.0
+        for key, value in sorted(values.items(), key=lambda kv: -kv[1]):
+            share = running / total if total else 1.0
+            result[key] = 2 if value <= 0 else (0 if share < 0.80 else 1 if share < 0.95 else 2)
+            running += value
+        return result
+
+    value_class, lines_class = classes(item_value), classes(item_lines)
+    item_class = {item: min(value_class[item], lines_class[item]) for item in item_value}
+    location_touches = {location: touches.get(location, 0) for location in location_ids}
+    velocity_class = classes(location_touches)
+    location_class = dict(velocity_class)
+    for location, item in stock:
+        location_class[location] = min(location_class[location], item_class.get(item, 2))
+    return np.array([location_class[location] for location in location_ids], dtype=np.int8)
+
+
+def simulate(location_class, touches, days):
+    """Run select_due for `days` days and return counts per location"""
+    days_since = np.full(len(location_class), np.inf)
+    counts = np.zeros(len(location_class), dtype=np.int64)
+    for _ in range(days):
+        chosen = select_due(location_class, touches, days_since)
+        counts[chosen] += 1
+        days_since += 1
+        days_since[chosen] = 1
+    return counts
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movements", type=int, default=2000000)
+    parser.add_argument("--locations", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=90, help="days of history")
+    parser.add_argument("--simulate-days", type=int, default=360)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    bench_db = BenchDatabase()
+    try:
+        started = time.perf_counter()
+        stock = seed_history(bench_db, args)
+        print(f"seeded {args.movements} movements in {time.perf_counter() - started:.1f}s")
+
+        rows = []
+        async with bench_db.AsyncSessionLocal() as db:
+            scheduler = CycleCountScheduler(db)
+            since = datetime.combine(date.today() - timedelta(days=args.days + 1), datetime.min.time())
+
+            started = time.perf_counter()
+            history = await scheduler.load_history("01", since)
+            rows.append({"step": "load (db -> numpy)", "rows": len(history), "seconds": time.perf_counter() - started})
+
+            location_ids = np.unique(np.array([location for location, _ in stock], dtype=np.int64))
+            stock_location_ids = np.array([location for location, _ in stock], dtype=np.int64)
+            stock_items = [item for _, item in stock]
+
+            started = time.perf_counter()
+            classes = classify(history, location_ids, stock_location_ids, stock_items)
+            rows.append({"step": "classify (numpy)", "rows": len(history), "seconds": time.perf_counter() - started})
+
+            raw_rows = list(zip(
+                (history.items[i] for i in history.item.tolist()),
+                history.location_from.tolist(), history.location_to.tolist(), history.qty.tolist()
+            ))
+            started = time.perf_counter()
+            expected = python_classify(raw_rows, location_ids.tolist(), stock)
+            rows.append({"step": "classify (python)", "rows": len(history), "seconds": time.perf_counter() - started})
+
+            started = time.perf_counter()
+            plan = await scheduler.plan("01")
+            rows.append({"step": "plan (load + classify + due)", "rows": plan["movements_read"], "seconds": time.perf_counter() - started})
+
+        print_report(f"cycle count schedule over {len(history)} movements, {len(location_ids)} locations", rows)
+        print(f"\nclasses: {plan['classes']}  scheduled today: {plan['scheduled']} in {len(plan['scopes'])} session(s)")
+
+        same = np.array_equal(classes["location_class"], expected)
+        print(f"\n{'PASS' if same else 'FAIL'}  numpy and python classes match")
+
+        location_class = classes["location_class"]
+        counts = simulate(location_class, classes["touches"], args.simulate_days)
+        per_class = []
+        for index, name in enumerate(CLASS_NAMES):
+            members = location_class == index
+            if members.any():
+                per_class.append((name, counts[members].mean(), args.simulate_days / COUNT_FREQUENCY_DAYS[index]))
+        for name, actual, target in per_class:
+            print(f"      {name}: {actual:.2f} counts per location in {args.simulate_days} days (target {target:.2f})")
+        ordered = all(a[1] > b[1] for a, b in zip(per_class, per_class[1:]))
+        print(f"{'PASS' if ordered else 'FAIL'}  A counted more often than B, B more often than C")
+    finally:
+        await bench_db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
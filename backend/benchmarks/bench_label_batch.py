@@ -0,0 +1,85 @@
+"""Label batches: one request per label vs one batch request.
+
+Seeds one warehouse (default 2,000 locations) and renders the labels of
+one aisle as N calls to POST /locations/{id}/label against one call to
+POST /labels/batch, for ZPL and PDF. Reports wall time, labels/s and SQL
+statements issued, and checks that the batch holds the same labels in
+hierarchy order.
+
+    cd backend
+    python -m benchmarks.bench_label_batch --locations 2000
+"""
+import argparse
+import asyncio
+import base64
+import time
+
+import httpx
+from sqlalchemy import event
+
+from app.wms.routers.labels import router as labels_router
+from benchmarks.common import BenchDatabase, build_app, print_report, seed_locations
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=2000)
+    parser.add_argument("--aisle", default="AIS02")
+    args = parser.parse_args()
+
+    bench_db = BenchDatabase()
+    statements = [0]
+
+    @event.listens_for(bench_db.async_engine.sync_engine, "before_cursor_execute")
+    def count_statement(*_):
+        statements[0] += 1
+
+    try:
+        ids = seed_locations(bench_db, locations=args.locations, items_per_location=1)
+        # seed_locations puts 500 locations in each aisle.
+        aisle_ids = [loc_id for loc_id in ids if f"AIS{loc_id // 500 + 1:02d}" == args.aisle]
+        app = build_app(bench_db, labels_router)
+
+        rows = []
+        same = True
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for format in ("zpl", "pdf"):
+                statements[0] = 0
+                started = time.perf_counter()
+                single = []
+                for loc_id in aisle_ids:
+                    response = await client.post(f"/api/v1/wms/locations/{loc_id}/label", json={"locationId": loc_id, "format": format})
+                    single.append(base64.b64decode(response.json()["data"]["content"]))
+                elapsed = time.perf_counter() - started
+                rows.append({
+                    "format": format, "mode": "per label", "requests": len(aisle_ids), "labels": len(single),
+                    "seconds": elapsed, "labels_per_s": len(single) / elapsed, "sql": statements[0]
+                })
+
+                statements[0] = 0
+                started = time.perf_counter()
+                response = await client.post(
+                    "/api/v1/wms/labels/batch", json={"whs": "01", "scope": {"aisle": args.aisle}, "format": format}
+                )
+                content = response.content
+                elapsed = time.perf_counter() - started
+                labels = int(response.headers["x-label-count"])
+                rows.append({
+                    "format": format, "mode": "batch", "requests": 1, "labels": labels,
+                    "seconds": elapsed, "labels_per_s": labels / elapsed, "sql": statements[0]
+                })
+
+                if format == "zpl":
+                    same = same and content.decode() == "".join(label.decode() + "\n" for label in single)
+                else:
+                    same = same and labels == len(aisle_ids) and content.count(b"/Type /Page\n") == labels
+
+        print_report(f"labels for aisle {args.aisle} ({len(aisle_ids)} locations)", rows)
+        print(f"\n{'PASS' if same else 'FAIL'}  batch holds the same labels as the per-label calls")
+    finally:
+        await bench_db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
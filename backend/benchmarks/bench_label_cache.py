@@ -0,0 +1,137 @@
+"""Label cache: repeated label previews with and without the render cache.
+
+Seeds one warehouse (default 2,000 locations) and requests --requests
+label previews through GET /labels/preview/{id}, with location ids drawn
+from a Zipf distribution (a few bins are reprinted all the time, most
+rarely), for ZPL and PDF, and the same sequence straight through
+PrintingService.render_label with the locations already loaded (the
+render cost alone, without request and query overhead). Each format runs
+three ways:
+
+* no cache    - every preview renders
+* memory      - the in-memory LRU (--cache-size entries), starting empty
+* disk, cold  - a fresh process's cache (empty memory) over the disk tier
+                the memory run filled; ZPL skips the disk tier, so for
+                ZPL this is a second cold memory run
+
+It then renames a location through PUT /locations/{id} and checks that
+the next preview shows the new name, and that the cached labels match
+freshly rendered ones.
+
+    cd backend
+    python -m benchmarks.bench_label_cache --locations 2000 --requests 3000
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from app.wms.routers import locations as locations_router
+from app.wms.routers.labels import router as labels_router
+from app.wms.services import printing
+from app.wms.services.label_cache import LabelCache
+from app.wms.services.label_render import LabelRenderPool
+from benchmarks.common import BenchDatabase, build_app, print_report, seed_locations
+
+
+def use_cache(cache: LabelCache):
+    printing.label_cache = cache
+    locations_router.label_cache = cache
+
+
+async def previews(client, ids, format: str):
+    contents = {}
+    started = time.perf_counter()
+    for loc_id in ids:
+        response = await client.get(f"/api/v1/wms/labels/preview/{loc_id}", params={"format": format})
+        contents[loc_id] = response.json()["data"]["content"]
+    return contents, time.perf_counter() - started
+
+
+async def renders(bench_db, ids, format: str):
+    async with bench_db.AsyncSessionLocal() as db:
+        service = printing.PrintingService(db)
+        loaded = {location.id: location for location in (await service.get_batch_locations("01", {"all": True}))["data"]}
+        started = time.perf_counter()
+        for loc_id in ids:
+            await service.render_label(loaded[loc_id], format)
+        return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--cache-size", type=int, default=1024)
+    parser.add_argument("--zipf", type=float, default=1.2)
+    parser.add_argument("--seed", type=int, default=21)
+    args = parser.parse_args()
+
+    bench_db = BenchDatabase()
+    disk_root = tempfile.mkdtemp(prefix="wms_label_cache_")
+    # Render PDFs in a thread: the cache is what is measured here, not the pool.
+    printing.label_render_pool = LabelRenderPool(workers=0)
+    try:
+        ids = seed_locations(bench_db, locations=args.locations, items_per_location=1)
+        rng = np.random.default_rng(args.seed)
+        order = rng.permutation(ids)
+        requests = [int(order[(n - 1) % len(order)]) for n in rng.zipf(args.zipf, size=args.requests)]
+        app = build_app(bench_db, labels_router, locations_router.router)
+
+        rows = []
+        render_rows = []
+        same = True
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for format in ("zpl", "pdf"):
+                directory = f"{disk_root}/{format}"
+                modes = [
+                    ("no cache", LabelCache(size=0)),
+                    ("memory", LabelCache(size=args.cache_size, directory=directory)),
+                    ("disk, cold", LabelCache(size=args.cache_size, directory=directory)),
+                ]
+                baseline = None
+                for label, cache in modes:
+                    use_cache(cache)
+                    contents, elapsed = await previews(client, requests, format)
+                    stats = cache.snapshot()
+                    rows.append({
+                        "format": format, "cache": label, "requests": len(requests), "seconds": elapsed,
+                        "ms_per_label": elapsed * 1000 / len(requests),
+                        "hit_rate": stats["hit_rate"] if stats["hit_rate"] is not None else 0.0,
+                        "disk_hits": stats["disk_hits"], "evictions": stats["evictions"]
+                    })
+                    render_cache = LabelCache(size=0) if label == "no cache" else LabelCache(size=args.cache_size, directory=f"{directory}-render")
+                    use_cache(render_cache)
+                    render_elapsed = await renders(bench_db, requests, format)
+                    render_rows.append({
+                        "format": format, "cache": label, "ms_per_label": render_elapsed * 1000 / len(requests),
+                        "labels_per_s": len(requests) / render_elapsed, "hit_rate": render_cache.snapshot()["hit_rate"] or 0.0
+                    })
+                    if baseline is None:
+                        baseline = contents
+                    elif format == "zpl":
+                        same = same and contents == baseline
+
+            # Rename the most requested location and check its next preview.
+            use_cache(LabelCache(size=args.cache_size))
+            hot = requests[0]
+            await client.get(f"/api/v1/wms/labels/preview/{hot}", params={"format": "zpl"})
+            await client.put(f"/api/v1/wms/locations/{hot}", json={"name": "Renamed bin"})
+            renamed = (await client.get(f"/api/v1/wms/labels/preview/{hot}", params={"format": "zpl"})).json()["data"]["content"]
+
+        print_report(f"{args.requests} label previews over {args.locations} locations (zipf {args.zipf})", rows)
+        print_report("render_label only (locations preloaded)", render_rows)
+        print(f"\n{'PASS' if same else 'FAIL'}  cached ZPL labels match freshly rendered ones")
+        print(f"{'PASS' if 'Renamed bin' in renamed else 'FAIL'}  preview after update_location shows the new name")
+    finally:
+        await bench_db.dispose()
+        shutil.rmtree(disk_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""PDF label rendering: on the event loop vs in a thread vs in the render pool.
+
+Seeds one warehouse (default 1,000 locations) and, for each render mode,
+requests the whole warehouse as one PDF batch through POST /labels/batch
+while a prober hits /ping every few milliseconds. It reports:
+
+* render  - batch wall time and labels/s
+* latency - /ping p50/p99/max during the render (the API's responsiveness)
+* burst   - --concurrency batches of --burst-labels at once, total labels/s
+
+Modes: ``event loop`` renders synchronously in the request (how PDF labels
+were rendered before the pool), ``thread`` is the pool with 0 workers and
+``pool xN`` the process pool with --workers workers.
+
+    cd backend
+    python -m benchmarks.bench_label_render --locations 1000 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from app.wms.routers.labels import router as labels_router
+from app.wms.services import printing
+from app.wms.services.label_render import LabelRenderPool, render_pdf
+from benchmarks.common import BenchDatabase, build_app, latency_summary, print_report, seed_locations
+
+
+class EventLoopRender(LabelRenderPool):
+    """Renders in the request, blocking the event loop"""
+
+    async def render_pdf(self, labels):
+        content = render_pdf(labels)
+        self.stats["jobs"] += 1
+        self.stats["labels"] += len(labels)
+        return content
+
+
+async def probe(client, stop: asyncio.Event, interval: float):
+    """Ping on a fixed schedule; latency counts from when each ping was due,
+    so time the event loop spends blocked shows up instead of being skipped"""
+    timings = []
+    due = time.perf_counter()
+    while not stop.is_set():
+        await client.get("/ping")
+        timings.append(time.perf_counter() - due)
+        due += interval
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+    return timings
+
+
+async def run_mode(client, label: str, pool: LabelRenderPool, args):
+    printing.label_render_pool = pool
+    await pool.start()
+    try:
+        stop = asyncio.Event()
+        prober = asyncio.create_task(probe(client, stop, args.probe_interval))
+        await asyncio.sleep(0.2)
+        started = time.perf_counter()
+        response = await client.post("/api/v1/wms/labels/batch", json={"whs": "01", "scope": {"all": True}, "format": "pdf"})
+        elapsed = time.perf_counter() - started
+        stop.set()
+        latency = latency_summary(await prober)
+        labels = int(response.headers["x-label-count"])
+        pages = response.content.count(b"/Type /Page\n")
+
+        burst_scope = {"codes": [f"*BIN{n:03d}??" for n in range(args.burst_labels // 100)]}
+        started = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/api/v1/wms/labels/batch", json={"whs": "01", "scope": burst_scope, "format": "pdf"})
+            for _ in range(args.concurrency)
+        ])
+        burst_elapsed = time.perf_counter() - started
+        burst_labels = sum(int(r.headers.get("x-label-count", 0)) for r in responses if r.status_code == 200)
+        rejected = sum(1 for r in responses if r.status_code == 503)
+
+        return {
+            "mode": label,
+            "labels": labels,
+            "render_s": elapsed,
+            "labels_per_s": labels / elapsed,
+            "ping_p50_ms": latency["p50_ms"],
+            "ping_p99_ms": latency["p99_ms"],
+            "ping_max_ms": latency["max_ms"],
+            "burst_labels_per_s": burst_labels / burst_elapsed,
+            "burst_503": rejected,
+        }, pages == labels
+    finally:
+        await pool.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--burst-labels", type=int, default=200)
+    parser.add_argument("--probe-interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    bench_db = BenchDatabase()
+    try:
+        seed_locations(bench_db, locations=args.locations, items_per_location=1)
+        app = build_app(bench_db, labels_router)
+
+        rows = []
+        complete = True
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            modes = [
+                ("event loop", EventLoopRender(workers=0)),
+                ("thread", LabelRenderPool(workers=0)),
+                (f"pool x{args.workers}", LabelRenderPool(workers=args.workers)),
+            ]
+            for label, pool in modes:
+                row, ok = await run_mode(client, label, pool, args)
+                rows.append(row)
+                complete = complete and ok
+
+        print_report(f"PDF batch of {args.locations} labels, {os.cpu_count()} CPU(s)", rows)
+        print(f"\n{'PASS' if complete else 'FAIL'}  every batch PDF has one page per label")
+    finally:
+        await bench_db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,155 @@
+"""ZPL label rendering: hard-coded f-string vs compiled label templates.
+
+Seeds one warehouse (default 10,000 locations, each with a name and JSON
+attributes), loads them with their warehouse and renders every label:
+
+* legacy f-string   - the layout generate_bin_label_zpl used to build per
+                      call, attributes re-parsed inline
+* compiled, render  - the built-in template compiled once, one call per label
+* compiled, batch   - the same template through render_many, one loop
+* custom template   - a warehouse template binding hierarchy columns,
+                      warehouse columns and single attributes
+
+Reports compile time, labels/s and µs per label, and checks that the
+built-in template renders byte-for-byte what the f-string did. It then
+stores the custom template for the warehouse and streams the whole
+warehouse through POST /labels/batch to check the endpoint uses it.
+
+    cd backend
+    python -m benchmarks.bench_label_template --locations 10000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+
+from app.wms.models import Location
+from app.wms.routers.labels import router as labels_router
+from app.wms.services.label_templates import CompiledTemplate, DEFAULT_BIN_TEMPLATE, default_bin_template
+from benchmarks.common import BenchDatabase, build_app, print_report, seed_locations
+
+CUSTOM_TEMPLATE = """^XA
+^CF0,40
+^FO40,30^FD{{warehouse.whs_code}} {{warehouse.name}}^FS
+^CF0,90
+^FO40,80^FD{{location.aisle}}-{{location.rack}}-{{location.bin}}^FS
+^CF0,30
+^FO40,190^FDZone {{attr.zone}} / {{attr.temp}}  {{location.capacity_qty}} {{location.capacity_uom}}^FS
+^BY3,3,120
+^FO40,240^BC^FD{{location.code}}^FS
+^XZ"""
+
+
+def legacy_bin_label_zpl(location) -> str:
+    """generate_bin_label_zpl before label templates"""
+    warehouse_name = location.warehouse.name or location.whs_code
+    location_code = location.code
+    location_name = location.name or ""
+
+    attributes_text = ""
+    if location.attributes:
+        try:
+            attrs = json.loads(location.attributes) if isinstance(location.attributes, str) else location.attributes
+            attributes_text = " | ".join([f"{k}: {v}" for k, v in attrs.items()])
+        except Exception:
+            attributes_text = str(location.attributes)
+
+    zpl = f"""
+^XA
+^CF0,60
+^FO50,50^FD{warehouse_name}^FS
+^CF0,40
+^FO50,120^FD{location_code}^FS
+^CF0,30
+^FO50,170^FD{location_name}^FS
+^CF0,25
+^FO50,210^FD{attributes_text}^FS
+^BY3,3,100
+^FO50,250^BC^FD{location_code}^FS
+^XZ
+"""
+    return zpl.strip()
+
+
+def timed_best(fn, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    bench_db = BenchDatabase()
+    try:
+        ids = seed_locations(bench_db, locations=args.locations, items_per_location=1)
+        with bench_db.engine.begin() as conn:
+            for zone, low, high in (("A", 1, args.locations // 2), ("B", args.locations // 2 + 1, args.locations)):
+                conn.execute(
+                    update(Location.__table__)
+                    .where(Location.__table__.c.id.between(low, high))
+                    .values(name=f"Pick face {zone}", attributes=json.dumps({"zone": zone, "temp": "ambient", "max_kg": 250}))
+                )
+
+        async with bench_db.AsyncSessionLocal() as db:
+            locations = (await db.scalars(
+                select(Location).options(joinedload(Location.warehouse)).order_by(Location.id)
+            )).all()
+
+        compile_seconds, _ = timed_best(lambda: CompiledTemplate(DEFAULT_BIN_TEMPLATE), args.repeat)
+        custom_compile_seconds, custom = timed_best(lambda: CompiledTemplate(CUSTOM_TEMPLATE, "custom"), args.repeat)
+
+        modes = [
+            ("legacy f-string", lambda: [legacy_bin_label_zpl(location) for location in locations]),
+            ("compiled, render", lambda: [default_bin_template.render(location) for location in locations]),
+            ("compiled, batch", lambda: default_bin_template.render_many(locations)),
+            ("custom template, batch", lambda: custom.render_many(locations)),
+        ]
+        rows, outputs = [], {}
+        for label, fn in modes:
+            seconds, outputs[label] = timed_best(fn, args.repeat)
+            rows.append({
+                "mode": label, "labels": len(outputs[label]), "seconds": seconds,
+                "labels_per_s": len(locations) / seconds, "us_per_label": seconds / len(locations) * 1e6,
+            })
+        legacy = rows[0]["seconds"]
+        for row in rows:
+            row["speedup"] = f"{legacy / row['seconds']:.1f}x"
+
+        # The endpoint streams the warehouse's own template once it is stored.
+        app = build_app(bench_db, labels_router)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            created = (await client.post("/api/v1/wms/labels/templates", json={"whs": "01", "name": "Bench bins", "body": CUSTOM_TEMPLATE})).json()
+            invalid = await client.post("/api/v1/wms/labels/templates", json={"whs": "01", "name": "Broken", "body": "^XA^FD{{location.colour}}^FS^XZ"})
+            started = time.perf_counter()
+            response = await client.post("/api/v1/wms/labels/batch", json={"whs": "01", "scope": {"all": True}, "format": "zpl"})
+            endpoint_seconds = time.perf_counter() - started
+            batch_labels = response.text.count("^XZ")
+            uses_custom = response.text.startswith(custom.render(locations[0]))
+
+        print_report(f"{len(locations)} ZPL labels, best of {args.repeat}", rows)
+        print(f"\ncompile: built-in {compile_seconds * 1e6:.0f} µs, custom {custom_compile_seconds * 1e6:.0f} µs (once per template version)")
+        print(f"POST /labels/batch with the custom template: {batch_labels} labels in {endpoint_seconds:.2f}s")
+        identical = outputs["legacy f-string"] == outputs["compiled, render"] == outputs["compiled, batch"]
+        print(f"\n{'PASS' if identical else 'FAIL'}  built-in template renders exactly the legacy layout")
+        print(f"{'PASS' if 'Zone A / ambient' in outputs['custom template, batch'][0] else 'FAIL'}  custom template binds attributes")
+        print(f"{'PASS' if created.get('ok') and invalid.status_code == 400 else 'FAIL'}  template stored, unknown field rejected ({invalid.json().get('detail')})")
+        print(f"{'PASS' if uses_custom and batch_labels == len(locations) else 'FAIL'}  batch endpoint renders the warehouse template")
+    finally:
+        await bench_db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+"""Label print bursts against a rate-limited PrintNode: direct vs queued.
+
+Seeds one warehouse and prints --labels labels through POST
+/locations/{id}/label, --concurrency at a time, against a fake PrintNode
+API (benchmarks.fake_printer) that takes --latency seconds per call and
+answers 429 past --rate-limit calls per second:
+
+* direct, no registry - every print looks the printer up again (registry
+                        TTL 0), then posts the job; the pre-registry path
+* direct              - printer list from the shared registry, job posted
+                        in the request
+* queued              - the request stores a print job and returns; the
+                        dispatcher sends jobs through a token bucket set
+                        to 90% of the API's rate, deferring any 429
+                        without using an attempt
+
+Reports request latency, prints that failed back to the user, 429s the
+API returned, /printers calls, and for the queued mode how long the queue
+took to drain and the final job statuses. Every label must reach the
+fake API exactly once. Queued request latency is mostly SQLite
+serializing the job inserts against the dispatcher's status updates.
+
+    cd backend
+    python -m benchmarks.bench_print_queue --labels 150 --rate-limit 10
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+from sqlalchemy import select
+
+from app.wms.models import PrintJob
+from app.wms.routers.labels import router as labels_router
+from app.wms.services import printing
+from app.wms.services.print_queue import PrintJobDispatcher, RateLimiter, STATUS_PRINTED
+from app.wms.services.printing import PrintNodeBackend
+from benchmarks.common import BenchDatabase, build_app, latency_summary, print_report, seed_locations
+from benchmarks.fake_printer import FakePrintNode
+
+PRINTER = "WMS Label Printer"
+
+
+async def print_labels(client, ids, concurrency: int):
+    timings, failures = [], []
+    queue = list(ids)
+
+    async def worker():
+        while queue:
+            loc_id = queue.pop()
+            started = time.perf_counter()
+            response = await client.post(f"/api/v1/wms/locations/{loc_id}/label", json={"locationId": loc_id, "format": "zpl"})
+            timings.append(time.perf_counter() - started)
+            body = response.json()
+            if not (body["ok"] and (body["data"].get("printed") or body["data"].get("queued"))):
+                failures.append(body["error"]["code"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - started, timings, failures
+
+
+async def job_statuses(bench_db) -> Counter:
+    async with bench_db.AsyncSessionLocal() as db:
+        return Counter((await db.scalars(select(PrintJob.status))).all())
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labels", type=int, default=150)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per PrintNode API call")
+    parser.add_argument("--rate-limit", type=float, default=10, help="PrintNode calls per second")
+    args = parser.parse_args()
+
+    bench_db = BenchDatabase()
+    try:
+        ids = seed_locations(bench_db, locations=args.labels, items_per_location=1)
+        app = build_app(bench_db, labels_router)
+        cloud = await FakePrintNode(latency=args.latency, printer_name=PRINTER, rate_limit=args.rate_limit).start()
+        idle_dispatcher = printing.print_job_dispatcher
+
+        rows = []
+        delivered = True
+        statuses = Counter()
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                for label in ("direct, no registry", "direct", "queued"):
+                    backend = PrintNodeBackend(api_key="bench", base_url=cloud.base_url)
+                    if label == "direct, no registry":
+                        backend.registry.ttl_seconds = backend.registry.miss_seconds = 0
+                    printing.printer_backend = backend
+                    dispatcher = idle_dispatcher
+                    if label == "queued":
+                        dispatcher = PrintJobDispatcher(
+                            session_factory=bench_db.AsyncSessionLocal,
+                            backend=backend,
+                            limiter=RateLimiter(rate=args.rate_limit * 0.9, burst=1),
+                            poll_interval=0.2
+                        )
+                        await dispatcher.start()
+                    printing.print_job_dispatcher = dispatcher
+
+                    # Let the previous mode's calls leave the API's rate window.
+                    await asyncio.sleep(1.1)
+                    before = cloud.stats()
+                    elapsed, timings, failures = await print_labels(client, ids, args.concurrency)
+                    drained = elapsed
+                    if label == "queued":
+                        started = time.perf_counter() - elapsed
+                        while dispatcher.stats["printed"] + dispatcher.stats["failed"] < len(ids) - len(failures):
+                            await asyncio.sleep(0.05)
+                        drained = time.perf_counter() - started
+                        await dispatcher.stop()
+                        statuses = await job_statuses(bench_db)
+                    await backend.close()
+                    after = cloud.stats()
+
+                    printed = after["jobs"] - before["jobs"]
+                    expected = len(ids) - len(failures)
+                    delivered = delivered and printed == expected
+                    latency = latency_summary(timings)
+                    rows.append({
+                        "mode": label, "request_s": elapsed, "p50_ms": latency["p50_ms"], "p99_ms": latency["p99_ms"],
+                        "failed": len(failures), "printed": printed, "printed_by_s": drained,
+                        "api_429s": after["rate_limited"] - before["rate_limited"],
+                        "printer_lists": after["printer_lists"] - before["printer_lists"],
+                    })
+                    if failures:
+                        print(f"{label}: failed with {dict(Counter(failures))}")
+        finally:
+            printing.print_job_dispatcher = idle_dispatcher
+            await cloud.stop()
+
+        print_report(
+            f"{len(ids)} label prints, {args.concurrency} concurrent requests "
+            f"(PrintNode {args.latency * 1000:.0f} ms/call, {args.rate_limit:.0f} calls/s)",
+            rows
+        )
+        queued = rows[-1]
+        print(f"\nqueued job statuses: {dict(statuses)}")
+        print(f"{'PASS' if delivered else 'FAIL'}  every accepted print reached the API exactly once")
+        print(f"{'PASS' if queued['failed'] == 0 and statuses.get(STATUS_PRINTED) == len(ids) else 'FAIL'}  "
+              f"queued mode printed every label without failing a request")
+    finally:
+        await bench_db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+"""Label printing: PrintNode cloud API vs raw TCP (port 9100) printers.
+
+Seeds one warehouse and prints --labels ZPL labels through POST
+/locations/{id}/label, --concurrency at a time, against local stand-ins
+(benchmarks.fake_printer):
+
+* printnode        - PrintNodeBackend against a fake PrintNode API with
+                     --latency seconds per call (printer lookup + job post)
+* raw, per job     - RawTcpBackend opening a connection for every job
+* raw, pooled      - one persistent connection, one write per job
+* raw, batched     - persistent connection, queued jobs written together
+
+Reports labels/s, print request latency, connections opened and writes the
+printer saw, and checks that every label arrived. Request latency includes
+the label lookup and the audit commit, which SQLite serializes, so the raw
+modes are also timed straight through backend.submit (--jobs jobs queued at
+once) to show the transport alone. It then checks that a connection the
+printer dropped while idle is reopened transparently, that a printer
+which stops reading mid-job fails the job without it being resent on a
+new connection, and that prints to a printer that is down fail cleanly.
+
+    cd backend
+    python -m benchmarks.bench_raw_print --labels 1000 --concurrency 8
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.wms.routers.labels import router as labels_router
+from app.wms.services import printing
+from app.wms.services.printing import PrintNodeBackend, RawTcpBackend
+from benchmarks.common import BenchDatabase, build_app, latency_summary, print_report, seed_locations
+from benchmarks.fake_printer import FakePrintNode, FakeRawPrinter
+
+PRINTER = "WMS Label Printer"
+
+
+async def print_labels(client, ids, concurrency: int):
+    timings, failures = [], []
+    queue = list(ids)
+
+    async def worker():
+        while queue:
+            loc_id = queue.pop()
+            started = time.perf_counter()
+            response = await client.post(f"/api/v1/wms/locations/{loc_id}/label", json={"locationId": loc_id, "format": "zpl"})
+            timings.append(time.perf_counter() - started)
+            body = response.json()
+            if not (body["ok"] and body["data"].get("printed")):
+                failures.append(body)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - started, timings, failures
+
+
+async def submit_jobs(backend, jobs: int, content: bytes):
+    timings = []
+
+    async def one():
+        started = time.perf_counter()
+        result = await backend.submit(PRINTER, "bench", "zpl", content)
+        timings.append(time.perf_counter() - started)
+        return result["ok"]
+
+    started = time.perf_counter()
+    ok = await asyncio.gather(*[one() for _ in range(jobs)])
+    return time.perf_counter() - started, timings, ok.count(False)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labels", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--jobs", type=int, default=800)
+    parser.add_argument("--latency", type=float, default=0.08, help="seconds per PrintNode API call")
+    args = parser.parse_args()
+
+    bench_db = BenchDatabase()
+    try:
+        ids = seed_locations(bench_db, locations=args.labels, items_per_location=1)
+        app = build_app(bench_db, labels_router)
+
+        rows = []
+        transport_rows = []
+        delivered = True
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            cloud = await FakePrintNode(latency=args.latency, printer_name=PRINTER).start()
+            printer = await FakeRawPrinter().start()
+            address = {PRINTER: (printer.host, printer.port)}
+            modes = [
+                ("printnode", PrintNodeBackend(api_key="bench", base_url=cloud.base_url), None),
+                ("raw, per job", RawTcpBackend(address, idle_seconds=0, batch_jobs=1), printer),
+                ("raw, pooled", RawTcpBackend(address, batch_jobs=1), printer),
+                ("raw, batched", RawTcpBackend(address), printer),
+            ]
+            try:
+                for label, backend, stand_in in modes:
+                    printing.printer_backend = backend
+                    before = stand_in.stats() if stand_in else cloud.stats()
+                    elapsed, timings, failures = await print_labels(client, ids, args.concurrency)
+                    await backend.close()
+                    after = stand_in.stats() if stand_in else cloud.stats()
+                    latency = latency_summary(timings)
+                    if stand_in:
+                        received = after["labels"] - before["labels"]
+                        connections = after["connections"] - before["connections"]
+                        writes = after["reads"] - before["reads"]
+                    else:
+                        received = after["jobs"] - before["jobs"]
+                        connections = "-"
+                        writes = after["requests"] - before["requests"]
+                    delivered = delivered and received == len(ids) and not failures
+                    rows.append({
+                        "backend": label, "labels": received, "seconds": elapsed, "labels_per_s": len(ids) / elapsed,
+                        "p50_ms": latency["p50_ms"], "p99_ms": latency["p99_ms"],
+                        "connections": connections, "writes_or_calls": writes, "failed": len(failures),
+                    })
+
+                async with bench_db.AsyncSessionLocal() as db:
+                    service = printing.PrintingService(db)
+                    content = service.generate_bin_label_zpl(await service.get_location(ids[0])).encode()
+                for label, options in [
+                    ("raw, per job", {"idle_seconds": 0, "batch_jobs": 1}),
+                    ("raw, pooled", {"batch_jobs": 1}),
+                    ("raw, batched", {}),
+                ]:
+                    backend = RawTcpBackend(address, **options)
+                    before = printer.stats()
+                    elapsed, timings, failed = await submit_jobs(backend, args.jobs, content)
+                    await backend.close()
+                    after = printer.stats()
+                    latency = latency_summary(timings)
+                    delivered = delivered and after["labels"] - before["labels"] == args.jobs and not failed
+                    transport_rows.append({
+                        "backend": label, "jobs": args.jobs, "seconds": elapsed, "jobs_per_s": args.jobs / elapsed,
+                        "p50_ms": latency["p50_ms"], "max_ms": latency["max_ms"],
+                        "connections": after["connections"] - before["connections"],
+                        "batches": backend.queue(PRINTER).stats["batches"], "failed": failed,
+                    })
+
+                # The printer drops idle connections; the next job reconnects without failing.
+                printer.idle_close = 0.2
+                backend = RawTcpBackend(address)
+                printing.printer_backend = backend
+                await print_labels(client, ids[:5], 1)
+                await asyncio.sleep(0.5)
+                _, _, reconnect_failures = await print_labels(client, ids[:5], 1)
+                queue_stats = backend.queue(PRINTER).stats
+                await backend.close()
+
+                # A busy printer stops reading mid-job: the write times out and the job
+                # fails rather than being sent again on a new connection.
+                stalled = await FakeRawPrinter(stall_after=100_000, stall_seconds=1.0).start()
+                backend = RawTcpBackend({PRINTER: (stalled.host, stalled.port)}, timeout_seconds=0.3)
+                await backend.submit(PRINTER, "bench", "zpl", content)
+                big_job = content * (32 * 1024 * 1024 // len(content))
+                stall_result = await backend.submit(PRINTER, "bench", "zpl", big_job)
+                await asyncio.sleep(1.5)
+                stall_stats = {**stalled.stats(), **backend.queue(PRINTER).stats}
+                await backend.close()
+                await stalled.stop()
+                # One connection, and the unsent rest of the job dropped rather than delivered after the failure.
+                stall_ok = (
+                    not stall_result["ok"] and stall_stats["connections"] == 1 and stall_stats["reconnects"] == 0
+                    and stall_stats["labels"] < 1 + big_job.count(b"^XZ")
+                )
+
+                # A printer that is down fails the job with PRINT_FAILED.
+                await printer.stop()
+                down = RawTcpBackend(address, timeout_seconds=1)
+                printing.printer_backend = down
+                response = await client.post(f"/api/v1/wms/locations/{ids[0]}/label", json={"locationId": ids[0], "format": "zpl"})
+                down_error = response.json().get("error") or {}
+                await down.close()
+            finally:
+                await printer.stop()
+                await cloud.stop()
+                for _, backend, _ in modes:
+                    await backend.close()
+
+        print_report(f"{len(ids)} ZPL labels, {args.concurrency} concurrent requests (PrintNode {args.latency * 1000:.0f} ms/call)", rows)
+        print_report(f"backend.submit only, {args.jobs} jobs queued at once", transport_rows)
+        print(f"\n{'PASS' if delivered else 'FAIL'}  every label reached the printer")
+        print(f"{'PASS' if not reconnect_failures and queue_stats['connects'] >= 2 else 'FAIL'}  "
+              f"dropped idle connection reopened ({queue_stats['connects']} connects, {queue_stats['failed']} failed)")
+        print(f"{'PASS' if stall_ok else 'FAIL'}  printer stalled mid-job -> job failed, not resent "
+              f"({stall_stats['connections']} connection, {stall_stats['labels']} labels received)")
+        print(f"{'PASS' if down_error.get('code') == 'PRINT_FAILED' else 'FAIL'}  printer down -> {down_error.get('code')}")
+    finally:
+        await bench_db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,304 @@
+"""Load test of the SAP document path through the SAP DI stand-in.
+
+Drives `/operations/putaway`, `/operations/issue` and
+`/operations/transfer-warehouse` concurrently, each asking for its SAP
+document (Good Receipt, Good Issue, Inventory Transfer). The outbox
+dispatcher runs in the background and posts to benchmarks/fake_sap.py,
+so the whole path is exercised without the Windows DI service:
+
+    API request -> stock/movements + outbox row -> dispatcher -> SAP DI
+
+Reported per operation:
+
+* api      - HTTP throughput and p50/p95/p99 of the WMS endpoint
+* sap_di   - round trip of each POST to the DI service
+* end2end  - from the API response to the outbox entry being SENT
+
+`--duplicates` re-sends that fraction of API requests with the same
+Idempotency-Key (they must be replayed, not re-executed), and
+`--redeliver` resets that fraction of SENT entries to PENDING as if a
+worker died between posting and recording the result; the stand-in's
+Idempotency-Key dedup must answer those without new documents.
+
+    cd backend
+    python -m benchmarks.bench_sap_load --requests 300 --concurrency 20 --latency 0.02 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+from sqlalchemy import select, update, func
+
+from app.wms.models import SapOutbox, Location, Warehouse
+from app.wms.routers import movements
+from app.wms.services.sap_client import SAPClient, SAPHttpPool, CircuitBreaker, Bulkhead
+from app.wms.services.sap_outbox import SapOutboxDispatcher, STATUS_SENT, STATUS_PENDING, STATUS_PROCESSING
+from benchmarks.common import BenchDatabase, build_app, latency_summary, print_report, seed_locations
+from benchmarks.fake_sap import FakeSapServer
+
+OPERATIONS = ("putaway", "issue", "transfer")
+
+SAP_ENDPOINTS = {
+    "putaway": "/Inventory/GoodReceipt",
+    "issue": "/Inventory/GoodIssue",
+    "transfer": "/Inventory/Transfer",
+}
+
+
+class RecordingPool(SAPHttpPool):
+    """SAPHttpPool that keeps every sample for exact percentiles"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.samples = {}
+
+    def observe(self, endpoint: str, elapsed_ms: float, ok: bool):
+        super().observe(endpoint, elapsed_ms, ok)
+        self.samples.setdefault(endpoint, []).append(elapsed_ms / 1000)
+
+
+def seed_target_warehouse(bench_db: BenchDatabase, whs: str, first_id: int, locations: int):
+    with bench_db.engine.begin() as conn:
+        conn.execute(Warehouse.__table__.insert(), [{"whs_code": whs, "name": f"Bench {whs}", "active": True}])
+        conn.execute(Location.__table__.insert(), [
+            {
+                "id": loc_id,
+                "whs_code": whs,
+                "code": f"SEC01-AIS01-RK01-BIN{loc_id:05d}",
+                "section": "SEC01",
+                "aisle": "AIS01",
+                "rack": "RK01",
+                "level": "LV01",
+                "bin": f"BIN{loc_id:05d}",
+                "type": "Storage",
+                "capacity_qty": 1000,
+                "capacity_uom": "EA",
+                "is_active": True,
+            }
+            for loc_id in range(first_id, first_id + locations)
+        ])
+    return list(range(first_id, first_id + locations))
+
+
+def build_request(operation: str, rng: random.Random, source_ids, target_ids, items: int, lines: int):
+    def item():
+        return f"ITEM{rng.randrange(items):04d}"
+
+    if operation == "putaway":
+        return "/api/v1/wms/operations/putaway", {
+            "whs": "01",
+            "lines": [{"item": item(), "qty": 1, "toLocationId": rng.choice(source_ids)} for _ in range(lines)],
+            "sap": {"createGoodReceipt": True},
+        }
+    if operation == "issue":
+        return "/api/v1/wms/operations/issue", {
+            "whs": "01",
+            "reason": "BENCH",
+            "lines": [{"item": item(), "qty": 1, "fromLocationId": rng.choice(source_ids)} for _ in range(lines)],
+            "sap": {"createGoodIssue": True},
+        }
+    return "/api/v1/wms/operations/transfer-warehouse", {
+        "fromWhs": "01",
+        "toWhs": "02",
+        "moves": [
+            {"item": item(), "qty": 1, "fromLocationId": rng.choice(source_ids), "toLocationId": rng.choice(target_ids)}
+            for _ in range(lines)
+        ],
+        "sap": {"createTransfer": True},
+    }
+
+
+async def drive_api(app, args, source_ids, target_ids):
+    """Fire the mixed workload, returns per-operation samples and completion times"""
+    rng = random.Random(args.seed)
+    plan = []
+    for n in range(args.requests):
+        operation = OPERATIONS[n % len(OPERATIONS)]
+        path, body = build_request(operation, rng, source_ids, target_ids, args.items, args.lines)
+        plan.append((operation, path, body, str(uuid.uuid4())))
+    duplicates = [entry for entry in plan if rng.random() < args.duplicates]
+    plan.extend(duplicates)
+    rng.shuffle(plan)
+
+    latencies = {operation: [] for operation in OPERATIONS}
+    failures = {operation: 0 for operation in OPERATIONS}
+    completed_at = {}
+    queue = asyncio.Queue()
+    for entry in plan:
+        queue.put_nowait(entry)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        async def worker():
+            while not queue.empty():
+                operation, path, body, key = queue.get_nowait()
+                started = time.perf_counter()
+                response = await client.post(path, json=body, headers={"Idempotency-Key": key})
+                latencies[operation].append(time.perf_counter() - started)
+                result = response.json()
+                if response.status_code != 200 or not result.get("ok"):
+                    failures[operation] += 1
+                else:
+                    completed_at.setdefault(key, (operation, datetime.utcnow()))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    return wall, latencies, failures, completed_at, len(duplicates)
+
+
+async def wait_for_drain(bench_db: BenchDatabase, dispatcher: SapOutboxDispatcher, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        async with bench_db.AsyncSessionLocal() as db:
+            open_entries = await db.scalar(
+                select(func.count()).select_from(SapOutbox).where(SapOutbox.status.in_([STATUS_PENDING, STATUS_PROCESSING]))
+            )
+        if not open_entries:
+            return True
+        dispatcher.wake()
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="API requests, split across the three operations")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=3, help="lines per request")
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="stand-in seconds per document")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stand-in business error rate")
+    parser.add_argument("--no-dedup", action="store_true", help="turn off the stand-in's Idempotency-Key dedup")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="fraction of API requests re-sent with the same key")
+    parser.add_argument("--redeliver", type=float, default=0.1, help="fraction of SENT entries posted again")
+    parser.add_argument("--coalesce", action="store_true", help="coalesce Good Issue/Good Receipt lines")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+    logging.getLogger("app.wms.services").setLevel(logging.CRITICAL)
+
+    server = await FakeSapServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        dedup=not args.no_dedup,
+        seed=args.seed
+    ).start()
+    bench_db = BenchDatabase()
+    pool = RecordingPool()
+    client = SAPClient(pool=pool, breaker=CircuitBreaker(), bulkhead=Bulkhead())
+    client.base_url = server.base_url
+    client.retry_delay = 0.1
+    dispatcher = SapOutboxDispatcher(
+        session_factory=bench_db.AsyncSessionLocal,
+        sap_client=client,
+        poll_interval=0.05,
+        coalesce=args.coalesce
+    )
+    checks = []
+
+    try:
+        source_ids = seed_locations(bench_db, locations=args.locations, items_per_location=args.items, qty=10000)
+        target_ids = seed_target_warehouse(bench_db, "02", args.locations + 1, args.locations)
+        app = build_app(bench_db, movements.router)
+        await dispatcher.start()
+
+        load_started = time.perf_counter()
+        wall, latencies, failures, completed_at, duplicates = await drive_api(app, args, source_ids, target_ids)
+        api_done = time.perf_counter()
+        drained = await wait_for_drain(bench_db, dispatcher, args.drain_timeout)
+        sap_wall = time.perf_counter() - load_started
+
+        async with bench_db.AsyncSessionLocal() as db:
+            entries = (await db.execute(select(SapOutbox.movement_key, SapOutbox.status, SapOutbox.sent_at))).all()
+        end_to_end = {operation: [] for operation in OPERATIONS}
+        for key, status, sent_at in entries:
+            if status == STATUS_SENT and key in completed_at:
+                operation, finished = completed_at[key]
+                end_to_end[operation].append(max(0.0, (sent_at - finished).total_seconds()))
+
+        rows = []
+        for operation in OPERATIONS:
+            samples = latencies[operation]
+            rows.append({
+                "path": f"api {operation}",
+                "count": len(samples),
+                "failed": failures[operation],
+                "per_s": len(samples) / wall if wall else 0.0,
+                **latency_summary(samples),
+            })
+        for operation in OPERATIONS:
+            samples = pool.samples.get(SAP_ENDPOINTS[operation], [])
+            rows.append({
+                "path": f"sap_di {operation}",
+                "count": len(samples),
+                "failed": pool.latency[SAP_ENDPOINTS[operation]].errors if samples else 0,
+                "per_s": len(samples) / sap_wall if sap_wall else 0.0,
+                **latency_summary(samples),
+            })
+        for operation in OPERATIONS:
+            samples = end_to_end[operation]
+            rows.append({
+                "path": f"end2end {operation}",
+                "count": len(samples),
+                "failed": 0,
+                "per_s": 0.0,
+                **latency_summary(samples),
+            })
+
+        sent_before = server.documents
+        redelivered = 0
+        if args.redeliver > 0:
+            rng = random.Random(args.seed)
+            keys = [key for key, status, _ in entries if status == STATUS_SENT and rng.random() < args.redeliver]
+            redelivered = len(keys)
+            async with bench_db.AsyncSessionLocal() as db:
+                async with db.begin():
+                    await db.execute(
+                        update(SapOutbox)
+                        .where(SapOutbox.movement_key.in_(keys))
+                        .values(status=STATUS_PENDING, next_attempt_at=datetime.utcnow())
+                    )
+            await wait_for_drain(bench_db, dispatcher, args.drain_timeout)
+
+        api_total = sum(len(samples) for samples in latencies.values())
+        print_report(
+            f"SAP load ({api_total} API requests, concurrency {args.concurrency}, {args.lines} lines, "
+            f"stand-in {args.latency}s +/- {args.jitter}s, error rate {args.error_rate})",
+            rows
+        )
+        print(f"\napi wall {wall:.2f}s ({api_total / wall:.1f} req/s), "
+              f"outbox drained {load_started + sap_wall - api_done:.2f}s after the last API response")
+        print(f"dispatcher {dispatcher.stats}")
+        print(f"stand-in {server.stats()}")
+        print()
+
+        checks.append(("every API request succeeded", not any(failures.values())))
+        checks.append((f"{duplicates} duplicate API requests were replayed, not re-executed",
+                       len(entries) == args.requests))
+        checks.append(("outbox drained", drained))
+        if not args.coalesce:
+            checks.append(("one SAP document per request", sent_before == args.requests))
+        if args.redeliver > 0 and not args.no_dedup:
+            checks.append((f"{redelivered} redelivered entries deduplicated by the stand-in",
+                           server.documents == sent_before))
+        for label, passed in checks:
+            print(f"{'PASS' if passed else 'FAIL'}  {label}")
+    finally:
+        await dispatcher.stop()
+        await pool.close()
+        await server.stop()
+        await bench_db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,183 @@
+"""SAP DI outage and recovery: circuit breaker, bulkhead and outbox deferral.
+
+Runs SAPClient and the outbox dispatcher against the in-process fake SAP
+server (benchmarks/fake_sap.py):
+
+* healthy    - documents post normally, circuit stays CLOSED
+* outage     - SAP hangs; compared with an unguarded client (no breaker,
+               unbounded bulkhead), the guarded client stops sending after
+               the failure threshold and later calls fail fast
+* queued     - outbox entries created while the circuit is OPEN stay
+               PENDING without spending attempts
+* recovery   - SAP is back; after the reset window one probe closes the
+               circuit and the outbox drains
+
+    cd backend
+    python -m benchmarks.bench_sap_resilience
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select, func
+
+from app.wms.models import SapOutbox
+from app.wms.services.sap_client import SAPClient, SAPHttpPool, CircuitBreaker, Bulkhead
+from app.wms.services.sap_outbox import SapOutboxService, SapOutboxDispatcher
+from benchmarks.common import BenchDatabase, latency_summary, print_report
+from benchmarks.fake_sap import FakeSapServer
+
+
+def build_client(server: FakeSapServer, args, guarded: bool = True) -> SAPClient:
+    client = SAPClient(
+        pool=SAPHttpPool(timeout_seconds=args.timeout),
+        breaker=CircuitBreaker(
+            failure_threshold=args.threshold if guarded else 10 ** 9,
+            reset_seconds=args.reset
+        ),
+        bulkhead=Bulkhead(
+            size=args.bulkhead if guarded else 10 ** 6,
+            wait_seconds=args.timeout * 2
+        )
+    )
+    client.base_url = server.base_url
+    client.retry_delay = 0.1
+    return client
+
+
+async def post_documents(client: SAPClient, count: int):
+    async def one(n):
+        started = time.perf_counter()
+        result = await client.good_issue(whs="01", reference=f"BENCH-{n}", lines=[{"item": "A", "qty": 1, "lot": None}])
+        code = "OK" if result.get("ok") else (result.get("error") or {}).get("code")
+        return time.perf_counter() - started, code
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(n) for n in range(count)))
+    return time.perf_counter() - started, results
+
+
+def phase_row(phase: str, server: FakeSapServer, client: SAPClient, wall: float, results, sap_requests_before: int):
+    codes = {}
+    for _, code in results:
+        codes[code] = codes.get(code, 0) + 1
+    latency = latency_summary([elapsed for elapsed, _ in results])
+    return {
+        "phase": phase,
+        "calls": len(results),
+        "wall_s": wall,
+        "p50_ms": latency["p50_ms"],
+        "p95_ms": latency["p95_ms"],
+        "sap_requests": server.requests - sap_requests_before,
+        "circuit": client.breaker.state,
+        "results": ", ".join(f"{code}={n}" for code, n in sorted(codes.items(), key=lambda kv: str(kv[0]))),
+    }
+
+
+async def outbox_counts(bench_db: BenchDatabase):
+    async with bench_db.AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(SapOutbox.status, func.count(), func.sum(SapOutbox.attempts)).group_by(SapOutbox.status)
+        )).all()
+    return {status: (count, attempts) for status, count, attempts in rows}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=30)
+    parser.add_argument("--timeout", type=float, default=1.0, help="SAP DI request timeout (s)")
+    parser.add_argument("--threshold", type=int, default=5, help="breaker failure threshold")
+    parser.add_argument("--reset", type=float, default=2.0, help="breaker reset window (s)")
+    parser.add_argument("--bulkhead", type=int, default=5)
+    parser.add_argument("--queued", type=int, default=20)
+    args = parser.parse_args()
+    # Every timed-out attempt is logged by SAPClient; keep the report readable.
+    logging.getLogger("app.wms.services").setLevel(logging.CRITICAL)
+
+    server = await FakeSapServer(latency=0.005).start()
+    bench_db = BenchDatabase()
+    client = build_client(server, args)
+    unguarded = build_client(server, args, guarded=False)
+    rows = []
+    checks = []
+
+    try:
+        before = server.requests
+        wall, results = await post_documents(client, args.calls)
+        rows.append(phase_row("healthy", server, client, wall, results, before))
+        checks.append(("healthy: all documents created", all(code == "OK" for _, code in results)))
+
+        server.mode = "hang"
+        before = server.requests
+        wall, results = await post_documents(unguarded, args.calls)
+        rows.append(phase_row("outage, unguarded", server, unguarded, wall, results, before))
+        unguarded_requests = server.requests - before
+
+        before = server.requests
+        wall, results = await post_documents(client, args.calls)
+        rows.append(phase_row("outage, guarded", server, client, wall, results, before))
+        guarded_requests = server.requests - before
+        checks.append(("outage: circuit opened", client.breaker.state == CircuitBreaker.OPEN))
+        checks.append(("outage: guarded client sent fewer requests to the hung service", guarded_requests < unguarded_requests))
+
+        before = server.requests
+        wall, results = await post_documents(client, args.calls)
+        rows.append(phase_row("outage, circuit open", server, client, wall, results, before))
+        checks.append(("outage: open circuit fails fast without reaching SAP",
+                       server.requests == before and all(code == "CIRCUIT_OPEN" for _, code in results)))
+
+        dispatcher = SapOutboxDispatcher(session_factory=bench_db.AsyncSessionLocal, sap_client=client)
+        async with bench_db.AsyncSessionLocal() as db:
+            outbox = SapOutboxService(db)
+            for n in range(args.queued):
+                outbox.enqueue(
+                    doc_type="GoodIssue",
+                    whs="01",
+                    payload={"whs": "01", "reference": f"QUEUED-{n}", "lines": [{"item": "A", "qty": 1, "lot": None}]},
+                    idempotency_key=f"bench-queued-{n}",
+                    user="bench"
+                )
+            await db.commit()
+        claimed = await dispatcher.dispatch_once()
+        queued = await outbox_counts(bench_db)
+        checks.append(("queued: dispatcher defers while the circuit is open",
+                       claimed == 0 and queued.get("PENDING") == (args.queued, 0)))
+
+        server.mode = "ok"
+        await asyncio.sleep(args.reset)
+        started = time.perf_counter()
+        before = server.requests
+        while await dispatcher.dispatch_once():
+            pass
+        drained = await outbox_counts(bench_db)
+        rows.append({
+            "phase": "recovery, outbox drain",
+            "calls": args.queued,
+            "wall_s": time.perf_counter() - started,
+            "p50_ms": 0.0,
+            "p95_ms": 0.0,
+            "sap_requests": server.requests - before,
+            "circuit": client.breaker.state,
+            "results": ", ".join(f"{status}={count}" for status, (count, _) in sorted(drained.items())),
+        })
+        checks.append(("recovery: probe closed the circuit", client.breaker.state == CircuitBreaker.CLOSED))
+        checks.append(("recovery: every queued document was sent", drained.get("SENT", (0, 0))[0] == args.queued))
+
+        print_report(
+            f"SAP outage (timeout {args.timeout}s, threshold {args.threshold}, "
+            f"reset {args.reset}s, bulkhead {args.bulkhead})",
+            rows
+        )
+        print()
+        for label, passed in checks:
+            print(f"{'PASS' if passed else 'FAIL'}  {label}")
+    finally:
+        await client.pool.close()
+        await unguarded.pool.close()
+        await server.stop()
+        await bench_db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,167 @@
+"""Shared helpers for the WMS benchmark scripts.
+
+Benchmarks run against a throwaway SQLite database so they can be executed
+without SQL Server or the SAP DI service:
+
+    cd backend
+    python -m benchmarks.bench_async_db
+"""
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, get_async_db
+from app.wms import models  # noqa: F401  (registers the WMS tables on Base.metadata)
+from app.wms.deps import get_current_user
+
+BENCH_ROLES = ["Admin", "WarehouseManager", "Operator", "Auditor"]
+
+
+class BenchDatabase:
+    """Temporary SQLite database with matching sync and async engines"""
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="wms_bench_", suffix=".db")
+            os.close(fd)
+        self.path = path
+        self.engine = create_engine(
+            f"sqlite:///{path}",
+            connect_args={"check_same_thread": False}
+        )
+        self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        self.SessionLocal = sessionmaker(bind=self.engine, autoflush=False)
+        self.AsyncSessionLocal = async_sessionmaker(
+            self.async_engine,
+            class_=AsyncSession,
+            autoflush=False,
+            expire_on_commit=False
+        )
+        Base.metadata.create_all(bind=self.engine)
+
+    async def get_async_db(self):
+        async with self.AsyncSessionLocal() as db:
+            yield db
+
+    def get_db(self):
+        db = self.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def dispose(self):
+        await self.async_engine.dispose()
+        self.engine.dispose()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def seed_locations(
+    bench_db: BenchDatabase,
+    whs: str = "01",
+    locations: int = 1000,
+    items_per_location: int = 5,
+    qty: float = 10.0
+) -> List[int]:
+    """Seed one warehouse with locations and stock rows, returns location ids"""
+    location_table = models.Location.__table__
+    stock_table = models.StockLocation.__table__
+
+    with bench_db.engine.begin() as conn:
+        conn.execute(models.Warehouse.__table__.insert(), [{"whs_code": whs, "name": f"Bench {whs}", "active": True}])
+        conn.execute(location_table.insert(), [
+            {
+                "id": loc_id,
+                "whs_code": whs,
+                "code": f"SEC01-AIS{loc_id // 500 + 1:02d}-RK{loc_id // 50 % 10 + 1:02d}-BIN{loc_id:05d}",
+                "section": "SEC01",
+                "aisle": f"AIS{loc_id // 500 + 1:02d}",
+                "rack": f"RK{loc_id // 50 % 10 + 1:02d}",
+                "level": "LV01",
+                "bin": f"BIN{loc_id:05d}",
+                "type": "Storage",
+                "capacity_qty": 1000,
+                "capacity_uom": "EA",
+                "is_active": True,
+            }
+            for loc_id in range(1, locations + 1)
+        ])
+        rows = []
+        for loc_id in range(1, locations + 1):
+            for n in range(items_per_location):
+                rows.append({
+                    "id": len(rows) + 1,
+                    "whs_code": whs,
+                    "location_id": loc_id,
+                    "item_code": f"ITEM{n:04d}",
+                    "lot_no": None,
+                    "qty": qty,
+                })
+        conn.execute(stock_table.insert(), rows)
+
+    return list(range(1, locations + 1))
+
+
+def build_app(bench_db: BenchDatabase, *routers) -> FastAPI:
+    """FastAPI app with the given routers bound to the benchmark database"""
+    app = FastAPI()
+    for router in routers:
+        app.include_router(router, prefix="/api/v1/wms")
+    app.dependency_overrides[get_async_db] = bench_db.get_async_db
+    app.dependency_overrides[get_current_user] = lambda: {"username": "bench", "roles": BENCH_ROLES}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max in milliseconds"""
+    return {
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": (max(values) if values else 0.0) * 1000,
+    }
+
+
+def print_report(title: str, rows: List[Dict[str, object]]):
+    """Print a list of result dicts as an aligned table"""
+    print(f"\n== {title} ==")
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    formatted = [
+        [f"{row[c]:.2f}" if isinstance(row[c], float) else str(row[c]) for c in columns]
+        for row in rows
+    ]
+    widths = [max(len(c), *(len(r[i]) for r in formatted)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in formatted:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def timed(fn: Callable, *args, **kwargs):
+    """Run fn once and return (result, elapsed_seconds)"""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
@@ -0,0 +1,216 @@
+"""Stand-ins for label printers, for local runs and print benchmarks.
+
+FakeRawPrinter is a LAN label printer's raw TCP port (9100): it accepts
+connections, reads ZPL and counts the labels (``^XZ``) it receives.
+FakePrintNode answers the two PrintNode calls the WMS makes (`GET
+/printers`, `POST /printjobs`) after a simulated internet round trip.
+
+Both can be embedded in a benchmark (`FakeRawPrinter(...).start()`) or run
+on their own:
+
+    cd backend
+    python -m benchmarks.fake_printer --port 9100
+    python -m benchmarks.fake_printer --printnode --port 8002 --latency 0.08
+
+Behaviour knobs:
+
+* idle_close - the raw printer drops a connection idle for this many
+               seconds, as Zebra print servers do
+* stall_after - the raw printer stops reading for stall_seconds once a
+               connection has delivered this many bytes, as a busy
+               printer does (0: never)
+* latency    - seconds each PrintNode call takes
+* rate_limit - PrintNode calls accepted per second; past it they get a
+               429 with Retry-After, as the real API does (0: no limit)
+"""
+import argparse
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+LABEL_END = b"^XZ"
+
+
+class FakeRawPrinter:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, idle_close: float = 0.0, stall_after: int = 0, stall_seconds: float = 5.0):
+        self.host = host
+        self.port = port
+        self.idle_close = idle_close
+        self.stall_after = stall_after
+        self.stall_seconds = stall_seconds
+        self.connections = 0
+        self.open_connections = 0
+        self.reads = 0
+        self.bytes = 0
+        self.labels = 0
+        self.received: List[bytes] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": self.connections,
+            "open_connections": self.open_connections,
+            "reads": self.reads,
+            "bytes": self.bytes,
+            "labels": self.labels,
+        }
+
+    async def start(self) -> "FakeRawPrinter":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self.open_connections += 1
+        tail = b""
+        received = 0
+        stalled = False
+        try:
+            while True:
+                if self.stall_after and received >= self.stall_after and not stalled:
+                    stalled = True
+                    await asyncio.sleep(self.stall_seconds)
+                try:
+                    chunk = await asyncio.wait_for(reader.read(65536), timeout=self.idle_close or None)
+                except asyncio.TimeoutError:
+                    break
+                if not chunk:
+                    break
+                self.reads += 1
+                self.bytes += len(chunk)
+                received += len(chunk)
+                self.received.append(chunk)
+                # A label's ^XZ may be split across reads.
+                data = tail + chunk
+                self.labels += data.count(LABEL_END)
+                tail = data[-(len(LABEL_END) - 1):]
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+
+class FakePrintNode:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.08, printer_name: str = "WMS Label Printer", rate_limit: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.printer_name = printer_name
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.printer_lists = 0
+        self.jobs = 0
+        self.rate_limited = 0
+        self._recent: deque = deque()
+        self._job_ids = itertools.count(1000)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "printer_lists": self.printer_lists, "jobs": self.jobs, "rate_limited": self.rate_limited}
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/printers", self._printers)
+        app.router.add_post("/printjobs", self._printjobs)
+        return app
+
+    async def start(self) -> "FakePrintNode":
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _over_limit(self) -> bool:
+        """Sliding one-second window over every call"""
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        while self._recent and self._recent[0] <= now - 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate_limit:
+            self.rate_limited += 1
+            return True
+        self._recent.append(now)
+        return False
+
+    def _too_many_requests(self) -> web.Response:
+        retry_after = max(0.0, self._recent[0] + 1.0 - time.monotonic())
+        return web.Response(status=429, text="Too many requests", headers={"Retry-After": f"{retry_after:.2f}"})
+
+    async def _printers(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.printer_lists += 1
+        if self._over_limit():
+            return self._too_many_requests()
+        await asyncio.sleep(self.latency)
+        return web.json_response([
+            {"id": 71, "name": "Office Laser", "state": "online"},
+            {"id": 72, "name": self.printer_name, "state": "online"},
+        ])
+
+    async def _printjobs(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await request.json()
+        if self._over_limit():
+            return self._too_many_requests()
+        await asyncio.sleep(self.latency)
+        self.jobs += 1
+        return web.json_response(next(self._job_ids), status=201)
+
+
+async def serve(args):
+    if args.printnode:
+        server = await FakePrintNode(args.host, args.port, latency=args.latency, rate_limit=args.rate_limit).start()
+        print(f"fake PrintNode listening on {server.base_url} (latency {args.latency}s, rate limit {args.rate_limit or 'none'})")
+    else:
+        server = await FakeRawPrinter(args.host, args.port, idle_close=args.idle_close, stall_after=args.stall_after).start()
+        print(f"fake raw printer listening on {args.host}:{server.port}")
+    try:
+        while True:
+            await asyncio.sleep(5)
+            print(server.stats())
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--printnode", action="store_true", help="serve the PrintNode API instead of a raw port")
+    parser.add_argument("--latency", type=float, default=0.08)
+    parser.add_argument("--idle-close", type=float, default=0.0)
+    parser.add_argument("--stall-after", type=int, default=0, help="raw printer stops reading for 5s after this many bytes")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="PrintNode calls per second before 429s")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Stand-in for the SAP DI service, for local runs and load tests.
+
+Implements the same routes and JSON contract as sap-di-service
+(`/Inventory/GoodReceipt`, `/Inventory/GoodIssue`, `/Inventory/Transfer`,
+`/health`): every answer is HTTP 200 with `{"ok": true, "data": {"docEntry":
+int, "docNum": str}}` or `{"ok": false, "error": {"code", "message"}}`.
+
+It can be embedded in a benchmark (`FakeSapServer(...).start()`) or run on
+its own in place of the Windows service:
+
+    cd backend
+    python -m benchmarks.fake_sap --port 8001 --latency 0.05 --error-rate 0.02
+
+Behaviour knobs:
+
+* latency/jitter - each document takes latency +/- jitter seconds
+* error_rate     - fraction of documents rejected with a SAP business error
+                   (code -10, as the DI API reports for e.g. negative stock)
+* dedup          - replay the first response for a repeated Idempotency-Key
+                   instead of creating a second document
+* mode           - can be switched while the server runs:
+    ok          - documents are created
+    hang        - requests never answer (until the client times out)
+    down        - HTTP 503
+    unavailable - HTTP 200 with error code CONNECTION_ERROR, as the DI
+                  service answers when it cannot reach the SAP company
+"""
+import argparse
+import asyncio
+import itertools
+import random
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+MODES = ("ok", "hang", "down", "unavailable")
+
+# Responses kept for Idempotency-Key replay.
+DEDUP_CAPACITY = 100000
+
+SIMULATED_ERROR_CODE = -10
+
+
+class FakeSapServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        mode: str = "ok",
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        dedup: bool = True,
+        seed: Optional[int] = None
+    ):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.dedup = dedup
+        self.mode = mode
+        self.requests = 0
+        self.documents = 0
+        self.errors = 0
+        self.replayed = 0
+        self.by_endpoint: Dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._doc_entries = itertools.count(1)
+        self._responses: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "requests": self.requests,
+            "documents": self.documents,
+            "errors": self.errors,
+            "replayed": self.replayed,
+            "by_endpoint": dict(self.by_endpoint),
+        }
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/Inventory/GoodReceipt", self._good_receipt)
+        app.router.add_post("/Inventory/GoodIssue", self._good_issue)
+        app.router.add_post("/Inventory/Transfer", self._transfer)
+        app.router.add_get("/health", self._health)
+        app.router.add_get("/stats", self._stats)
+        return app
+
+    async def start(self) -> "FakeSapServer":
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _good_receipt(self, request: web.Request) -> web.Response:
+        return await self._document(request, "GoodReceipt", ("whs",))
+
+    async def _good_issue(self, request: web.Request) -> web.Response:
+        return await self._document(request, "GoodIssue", ("whs",))
+
+    async def _transfer(self, request: web.Request) -> web.Response:
+        return await self._document(request, "Transfer", ("fromWhs", "toWhs"))
+
+    async def _document(self, request: web.Request, endpoint: str, warehouse_fields) -> web.Response:
+        self.requests += 1
+        self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+        body = await request.json()
+
+        if self.mode == "hang":
+            await asyncio.Event().wait()
+        if self.mode == "down":
+            return web.json_response({"ok": False, "error": {"code": "UNAVAILABLE", "message": "down"}}, status=503)
+        if self.mode == "unavailable":
+            return web.json_response({"ok": False, "error": {"code": "CONNECTION_ERROR", "message": "SAP company unreachable"}})
+
+        key = request.headers.get("Idempotency-Key") if self.dedup else None
+        if not key:
+            return web.json_response(await self._create(endpoint, body, warehouse_fields))
+
+        replay = self._responses.get(key)
+        if replay is None and key in self._pending:
+            replay = await asyncio.shield(self._pending[key])
+        if replay is not None:
+            self.replayed += 1
+            return web.json_response(replay)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            result = await self._create(endpoint, body, warehouse_fields)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._pending[key]
+
+        # Only created documents are replayed; a rejected request may be retried.
+        if result["ok"]:
+            self._responses[key] = result
+            while len(self._responses) > DEDUP_CAPACITY:
+                self._responses.popitem(last=False)
+        return web.json_response(result)
+
+    async def _create(self, endpoint: str, body: Dict[str, Any], warehouse_fields) -> Dict[str, Any]:
+        delay = self.latency + self._random.uniform(-self.jitter, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        error = self._validate(body, warehouse_fields)
+        if error is None and self.error_rate and self._random.random() < self.error_rate:
+            error = {"code": SIMULATED_ERROR_CODE, "message": f"Simulated {endpoint} rejection"}
+        if error is not None:
+            self.errors += 1
+            return {"ok": False, "error": error}
+
+        self.documents += 1
+        doc_entry = next(self._doc_entries)
+        return {"ok": True, "data": {"docEntry": doc_entry, "docNum": str(doc_entry)}}
+
+    def _validate(self, body: Dict[str, Any], warehouse_fields) -> Optional[Dict[str, Any]]:
+        """Reject what the DI API would fail on before adding the document"""
+        lines = body.get("lines")
+        if not isinstance(lines, list) or not lines:
+            return {"code": "EXCEPTION", "message": "Object reference not set to an instance of an object."}
+        for field in warehouse_fields:
+            if not body.get(field):
+                return {"code": -5002, "message": f"Warehouse code is missing ({field})"}
+        for index, line in enumerate(lines):
+            if not line.get("item"):
+                return {"code": -5002, "message": f"Line {index}: item code is missing"}
+            qty = line.get("qty")
+            if not isinstance(qty, (int, float)) or qty <= 0:
+                return {"code": -5002, "message": f"Line {index}: quantity must be positive"}
+        if len(body.get("reference") or "") > 254:
+            return {"code": -5002, "message": "Comments field is too long (max 254)"}
+        return None
+
+    async def _health(self, request: web.Request) -> web.Response:
+        connected = self.mode == "ok"
+        message = "SAP connection OK" if connected else f"SAP DI stand-in is {self.mode}"
+        return web.json_response({"ok": connected, "message": message, "connected": connected})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+
+async def serve(server: FakeSapServer):
+    await server.start()
+    print(
+        f"SAP DI stand-in on {server.base_url} (latency {server.latency}s +/- {server.jitter}s, "
+        f"error rate {server.error_rate}, dedup {'on' if server.dedup else 'off'})"
+    )
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SAP DI service stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per document")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of documents rejected")
+    parser.add_argument("--no-dedup", action="store_true", help="create a new document for repeated Idempotency-Keys")
+    parser.add_argument("--mode", choices=MODES, default="ok")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = FakeSapServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        mode=args.mode,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        dedup=not args.no_dedup,
+        seed=args.seed
+    )
+    try:
+        asyncio.run(serve(server))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -123,14 +123,26 @@ export const wmsApi = {
   },
 
   counts: {
-    create: (request: { whs: string; scope: any }) =>
+    create: (request: { whs: string; scope: any; partitionBy?: 'aisle' | 'rack' }) =>
       api.post('/counts', request),
     
     getById: (countId: number) =>
       api.get(`/counts/${countId}`),
     
-    getDetails: (countId: number) =>
-      api.get(`/counts/${countId}/details`),
+    getDetails: (countId: number, taskId?: number) =>
+      api.get(`/counts/${countId}/details`, { params: taskId ? { task_id: taskId } : undefined }),
+    
+    getProgress: (countId: number) =>
+      api.get(`/counts/${countId}/progress`),
+    
+    getTasks: (countId: number) =>
+      api.get(`/counts/${countId}/tasks`),
+    
+    claimTask: (countId: number, taskId: number) =>
+      api.post(`/counts/${countId}/tasks/${taskId}/claim`),
+    
+    completeTask: (countId: number, taskId: number) =>
+      api.post(`/counts/${countId}/tasks/${taskId}/complete`),
     
     enterCounts: (countId: number, counts: Array<{ detailId: number; countedQty: number }>) =>
       api.put(`/counts/${countId}/enter`, counts),
@@ -149,8 +161,29 @@ export const wmsApi = {
     preview: (locationId: number, format: string = 'pdf') =>
       api.get(`/labels/preview/${locationId}`, { params: { format } }),
     
-    listPrinters: () =>
-      api.get('/labels/printers'),
+    batch: (request: { whs: string; scope: any; format?: string; sendToPrinter?: boolean }) =>
+      api.post('/labels/batch', request, { responseType: request.sendToPrinter ? 'json' : 'blob' }),
+    
+    listPrinters: (refresh: boolean = false) =>
+      api.get('/labels/printers', { params: { refresh } }),
+    
+    jobs: (params?: { status?: string; limit?: number }) =>
+      api.get('/labels/jobs', { params }),
+    
+    job: (jobId: number) =>
+      api.get(`/labels/jobs/${jobId}`),
+    
+    retryJob: (jobId: number) =>
+      api.post(`/labels/jobs/${jobId}/retry`),
+    
+    templates: (params?: { whs?: string; labelType?: string; includeInactive?: boolean }) =>
+      api.get('/labels/templates', { params }),
+    
+    createTemplate: (request: { name: string; body: string; whs?: string; labelType?: string }) =>
+      api.post('/labels/templates', request),
+    
+    deactivateTemplate: (templateId: number) =>
+      api.delete(`/labels/templates/${templateId}`),
   },
 
   picking: {
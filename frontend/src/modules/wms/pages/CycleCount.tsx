@@ -22,6 +22,7 @@ const CycleCount: React.FC = () => {
   const [selectedLocations, setSelectedLocations] = useState<any[]>([]);
   const [selectedSession, setSelectedSession] = useState<any>(null);
   const [countEntries, setCountEntries] = useState<{ [key: number]: number }>({});
+  const [selectedTask, setSelectedTask] = useState<any>(null);
 
   const { data: locations } = useQuery(
     ['locations', selectedWarehouse],
@@ -44,8 +45,8 @@ const CycleCount: React.FC = () => {
   );
 
   const { data: sessionDetails } = useQuery(
-    ['count-session-details', selectedSession?.id],
-    () => wmsApi.counts.getDetails(selectedSession.id),
+    ['count-session-details', selectedSession?.id, selectedTask?.id],
+    () => wmsApi.counts.getDetails(selectedSession.id, selectedTask?.id),
     {
       enabled: !!selectedSession,
       onError: (error: any) => {
@@ -54,6 +55,42 @@ const CycleCount: React.FC = () => {
     }
   );
 
+  // Progress comes from per-task counters, so polling it does not re-read the details.
+  const { data: sessionProgress } = useQuery(
+    ['count-session-progress', selectedSession?.id],
+    () => wmsApi.counts.getProgress(selectedSession.id),
+    {
+      enabled: !!selectedSession,
+      refetchInterval: selectedSession?.status === 'OPEN' ? 5000 : false,
+    }
+  );
+
+  const { data: sessionTasks, refetch: refetchTasks } = useQuery(
+    ['count-session-tasks', selectedSession?.id],
+    () => wmsApi.counts.getTasks(selectedSession.id),
+    {
+      enabled: !!selectedSession,
+    }
+  );
+
+  const claimTaskMutation = useMutation(
+    (data: { sessionId: number; taskId: number }) =>
+      wmsApi.counts.claimTask(data.sessionId, data.taskId),
+    {
+      onSuccess: (response: any) => {
+        if (!response.data?.ok) {
+          setError(response.data?.error?.message || 'Error al tomar la tarea');
+          return;
+        }
+        clearError();
+        refetchTasks();
+      },
+      onError: (error: any) => {
+        setError(error.response?.data?.message || 'Error al tomar la tarea');
+      },
+    }
+  );
+
   const createSessionMutation = useMutation(
     (data: { whs: string; scope: any }) => wmsApi.counts.create(data),
     {
@@ -77,6 +114,8 @@ const CycleCount: React.FC = () => {
         clearError();
         alert('Conteos ingresados exitosamente');
         queryClient.invalidateQueries(['count-session-details', selectedSession?.id]);
+        queryClient.invalidateQueries(['count-session-progress', selectedSession?.id]);
+        refetchTasks();
       },
       onError: (error: any) => {
         setError(error.response?.data?.message || 'Error al ingresar conteos');
@@ -252,7 +291,10 @@ const CycleCount: React.FC = () => {
                   }}
                   pageSizeOptions={[5, 10]}
                   disableRowSelectionOnClick
-                  onRowClick={(params) => setSelectedSession(params.row)}
+                  onRowClick={(params) => {
+                    setSelectedSession(params.row);
+                    setSelectedTask(null);
+                  }}
                 />
               </Box>
             </CardContent>
@@ -271,6 +313,37 @@ const CycleCount: React.FC = () => {
                   <Typography variant="body1">
                     Estado: <Chip label={selectedSession.status === 'OPEN' ? 'ABIERTO' : selectedSession.status === 'CLOSED' ? 'CERRADO' : 'APLICADO'} size="small" />
                   </Typography>
+                  {sessionProgress?.data?.data && (
+                    <Typography variant="body2" sx={{ mt: 1 }}>
+                      Contados: {sessionProgress.data.data.counted_lines} / {sessionProgress.data.data.total_lines}
+                      {' '}({sessionProgress.data.data.percent_counted}%) · Diferencias: {sessionProgress.data.data.variance_lines}
+                      {' '}· Tareas terminadas: {sessionProgress.data.data.tasks_done} / {sessionProgress.data.data.tasks}
+                    </Typography>
+                  )}
+                </Box>
+                
+                <Box sx={{ display: 'flex', gap: 2, alignItems: 'center' }}>
+                  <Autocomplete
+                    sx={{ minWidth: 300 }}
+                    options={sessionTasks?.data?.data || []}
+                    getOptionLabel={(task: any) =>
+                      `${task.name} (${task.counted_lines}/${task.total_lines})${task.assigned_to ? ` - ${task.assigned_to}` : ''}`
+                    }
+                    value={selectedTask}
+                    onChange={(_, newValue) => setSelectedTask(newValue)}
+                    renderInput={(params) => (
+                      <TextField {...params} label="Tarea (todas si vacío)" size="small" />
+                    )}
+                  />
+                  {selectedTask && selectedSession.status === 'OPEN' && (
+                    <Button
+                      variant="outlined"
+                      onClick={() => claimTaskMutation.mutate({ sessionId: selectedSession.id, taskId: selectedTask.id })}
+                      disabled={claimTaskMutation.isLoading}
+                    >
+                      Tomar Tarea
+                    </Button>
+                  )}
                 </Box>
                 
                 <Box sx={{ height: 400, mt: 2 }}>